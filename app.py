@@ -1,45 +1,234 @@
-from flask import Flask, jsonify, render_template
-from calibration_right import update_right_angle
-from calibration_left import update_left_angle
-from drum_collision import drum_collision
+from flask import Blueprint, Flask, Response, g, jsonify, render_template, request
+import subprocess
 import threading
+import json
+import time
+import sys
+import os
 
-# I2C 總線鎖，防止左右手感測器同時讀取造成衝突
-i2c_lock = threading.Lock()
+from metrics import histogram, render as render_metrics, timer
 
-app = Flask(__name__,
-            static_folder='static',
-            static_url_path='/static')
+# 背景採樣頻率（Hz），可用環境變數 DRUM_SAMPLE_RATE 調整
+SAMPLE_RATE = int(os.environ.get("DRUM_SAMPLE_RATE", 200))
 
+# 鼓棒通道（/right_data、/left_data 與 /stream 的左右手）
+STICK_CHANNELS = ("right", "left")
 
+# import app 的時間上限（秒），用 python app.py --check-import-time 檢查
+IMPORT_TIME_BUDGET = 0.5
 
-@app.route("/")
-def index():
-    return render_template("index.html")
+bp = Blueprint("drum", __name__)
 
-@app.route("/3d")
-def index_3d():
-    return render_template("index_3d.html")
 
-@app.route("/right_data")
-def right_data():
-    with i2c_lock:
-        roll, pitch, yaw, ax, ay, az, gx, gy, gz = update_right_angle()
+class Components:
+    """
+    感測器採樣器、碰撞偵測與敲擊事件引擎
+
+    import app 時不會建立，第一次需要時才開啟 I2C、解析 3d_settings.js，
+    因此在沒有 I2C 的機器上也能 import，worker fork 也不會複製已開啟的匯流排。
+    """
+
+    def __init__(self):
+        from sensor_channel import channels
+        from drum_collision import get_detector
+        from sensor_sampler import SensorSampler
+        from hit_detector import HitDetector
+
+        self.channels = channels()
+        self.drum_collision = get_detector()
+
+        # 背景採樣器：固定頻率讀取所有已登記的感測器通道，HTTP 請求只讀記憶體
+        # 同一條 I2C 總線的通道共用總線鎖依序讀取，不同總線平行讀取
+        # 感測器在採樣執行緒第一次讀取時才開啟（見 SensorChannel.get_sensor）
+        self.sampler = SensorSampler(
+            {channel.name: channel.update for channel in self.channels},
+            rate_hz=SAMPLE_RATE,
+            locks={channel.name: channel.lock for channel in self.channels},
+            buses={channel.name: channel.bus for channel in self.channels},
+        )
+
+        # 敲擊事件引擎：在採樣執行緒中處理每個樣本，產生去抖動後的敲擊事件
+        # 只處理左右手鼓棒（其他通道如踏板不經過鼓棒的碰撞計算）
+        # DRUM_CLASSIFIER 指定模型時，以訓練好的分類器判斷鼓（見 drum_classifier.py）
+        # hit_thresholds.json 有調整過的門檻時，每隻手使用各自的門檻（見 threshold_tuner.py）
+        from drum_classifier import load_classifier
+        from threshold_tuner import load_thresholds
+        thresholds = load_thresholds()
+        for hand, (gyro, accel) in thresholds.items():
+            print(f"[HitDetector] {hand} 門檻 |gy| > {gyro:g}, |ax|/|az| > {accel:g}（hit_thresholds.json）")
+        self.hit_detector = HitDetector(self.drum_collision, hands=STICK_CHANNELS,
+                                        classifier=load_classifier(), thresholds=thresholds)
+        self.sampler.add_listener(self.hit_detector.process)
+
+        # 伺服器端音效（DRUM_AUDIO 設定時才啟用）：敲擊事件直接觸發混音器
+        from audio_engine import create_audio
+        self.audio_engine, self.audio_sink = create_audio() or (None, None)
+        if self.audio_engine is not None:
+            self.hit_detector.add_listener(self.audio_engine.on_hit)
+
+        # DRUM_PREDICT 設定時，由 pitch 角速度預測撞擊時間，扣掉輸出延遲後提前發出事件（見 hit_predictor.py）
+        from hit_predictor import create_predictor
+        self.hit_detector.predictor = create_predictor(
+            self.drum_collision,
+            (lambda: self.audio_engine.output_latency) if self.audio_engine is not None else None)
+
+        # /stream 的發布/訂閱中心：生產者執行緒每輪採樣只計算、編碼一次，
+        # 所有分頁共用同一份 bytes；敲擊事件也只編碼一次
+        from stream_hub import StreamHub
+        self.stream_hub = StreamHub(self._produce_stream_frame)
+        # /stream.bin：每種欄位組合一個 StreamHub，同一輪的幀資料由各 hub 共用（見 stream_frame）
+        self.binary_hubs = {}
+        self._binary_hubs_lock = threading.Lock()
+        self._frame_lock = threading.Lock()
+        self._frame_cache = (-1, None)
+        self._drum_names = (None, ())
+        self.hit_detector.add_listener(self._publish_hit)
+
+        # DRUM_MIDI 設定時把敲擊事件寫成 MIDI 檔（邊敲邊寫，長時間錄製也不佔記憶體）
+        from midi_writer import create_midi_writer
+        self.midi_writer = create_midi_writer()
+        if self.midi_writer is not None:
+            self.hit_detector.add_listener(self.midi_writer.on_hit)
+        self._register_metrics()
+
+    def stream_frame(self, tick):
+        """指定採樣輪次的左右手合併幀 dict（同一輪只計算一次，JSON 與二進位串流共用）"""
+        with self._frame_lock:
+            cached_tick, frame = self._frame_cache
+            if cached_tick != tick:
+                frame = build_stream_frame(self.sampler)
+                self._frame_cache = (tick, frame)
+            return frame
+
+    def drum_names(self):
+        """目前的鼓名稱表（3d_settings.js 重新載入後才會換成新的 tuple）"""
+        drums = self.drum_collision.drums
+        cached_drums, names = self._drum_names
+        if drums is not cached_drums:
+            names = tuple(drum["name"] for drum in drums)
+            self._drum_names = (drums, names)
+        return names
+
+    def _produce_stream_frame(self, last_tick):
+        tick = self.sampler.wait_for_tick(last_tick)
+        if tick == last_tick:
+            return tick, None
+        frame = self.stream_frame(tick)
+        with timer("drum_stage_seconds", stage="encode", channel="stream"):
+            return tick, ("data: " + json.dumps(frame, ensure_ascii=False) + "\n\n").encode("utf-8")
+
+    def binary_hub(self, fields):
+        """取得（必要時建立）指定欄位組合的二進位串流 hub"""
+        hub = self.binary_hubs.get(fields)
+        if hub is None:
+            with self._binary_hubs_lock:
+                hub = self.binary_hubs.get(fields)
+                if hub is None:
+                    hub = self.binary_hubs[fields] = self._create_binary_hub(fields)
+        return hub
+
+    def _create_binary_hub(self, fields):
+        from stream_hub import StreamHub
+        from wire_format import WireEncoder, frame_message
+
+        encoder = WireEncoder(fields, STICK_CHANNELS)
+        encode_histogram = histogram("drum_stage_seconds", stage="encode", channel="binary")
+
+        def produce(last_tick):
+            tick = self.sampler.wait_for_tick(last_tick)
+            if tick == last_tick:
+                return tick, None
+            frame = self.stream_frame(tick)
+            with encode_histogram.time():
+                return tick, frame_message(encoder.encode_frame(frame, self.drum_names()))
+
+        return StreamHub(produce, name="binary:" + ",".join(fields))
+
+    def _publish_hit(self, event):
+        self.stream_hub.publish_event(("event: hit\ndata: " + json.dumps(event) + "\n\n").encode("utf-8"))
+        hubs = list(self.binary_hubs.values())
+        if hubs:
+            from wire_format import WireEncoder, frame_message
+
+            # 敲擊訊息與欄位選擇無關，編碼一次後發布到所有二進位 hub
+            payload = frame_message(WireEncoder((), STICK_CHANNELS).encode_hit(event, self.drum_names()))
+            for hub in hubs:
+                hub.publish_event(payload)
+
+    def _register_metrics(self):
+        """/metrics 的量表：輸出時才讀取各元件現有的統計值，不增加採樣成本"""
+        from metrics import gauge
 
-    # 閥值靈敏度在這邊調整
-    # 根據數據分析調整閾值：|gy| > 50 更容易觸發
-    is_downward_swing = abs(gy) > 50  # Y軸角速度絕對值，向下揮動
-    has_acceleration = abs(az) > 0.5 or abs(ax) > 0.5  # 任意方向加速度
+        for scheduler in self.sampler.schedulers:
+            bus = scheduler.bus
+            gauge("drum_bus_utilization_ratio", lambda s=scheduler: s.stats()["utilization"], bus=bus)
+            gauge("drum_sampler_overrun_total", lambda s=scheduler: s.overrun_count, bus=bus)
+            gauge("drum_sampler_late_slots_total", lambda s=scheduler: s.late_slot_count, bus=bus)
+            gauge("drum_read_errors_total", lambda s=scheduler: s.error_count, bus=bus)
+            for name, _ in scheduler.readers:
+                gauge("drum_sample_rate_hz", lambda s=scheduler, n=name: s.stats()["rates"][n], channel=name)
+        if self.audio_engine is not None:
+            gauge("drum_audio_voices", lambda: self.audio_engine.active_voices)
+            gauge("drum_audio_stolen_voices_total", lambda: self.audio_engine.stolen_count)
+        gauge("drum_stream_subscribers", lambda: self.stream_hub.subscriber_count)
+        for channel in self.channels:
+            gauge("drum_fifo_overflow_total",
+                  lambda c=channel: getattr(c.sensor, "overflow_count", 0), channel=channel.name)
 
-    # 綜合判斷為敲擊（降低門檻，更容易觸發）
-    is_hit = is_downward_swing and has_acceleration
+
+_components = None
+_components_lock = threading.Lock()
+
+
+def get_components():
+    """取得（必要時建立）全域的 Components"""
+    global _components
+    if _components is None:
+        with _components_lock:
+            if _components is None:
+                _components = Components()
+    return _components
+
+
+def start_background():
+    """啟動背景工作：感測器採樣、3d_settings.js 熱重載與伺服器端音效（重複呼叫不會重複啟動）"""
+    components = get_components()
+    components.sampler.start()
+    components.drum_collision.start_watching()
+    if components.audio_sink is not None:
+        components.audio_sink.start()
+    return components
+
+
+def get_hand_data(hand, sample=None):
+    """
+    從採樣器取得樣本，計算敲擊與碰撞結果
+
+    參數說明：
+    - sample: 指定的樣本（例如 sampler.aligned() 對齊後的樣本）；None 時取最新樣本
+    """
+    from hit_detector import is_hit_sample
+
+    # 第一次請求時才啟動採樣器（debug reloader 的父行程不會讀取感測器）
+    components = start_background()
+    if sample is None:
+        # 感測器仍在初始化時不久等，先回傳零值
+        sample = components.sampler.wait_for_sample(hand, timeout=0.2)
+    if sample is None:
+        sample = (0,) + (0.0,) * 9
+    timestamp, roll, pitch, yaw, ax, ay, az, gx, gy, gz = sample
+
+    # 電平式敲擊判斷（預設閥值在 hit_detector.py，各手調整後的門檻在 hit_thresholds.json）
+    # 去抖動後的敲擊事件請使用 /stream 的 hit 事件或 /hits
+    is_hit = is_hit_sample(ax, az, gy, *components.hit_detector.thresholds_for(hand))
 
     # 偵測打擊到哪個鼓，並取得調整後的 pitch（傳入 ax 加速度）
-    collision_info = drum_collision.detect_hit_drum(ax, pitch, yaw, hand="right")
+    with timer("drum_stage_seconds", stage="collision", channel=hand):
+        collision_info = components.drum_collision.detect_hit_drum(ax, pitch, yaw, hand=hand)
     hit_drum = collision_info["drum_name"]
     adjusted_pitch = collision_info["adjusted_pitch"]
 
-    return jsonify({
+    return {
         "roll (x軸轉)": roll,
         "pitch (y軸轉)": pitch,
         "yaw (z軸轉)": yaw,
@@ -51,38 +240,203 @@ def right_data():
         "gz": gz,
         "is_hit": is_hit,
         "hit_drum": hit_drum,
-        "adjusted_pitch": adjusted_pitch
-    })
+        "adjusted_pitch": adjusted_pitch,
+        "timestamp": timestamp
+    }
 
-@app.route("/left_data")
-def left_data():
-    with i2c_lock:
-        roll, pitch, yaw, ax, ay, az, gx, gy, gz = update_left_angle()
 
+def build_stream_frame(sampler):
+    """最新一輪的左右手合併幀 {"right": ..., "left": ...}（由 StreamHub 的生產者執行緒呼叫）"""
+    # 左右手在不同時槽讀取，先內插到同一時間點再組成一幀
+    samples = sampler.aligned(STICK_CHANNELS)
+    return {hand: get_hand_data(hand, samples[hand]) for hand in STICK_CHANNELS}
+
+
+def _wait_for_chunks(subscription):
+    """預設的串流等待方式：在請求執行緒中阻塞等待（最多 1 秒）"""
+    return subscription.receive(timeout=1.0)
+
+
+# /stream 與 /stream.bin 等待新資料的函數；server.py（eventlet）換成不阻塞事件迴圈的版本
+_stream_waiter = _wait_for_chunks
+
+
+def set_stream_waiter(waiter):
+    """
+    替換串流等待函數
+
+    參數說明：
+    - waiter: waiter(subscription) → chunks 列表（逾時為空列表）
+    """
+    global _stream_waiter
+    _stream_waiter = waiter
+
+
+def _parse_wire_fields():
+    """?fields=pitch,yaw,hit → 欄位 tuple；格式錯誤時返回 (None, 400 回應)"""
+    from wire_format import parse_fields
+
+    try:
+        return parse_fields(request.args.get("fields")), None
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+
+
+@bp.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter_ns()
+
+@bp.after_request
+def _record_request_time(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        histogram("drum_http_request_seconds", endpoint=request.endpoint).observe(
+            (time.perf_counter_ns() - start) * 1e-9)
+    return response
+
+
+def _json_response(data):
+    with timer("drum_stage_seconds", stage="encode", channel="json"):
+        return jsonify(data)
+
+
+@bp.route("/")
+def index():
+    return render_template("index.html")
+
+@bp.route("/3d")
+def index_3d():
+    return render_template("index_3d.html")
+
+@bp.route("/right_data")
+def right_data():
+    return _json_response(get_hand_data("right"))
+
+@bp.route("/left_data")
+def left_data():
     # 左手敲擊偵測（同樣的邏輯）
-    is_downward_swing = abs(gy) > 50  # Y軸角速度絕對值
-    has_acceleration = abs(az) > 0.5 or abs(ax) > 0.5  # 任意方向加速度
-    is_hit = is_downward_swing and has_acceleration
+    return _json_response(get_hand_data("left"))
 
-    # 偵測打擊到哪個鼓，並取得調整後的 pitch（傳入 ax 加速度）
-    collision_info = drum_collision.detect_hit_drum(ax, pitch, yaw, hand="left")
-    hit_drum = collision_info["drum_name"]
-    adjusted_pitch = collision_info["adjusted_pitch"]
+@bp.route("/stream")
+def stream():
+    """
+    Server-Sent Events：每輪採樣推送一次左右手合併數據，敲擊事件以 hit 事件送出
 
-    return jsonify({
-        "roll (x軸轉)": roll,
-        "pitch (y軸轉)": pitch,
-        "yaw (z軸轉)": yaw,
-        "ax": ax,
-        "ay": ay,
-        "az": az,
-        "gx": gx,
-        "gy": gy,
-        "gz": gz,
-        "is_hit": is_hit,
-        "hit_drum": hit_drum,
-        "adjusted_pitch": adjusted_pitch
-    })
+    所有連線訂閱同一個 StreamHub；連線跟不上時直接跳到最新一幀
+    """
+    hub = start_background().stream_hub
+
+    def generate():
+        with hub.subscribe() as subscription:
+            while True:
+                chunks = _stream_waiter(subscription)
+                # 逾時仍無新數據，送出註解保持連線
+                yield b"".join(chunks) if chunks else b": keep-alive\n\n"
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route("/wire_format")
+def wire_format():
+    """二進位格式的欄位排列與鼓名稱表（解碼用，見 static/js/wire_format.js）"""
+    from wire_format import describe
+
+    return jsonify(describe(start_background().drum_names(), STICK_CHANNELS))
+
+@bp.route("/frame.bin")
+def frame_bin():
+    """二進位格式的最新左右手幀（輪詢用），?fields= 選擇欄位"""
+    from wire_format import WireEncoder
+
+    fields, error = _parse_wire_fields()
+    if error:
+        return error
+    components = start_background()
+    frame = {hand: get_hand_data(hand) for hand in STICK_CHANNELS}
+    payload = WireEncoder(fields, STICK_CHANNELS).encode_frame(frame, components.drum_names())
+    return Response(payload, mimetype="application/octet-stream")
+
+@bp.route("/stream.bin")
+def stream_bin():
+    """
+    二進位串流：每則訊息前加上 uint16 長度（幀或敲擊事件），長度 0 為保持連線
+
+    ?fields=pitch,yaw,hit 只傳送需要的欄位；相同欄位組合的連線共用同一個 StreamHub
+    """
+    from wire_format import LENGTH
+
+    fields, error = _parse_wire_fields()
+    if error:
+        return error
+    hub = start_background().binary_hub(fields)
+    keep_alive = LENGTH.pack(0)
+
+    def generate():
+        with hub.subscribe() as subscription:
+            while True:
+                chunks = _stream_waiter(subscription)
+                yield b"".join(chunks) if chunks else keep_alive
+
+    return Response(generate(), mimetype="application/octet-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.route("/hits")
+def hits():
+    """取得序號大於 since 的敲擊事件（輪詢用）"""
+    hit_detector = start_background().hit_detector
+    since = request.args.get("since", 0, type=int)
+    return jsonify({"last_seq": hit_detector.last_seq,
+                    "events": hit_detector.events_since(since)})
+
+@bp.route("/bus_stats")
+def bus_stats():
+    """各 I2C 總線的佔用率與各感測器實際採樣率"""
+    return jsonify(start_background().sampler.bus_stats())
+
+@bp.route("/metrics")
+def metrics():
+    """Prometheus 文字格式的效能指標（各階段延遲直方圖、採樣率、鎖競爭、遺失樣本）"""
+    start_background()
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def create_app(start_sensors=False):
+    """
+    建立 Flask app
+
+    參數說明：
+    - start_sensors: True 時在背景執行緒初始化感測器並開始採樣，
+      伺服器不必等待 I2C 就能立即提供頁面
+    """
+    app = Flask(__name__,
+                static_folder='static',
+                static_url_path='/static')
+    app.register_blueprint(bp)
+    if start_sensors:
+        threading.Thread(target=start_background, name="StartBackground", daemon=True).start()
+    return app
+
+
+def measure_import_time():
+    """在全新的直譯器中量測 import app 的時間（秒）"""
+    code = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(output.decode().strip().splitlines()[-1])
+
+
+# 不會開啟感測器，可安全 import（flask run / WSGI 伺服器使用）
+app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    if "--check-import-time" in sys.argv:
+        elapsed = measure_import_time()
+        status = "OK" if elapsed <= IMPORT_TIME_BUDGET else "超出預算"
+        print(f"import app: {elapsed * 1000:.1f} ms（預算 {IMPORT_TIME_BUDGET * 1000:.0f} ms）{status}")
+        sys.exit(0 if elapsed <= IMPORT_TIME_BUDGET else 1)
+
+    # 開發用伺服器；正式環境請使用 python server.py（eventlet）
+    # debug reloader 的父行程只負責監看檔案，不初始化感測器
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        threading.Thread(target=start_background, name="StartBackground", daemon=True).start()
+    app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
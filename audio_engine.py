@@ -0,0 +1,411 @@
+"""
+伺服器端音效引擎：敲擊事件直接在樹莓派上發聲，不經過網路與瀏覽器的音訊延遲
+
+啟動時把 3d_settings.js 的 SOUND_FILES 全部載入為 NumPy 緩衝區（統一取樣率與聲道），
+輸出端每次要一個固定大小的區塊，引擎把所有正在播放的聲部混音後交出。
+
+以環境變數 DRUM_AUDIO 啟用（預設關閉，仍由瀏覽器發聲）：
+    DRUM_AUDIO=device python app.py          # 音效卡（需要 pip install sounddevice）
+    DRUM_AUDIO=wav:hits.wav python app.py    # 寫入 WAV 檔
+    DRUM_AUDIO=null python app.py            # 只混音不輸出（量測延遲用）
+    DRUM_AUDIO_BLOCK=64                      # 區塊大小（frames），越小延遲越低、CPU 越高
+
+用法：
+    python audio_engine.py --block 128 --out demo.wav   # 以固定節奏觸發並輸出延遲統計
+"""
+import argparse
+import atexit
+import os
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+from drum_config import parse_constants, parse_sound_files
+from metrics import histogram
+
+SAMPLE_RATE = 48000
+BLOCK_SIZE = 128            # 每個區塊的 frames（48 kHz 下約 2.7 ms）
+CHANNELS = 2
+MAX_VOICES = 16             # 同時發聲上限，超過時搶佔最舊的聲部
+MASTER_GAIN = 0.8           # 與 drum_3d.js 的 gainNode 相同（0.8 * velocity）
+FADE_OUT = 0.005            # 截斷音效時的淡出長度（秒），避免爆音
+DEFAULT_SOUND_DURATION = 0.3
+
+# 不受 DRUM_SOUND_DURATION 截斷的音效（與 drum_3d.js 相同）
+FULL_LENGTH_SOUNDS = ("Success",)
+
+AUDIO_ENV = "DRUM_AUDIO"
+AUDIO_BLOCK_ENV = "DRUM_AUDIO_BLOCK"
+
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_PATH = os.path.join(STATIC_ROOT, "static", "js", "3d_settings.js")
+
+
+def load_wav(path, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    讀取 PCM WAV（8/16/24/32 bit）並轉為指定取樣率與聲道
+
+    返回：
+    shape (frames, channels) 的 float32 陣列，範圍 -1 ~ 1
+    """
+    with wave.open(path, "rb") as f:
+        width = f.getsampwidth()
+        source_channels = f.getnchannels()
+        source_rate = f.getframerate()
+        raw = f.readframes(f.getnframes())
+
+    if width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        # 24 bit：補上最低位元組後當作 int32 讀取（保留正負號）
+        padded = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        data = padded.view("<i4").ravel().astype(np.float32) / 2 ** 31
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[width]
+        data = np.frombuffer(raw, dtype=dtype).astype(np.float32) / 2 ** (8 * width - 1)
+    data = data.reshape(-1, source_channels)
+
+    if source_channels != channels:
+        data = np.repeat(data.mean(axis=1, keepdims=True), channels, axis=1)
+
+    if source_rate != sample_rate and len(data):
+        # 線性內插重新取樣（鼓聲的高頻損失可忽略）
+        frames = int(round(len(data) * sample_rate / source_rate))
+        positions = np.arange(frames) * (source_rate / sample_rate)
+        source = np.arange(len(data))
+        data = np.stack([np.interp(positions, source, data[:, c]) for c in range(channels)], axis=1)
+
+    return np.ascontiguousarray(data, dtype=np.float32)
+
+
+def load_kit(settings_path=SETTINGS_PATH, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    依 3d_settings.js 的 SOUND_FILES 載入整組音效
+
+    鼓聲截斷為 DRUM_SOUND_DURATION 並在結尾淡出（載入時處理，播放時不需額外計算）
+
+    返回：
+    {鼓名稱: 緩衝區}
+    """
+    with open(settings_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    duration = parse_constants(content).get("DRUM_SOUND_DURATION", DEFAULT_SOUND_DURATION)
+    fade = int(FADE_OUT * sample_rate)
+
+    kit = {}
+    for name, url in parse_sound_files(content).items():
+        path = os.path.join(STATIC_ROOT, *url.strip("/").split("/"))
+        try:
+            buffer = load_wav(path, sample_rate, channels)
+        except (OSError, EOFError, KeyError, wave.Error) as e:
+            print(f"[AudioEngine] 無法載入 {name}: {e}")
+            continue
+        if name not in FULL_LENGTH_SOUNDS:
+            length = int(duration * sample_rate)
+            if len(buffer) > length:
+                buffer = buffer[:length].copy()
+                buffer[-fade:] *= np.linspace(1.0, 0.0, fade, dtype=np.float32)[:, None]
+        kit[name] = buffer
+    return kit
+
+
+class _Voice:
+    __slots__ = ("buffer", "position", "gain", "timestamp")
+
+    def __init__(self, buffer, gain, timestamp):
+        self.buffer = buffer
+        self.position = 0
+        self.gain = gain
+        self.timestamp = timestamp
+
+
+class AudioEngine:
+    """
+    固定區塊的多聲部混音器
+
+    參數說明：
+    - kit: {鼓名稱: 緩衝區}（load_kit() 的結果）
+    - block_size: 每次 render() 輸出的 frames
+    - max_voices: 同時發聲上限
+    """
+
+    def __init__(self, kit, sample_rate=SAMPLE_RATE, block_size=BLOCK_SIZE,
+                 channels=CHANNELS, max_voices=MAX_VOICES):
+        self.kit = kit
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.channels = channels
+        self.max_voices = max_voices
+        self.output_latency = block_size / sample_rate   # 由輸出端更新為實際的緩衝延遲
+
+        self._pending = deque()      # trigger() 放入、render() 取出（deque 的 append / popleft 為執行緒安全）
+        self._voices = []
+        self._mix = np.zeros((block_size, channels), dtype=np.float32)
+
+        self.trigger_count = 0
+        self.stolen_count = 0
+        self.unknown_count = 0
+        self._latency = histogram("drum_audio_latency_seconds")
+
+    def trigger(self, name, velocity=1.0, timestamp=None):
+        """
+        觸發一個音效（可在任何執行緒呼叫），下一個區塊開始發聲
+
+        參數說明：
+        - timestamp: 敲擊發生的時間（time.monotonic_ns()），用於量測敲擊到發聲的延遲；
+          預測的敲擊（未來的時間）會等到「timestamp - output_latency」才開始發聲，聲音剛好在撞擊時輸出
+        """
+        if name is None:
+            return  # 沒有打到鼓
+        buffer = self.kit.get(name)
+        if buffer is None:
+            self.unknown_count += 1
+            return
+        gain = MASTER_GAIN * max(0.0, min(1.0, velocity))
+        self._pending.append(_Voice(buffer, gain, time.monotonic_ns() if timestamp is None else timestamp))
+        self.trigger_count += 1
+
+    def on_hit(self, event):
+        """HitDetector 的 listener：敲擊事件直接觸發音效"""
+        self.trigger(event["drum"], event["velocity"], event["timestamp"])
+
+    @property
+    def active_voices(self):
+        return len(self._voices)
+
+    def render(self):
+        """
+        混音一個區塊
+
+        返回：
+        shape (block_size, channels) 的 float32 陣列（內部緩衝區，下一次 render 會覆寫）
+        """
+        now = time.monotonic_ns()
+        start_before = now + int(self.output_latency * 1e9)
+        scheduled = []
+        while self._pending:
+            voice = self._pending.popleft()
+            if voice.timestamp > start_before:
+                scheduled.append(voice)   # 預測的敲擊：還沒到開始發聲的時間
+                continue
+            if len(self._voices) >= self.max_voices:
+                # 搶佔播放最久的聲部（剩餘音量最小）
+                oldest = max(self._voices, key=lambda v: v.position)
+                self._voices.remove(oldest)
+                self.stolen_count += 1
+            self._voices.append(voice)
+            # 敲擊 → 此區塊送進輸出緩衝 → 經過輸出延遲後實際發聲
+            self._latency.observe((now - voice.timestamp) * 1e-9 + self.output_latency)
+        self._pending.extend(scheduled)
+
+        mix = self._mix
+        mix.fill(0.0)
+        frames = self.block_size
+        finished = False
+        for voice in self._voices:
+            chunk = voice.buffer[voice.position:voice.position + frames]
+            n = len(chunk)
+            mix[:n] += chunk * voice.gain
+            voice.position += n
+            if voice.position >= len(voice.buffer):
+                finished = True
+        if finished:
+            self._voices = [v for v in self._voices if v.position < len(v.buffer)]
+
+        np.clip(mix, -1.0, 1.0, out=mix)
+        return mix
+
+    def latency_stats(self):
+        """敲擊到發聲延遲（秒）的分位數估計"""
+        return {
+            "count": self._latency.count,
+            "mean": self._latency.sum / self._latency.count if self._latency.count else 0.0,
+            "p50": self._latency.quantile(0.5),
+            "p99": self._latency.quantile(0.99),
+        }
+
+
+class _ThreadSink:
+    """以單調時鐘在背景執行緒中按區塊節奏呼叫 render()"""
+
+    def __init__(self, engine, realtime=True):
+        self.engine = engine
+        self.realtime = realtime
+        self.block_count = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.close()
+
+    def write(self, block):
+        pass
+
+    def close(self):
+        pass
+
+    def _run(self):
+        period = self.engine.block_size / self.engine.sample_rate
+        next_deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            self.write(self.engine.render())
+            self.block_count += 1
+            if not self.realtime:
+                continue
+            next_deadline += period
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                next_deadline = time.monotonic()
+
+
+class NullSink(_ThreadSink):
+    """只混音不輸出（量測延遲與 CPU 成本用）"""
+
+
+class WavSink(_ThreadSink):
+    """把混音結果寫入 16 bit WAV 檔"""
+
+    def __init__(self, engine, path, realtime=True):
+        super().__init__(engine, realtime)
+        self.path = path
+        self._file = wave.open(path, "wb")
+        self._file.setnchannels(engine.channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(engine.sample_rate)
+        self._lock = threading.Lock()
+        # 伺服器結束時補寫 WAV header 的長度
+        atexit.register(self.close)
+
+    def write(self, block):
+        with self._lock:
+            if self._file is not None:
+                self._file.writeframes((block * 32767).astype("<i2").tobytes())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class DeviceSink:
+    """
+    音效卡輸出（sounddevice 的 callback 直接呼叫 render()）
+
+    參數說明：
+    - device: sounddevice 的裝置名稱或編號（None 為預設裝置）
+    - latency: "low"、"high" 或秒數
+    """
+
+    def __init__(self, engine, device=None, latency="low"):
+        try:
+            import sounddevice
+        except ImportError as e:
+            raise RuntimeError("需要安裝 sounddevice（pip install sounddevice）") from e
+        self.engine = engine
+        self.underflow_count = 0
+        self._stream = sounddevice.OutputStream(
+            samplerate=engine.sample_rate, blocksize=engine.block_size,
+            channels=engine.channels, dtype="float32", device=device,
+            latency=latency, callback=self._callback)
+        engine.output_latency = self._stream.latency + engine.block_size / engine.sample_rate
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status.output_underflow:
+            self.underflow_count += 1
+        outdata[:] = self.engine.render()
+
+    def start(self):
+        if not self._stream.active:
+            self._stream.start()
+
+    def stop(self, timeout=1.0):
+        self._stream.stop()
+        self._stream.close()
+
+
+def create_audio(spec=None, block_size=None):
+    """
+    依設定建立 (engine, sink)
+
+    參數說明：
+    - spec: "device"、"null"、"wav:<路徑>"；None 時讀取環境變數 DRUM_AUDIO（未設定則返回 None）
+    - block_size: None 時讀取環境變數 DRUM_AUDIO_BLOCK
+    """
+    spec = spec if spec is not None else os.environ.get(AUDIO_ENV)
+    if not spec:
+        return None
+    block_size = block_size or int(os.environ.get(AUDIO_BLOCK_ENV, BLOCK_SIZE))
+
+    engine = AudioEngine(load_kit(), block_size=block_size)
+    if spec == "device":
+        sink = DeviceSink(engine)
+    elif spec == "null":
+        sink = NullSink(engine)
+    elif spec.startswith("wav:"):
+        sink = WavSink(engine, spec[4:])
+    else:
+        raise ValueError(f"未知的 {AUDIO_ENV} 設定: {spec}（device / null / wav:<路徑>）")
+    print(f"[AudioEngine] {spec}：{len(engine.kit)} 個音效，區塊 {block_size} frames"
+          f"（{block_size / engine.sample_rate * 1000:.1f} ms）")
+    return engine, sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description="伺服器端音效引擎測試：固定節奏觸發並量測延遲")
+    parser.add_argument("--block", type=int, default=BLOCK_SIZE, help="區塊大小（frames）")
+    parser.add_argument("--out", default="null", help="device、null 或輸出的 WAV 路徑")
+    parser.add_argument("--seconds", type=float, default=4.0)
+    args = parser.parse_args()
+
+    spec = args.out if args.out in ("device", "null") else "wav:" + args.out
+    engine, sink = create_audio(spec, args.block)
+    drums = [name for name in engine.kit if name not in FULL_LENGTH_SOUNDS]
+
+    sink.start()
+    start = time.monotonic()
+    hits = 0
+    while time.monotonic() - start < args.seconds:
+        # 16 分音符，120 BPM；交錯觸發同時發聲的多個聲部
+        engine.trigger(drums[hits % len(drums)], velocity=0.5 + 0.5 * (hits % 2))
+        hits += 1
+        time.sleep(0.125)
+    sink.stop()
+    stats = engine.latency_stats()
+    stolen = engine.stolen_count
+
+    # 混音成本：所有聲部同時發聲的最壞情況
+    render_start = time.perf_counter()
+    blocks = 0
+    for _ in range(20):
+        for i in range(engine.max_voices):
+            engine.trigger(drums[i % len(drums)])
+        for _ in range(50):
+            engine.render()
+            blocks += 1
+    render_us = (time.perf_counter() - render_start) / blocks * 1e6
+
+    print(f"觸發 {hits} 次，搶佔 {stolen} 個聲部")
+    print(f"敲擊到發聲延遲: 平均 {stats['mean'] * 1000:.2f} ms，p50 ≤ {stats['p50'] * 1000:.2f} ms，"
+          f"p99 ≤ {stats['p99'] * 1000:.2f} ms")
+    print(f"混音成本（{engine.max_voices} 聲部）: {render_us:.1f} µs / 區塊（區塊長度 {args.block / SAMPLE_RATE * 1e6:.0f} µs）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import threading
+import time
+
+from metrics import counter, histogram
+
+
+class BusScheduler:
+    """
+    I2C 總線排程器：一條總線一個執行緒，以固定時槽輪流讀取該總線上的感測器
+
+    每個週期（1 / rate_hz）平均切成 n 個時槽，第 i 個感測器固定在第 i 個時槽讀取：
+
+        週期:  |  right  |  left   |  right  |  left   | ...
+        時槽:  0         T/2       T         3T/2
+
+    每個感測器的採樣率都是 rate_hz，且左右手之間的時間差固定為 T/n，
+    不會因為另一隻手的讀取或 HTTP 請求而擠在一起。
+
+    參數說明：
+    - bus: 總線名稱（統計與執行緒名稱用）
+    - readers: [(名稱, reader), ...]，reader 回傳 (roll, pitch, yaw, ax, ay, az, gx, gy, gz)
+    - rate_hz: 每個感測器的採樣率
+    - lock: 總線鎖（與其他直接讀取同一總線的程式共用）
+    - publish: publish(名稱, 樣本) 在排程執行緒中呼叫，樣本為 (timestamp_ns, roll, ..., gz)
+    - on_frame: 每完成一個週期呼叫一次（可為 None）
+    """
+
+    def __init__(self, bus, readers, rate_hz, lock, publish, on_frame=None):
+        self.bus = bus
+        self.readers = list(readers)
+        self.rate_hz = float(rate_hz)
+        self.period = 1.0 / self.rate_hz
+        self.slot = self.period / len(self.readers)
+        self.lock = lock
+        self.publish = publish
+        self.on_frame = on_frame
+
+        self.frame_count = 0
+        self.overrun_count = 0      # 整個週期超時、重新對齊的次數
+        self.late_slot_count = 0    # 時槽開始時已經晚於下一個時槽的次數
+        self.error_count = 0
+        self._busy = 0.0            # 累計佔用總線的時間（秒）
+        self._started_at = None
+        self._read_counts = {name: 0 for name, _ in self.readers}
+        self._lock_wait = histogram("drum_bus_lock_wait_seconds", bus=bus)
+        self._contention = counter("drum_bus_lock_contention_total", bus=bus)
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"BusScheduler-{self.bus}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def read_slot(self, index):
+        """
+        讀取第 index 個時槽的感測器並發布樣本
+
+        樣本時間戳為讀取中點的 time.monotonic_ns()（整數奈秒，不受 NTP 調整系統時間影響），
+        左右手的時間差即為時槽間隔
+        """
+        name, reader = self.readers[index]
+        if not self.lock.acquire(False):
+            # 總線被其他程式佔用：記錄等待時間
+            self._contention.inc()
+            with self._lock_wait.time():
+                self.lock.acquire()
+        try:
+            begin = time.monotonic_ns()
+            values = reader()
+            end = time.monotonic_ns()
+        except Exception as e:
+            self.error_count += 1
+            print(f"[BusScheduler] {name} 讀取失敗: {e}")
+            return None
+        finally:
+            self.lock.release()
+
+        self._busy += (end - begin) * 1e-9
+        self._read_counts[name] += 1
+        sample = ((begin + end) // 2,) + tuple(values)
+        self.publish(name, sample)
+        return sample
+
+    def _run(self):
+        # 以單調時鐘排程：時槽 i 的期限 = 週期起點 + i * slot
+        self._started_at = frame_start = time.monotonic()
+        while not self._stop_event.is_set():
+            for index in range(len(self.readers)):
+                delay = frame_start + index * self.slot - time.monotonic()
+                if delay > 0:
+                    if self._stop_event.wait(delay):
+                        return
+                elif -delay > self.slot:
+                    self.late_slot_count += 1
+                self.read_slot(index)
+
+            self.frame_count += 1
+            if self.on_frame is not None:
+                self.on_frame()
+
+            frame_start += self.period
+            if time.monotonic() - frame_start > self.period:
+                # 落後超過一個週期：從現在重新對齊，不補跑錯過的週期
+                self.overrun_count += 1
+                frame_start = time.monotonic()
+
+    def stats(self):
+        """
+        總線統計
+
+        返回：
+        {"utilization": 佔用比例, "rates": {名稱: 實際採樣率}, "frames", "overruns", "late_slots", "errors"}
+        """
+        elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        return {
+            "utilization": self._busy / elapsed if elapsed > 0 else 0.0,
+            "slot_ms": self.slot * 1000,
+            "rates": {name: count / elapsed if elapsed > 0 else 0.0
+                      for name, count in self._read_counts.items()},
+            "frames": self.frame_count,
+            "overruns": self.overrun_count,
+            "late_slots": self.late_slot_count,
+            "errors": self.error_count,
+        }
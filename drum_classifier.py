@@ -0,0 +1,391 @@
+"""
+以錄製數據訓練的鼓分類器：與 DrumCollisionDetector 的幾何判斷並列，不依賴會漂移的 yaw
+
+特徵：每個樣本往前 WINDOW_SECONDS 秒的視窗內，六軸 (ax, ay, az, gx, gy, gz) 的
+平均、標準差、最小、最大值，加上最後一筆的數值（共 30 維），以 z-score 標準化。
+
+模型：
+- "centroid": 最近質心（每個鼓一個中心點，推論只需 7 次距離計算）
+- "knn": k 近鄰：標準化後投影到主成分座標，以 KD-tree 搜尋
+  （30 維下 KD-tree 難以剪枝，因此葉節點較大，讓大部分比較在 NumPy 中完成）
+
+執行時的採樣率與錄製時不同（200 Hz vs 約 15 Hz），推論前先把最近的樣本依時間
+內插回訓練時的週期（classify_samples），視窗涵蓋的時間長度不變。
+
+用法：
+    python drum_classifier.py train drum_sensor_data.json --model knn   # 訓練、評估並存成 drum_classifier.npz
+    python drum_classifier.py bench drum_classifier.npz                  # 每次敲擊的推論延遲
+    DRUM_CLASSIFIER=drum_classifier.npz python app.py                   # 敲擊事件改用分類器判斷鼓
+"""
+import argparse
+import heapq
+import json
+import os
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+CLASSIFIER_ENV = "DRUM_CLASSIFIER"
+DEFAULT_MODEL_PATH = "drum_classifier.npz"
+
+WINDOW_SECONDS = 0.25     # 特徵視窗長度
+TRAIN_RATIO = 0.7         # 每個鼓前 70% 的數據訓練，後 30% 評估
+KNN_K = 5
+LEAF_SIZE = 64
+PCA_DIMS = 30             # 保留的主成分數（降到 12 維時準確率約少 3 個百分點）
+
+
+# ==================== 特徵 ====================
+def window_length(period, seconds=WINDOW_SECONDS):
+    """視窗的樣本數（至少 2 筆）"""
+    return max(2, int(round(seconds / period)) + 1)
+
+
+def window_features(windows):
+    """
+    視窗 → 特徵
+
+    參數說明：
+    - windows: shape (m, 6, w) 的視窗（sliding_window_view 的輸出）
+
+    返回：
+    shape (m, 30) 的特徵
+    """
+    return np.concatenate((
+        windows.mean(axis=2),
+        windows.std(axis=2),
+        windows.min(axis=2),
+        windows.max(axis=2),
+        windows[:, :, -1],
+    ), axis=1)
+
+
+def extract_features(samples, labels, window):
+    """
+    從錄製數據切出所有視窗並計算特徵（視窗不跨越不同鼓的區段）
+
+    參數說明：
+    - samples: shape (n, 6) 的 (ax, ay, az, gx, gy, gz)
+    - labels: shape (n,) 的鼓索引
+
+    返回：
+    (features, window_labels, positions)：positions 為視窗最後一筆在區段內的相對位置（0~1），用於切分訓練/測試
+    """
+    features, window_labels, positions = [], [], []
+    # 連續相同標籤為一個區段
+    boundaries = np.flatnonzero(np.diff(labels)) + 1
+    for start, stop in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(labels)]))):
+        segment = samples[start:stop]
+        if len(segment) < window:
+            continue
+        windows = sliding_window_view(segment, window, axis=0)
+        features.append(window_features(windows))
+        window_labels.append(np.full(len(windows), labels[start]))
+        positions.append(np.arange(window - 1, len(segment)) / len(segment))
+    return np.concatenate(features), np.concatenate(window_labels), np.concatenate(positions)
+
+
+# ==================== KD-tree ====================
+class KDTree:
+    """
+    簡單的 KD-tree（中位數切分，葉節點以 NumPy 暴力比較）
+
+    節點存在平行的陣列中：axis / split / left / right，葉節點 axis = -1，
+    start / stop 為 self.order 中的範圍。
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        self.axis, self.split, self.left, self.right, self.start, self.stop = [], [], [], [], [], []
+        self._build(0, len(self.points))
+        self.leaf_points = self.points[self.order]
+
+    def _build(self, start, stop):
+        node = len(self.axis)
+        for column in (self.axis, self.split, self.left, self.right, self.start, self.stop):
+            column.append(-1)
+        self.start[node], self.stop[node] = start, stop
+        if stop - start <= self.leaf_size:
+            return node
+
+        indices = self.order[start:stop]
+        subset = self.points[indices]
+        axis = int(np.argmax(subset.max(axis=0) - subset.min(axis=0)))
+        middle = (stop - start) // 2
+        partition = np.argpartition(subset[:, axis], middle)
+        self.order[start:stop] = indices[partition]
+
+        self.axis[node] = axis
+        self.split[node] = float(self.points[self.order[start + middle], axis])
+        self.left[node] = self._build(start, start + middle)
+        self.right[node] = self._build(start + middle, stop)
+        return node
+
+    def query(self, x, k=1):
+        """
+        返回：
+        (distances, indices)，由近到遠，indices 為原始 points 的索引
+        """
+        heap = []   # (-距離², 索引) 的最大堆，保留目前最近的 k 個
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(heap) == k and bound >= -heap[0][0]:
+                continue
+            axis = self.axis[node]
+            if axis < 0:
+                start, stop = self.start[node], self.stop[node]
+                diff = self.leaf_points[start:stop] - x
+                distances = np.einsum("ij,ij->i", diff, diff)
+                candidates = np.arange(start, stop)
+                if len(distances) > k:
+                    # 葉節點內只有最近的 k 個可能進入結果
+                    nearest = np.argpartition(distances, k - 1)[:k]
+                    distances, candidates = distances[nearest], candidates[nearest]
+                for distance, index in zip(distances.tolist(), self.order[candidates].tolist()):
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-distance, index))
+                    elif distance < -heap[0][0]:
+                        heapq.heapreplace(heap, (-distance, index))
+                continue
+            delta = x[axis] - self.split[node]
+            near, far = (self.left[node], self.right[node]) if delta < 0 else (self.right[node], self.left[node])
+            # 先推遠的，後推近的（近的先處理）
+            stack.append((far, max(bound, delta * delta)))
+            stack.append((near, bound))
+
+        result = sorted((-d, i) for d, i in heap)
+        return np.sqrt([d for d, _ in result]), np.array([i for _, i in result], dtype=np.int64)
+
+
+# ==================== 分類器 ====================
+class DrumClassifier:
+    """
+    參數說明：
+    - names: 鼓名稱列表
+    - mean / scale: 特徵標準化參數
+    - window: 視窗樣本數；period: 訓練數據的採樣週期
+    - kind: "centroid" 或 "knn"
+    - points / point_labels: centroid 為各鼓中心；knn 為所有訓練特徵（投影後）
+    - projection: 標準化後乘上的投影矩陣（knn 的 PCA；None 為不投影）
+    """
+
+    def __init__(self, names, mean, scale, window, period, kind, points, point_labels, k=KNN_K,
+                 projection=None):
+        self.names = list(names)
+        self.mean = np.asarray(mean)
+        self.scale = np.asarray(scale)
+        self.projection = None if projection is None else np.asarray(projection)
+        self.window = int(window)
+        self.period = float(period)
+        self.kind = kind
+        self.points = np.asarray(points)
+        self.point_labels = np.asarray(point_labels, dtype=np.int64)
+        self.k = int(k)
+        self.tree = KDTree(self.points) if kind == "knn" else None
+
+    @classmethod
+    def fit(cls, features, labels, names, window, period, kind="centroid", k=KNN_K):
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        normalized = (features - mean) / scale
+        projection = None
+        if kind == "centroid":
+            point_labels = np.unique(labels)
+            points = np.stack([normalized[labels == label].mean(axis=0) for label in point_labels])
+        elif kind == "knn":
+            # 主成分：標準化特徵的右奇異向量
+            _, _, vt = np.linalg.svd(normalized - normalized.mean(axis=0), full_matrices=False)
+            projection = vt[:PCA_DIMS].T
+            points, point_labels = normalized @ projection, labels
+        else:
+            raise ValueError(f"未知的模型: {kind}（centroid / knn）")
+        return cls(names, mean, scale, window, period, kind, points, point_labels, k, projection)
+
+    def predict_features(self, features):
+        """批次預測，返回鼓索引陣列"""
+        normalized = (np.atleast_2d(features) - self.mean) / self.scale
+        if self.projection is not None:
+            normalized = normalized @ self.projection
+        if self.kind == "centroid":
+            distances = ((normalized[:, None, :] - self.points[None, :, :]) ** 2).sum(axis=2)
+            return self.point_labels[np.argmin(distances, axis=1)]
+        result = np.empty(len(normalized), dtype=np.int64)
+        for i, x in enumerate(normalized):
+            _, indices = self.tree.query(x, self.k)
+            result[i] = np.bincount(self.point_labels[indices]).argmax()
+        return result
+
+    def classify_window(self, window):
+        """
+        單次敲擊的推論
+
+        參數說明：
+        - window: 最近的樣本 (ax, ay, az, gx, gy, gz)，shape (w, 6)，最後一筆為峰值
+
+        返回：
+        鼓名稱
+        """
+        window = np.asarray(window, dtype=np.float64)
+        features = window_features(window.T[None, :, :])
+        return self.names[int(self.predict_features(features)[0])]
+
+    @property
+    def span(self):
+        """視窗涵蓋的時間（秒）"""
+        return (self.window - 1) * self.period
+
+    def classify_samples(self, samples):
+        """
+        以任意採樣率的最近樣本推論：依時間內插成 window 筆、間隔 period 的視窗
+
+        參數說明：
+        - samples: [(timestamp_ns, roll, pitch, yaw, ax, ay, az, gx, gy, gz), ...]，由舊到新，最後一筆為峰值
+
+        返回：
+        鼓名稱
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        sample_times = (samples[:, 0] - samples[-1, 0]) * 1e-9    # 相對峰值的秒數
+        times = -np.arange(self.window - 1, -1, -1) * self.period
+        window = np.empty((self.window, 6))
+        for axis in range(6):
+            window[:, axis] = np.interp(times, sample_times, samples[:, 4 + axis])
+        return self.classify_window(window)
+
+    def save(self, path):
+        arrays = {} if self.projection is None else {"projection": self.projection}
+        np.savez(path, mean=self.mean, scale=self.scale, points=self.points,
+                 point_labels=self.point_labels, **arrays,
+                 meta=json.dumps({"names": self.names, "window": self.window, "period": self.period,
+                                  "kind": self.kind, "k": self.k}))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            projection = data["projection"] if "projection" in data.files else None
+            return cls(meta["names"], data["mean"], data["scale"], meta["window"], meta["period"],
+                       meta["kind"], data["points"], data["point_labels"], meta["k"], projection)
+
+
+def load_classifier(path=None):
+    """讀取環境變數 DRUM_CLASSIFIER 指定的模型（未設定則返回 None）"""
+    path = path or os.environ.get(CLASSIFIER_ENV)
+    if not path:
+        return None
+    classifier = DrumClassifier.load(path)
+    print(f"[DrumClassifier] 載入 {path}（{classifier.kind}，{len(classifier.names)} 個鼓，"
+          f"視窗 {classifier.window} 筆）")
+    return classifier
+
+
+# ==================== 訓練與評估 ====================
+def load_training_data(path, channel="left"):
+    """
+    載入錄製檔並扣除感測器偏移（與執行時 SensorChannel 輸出的數值一致）
+
+    返回：
+    (samples (n, 6), labels, names, period)
+    """
+    from replay_sensor import load_recording
+    from sensor_channel import get_channel
+
+    recording, labels, names = load_recording(path)
+    period = float(np.median(np.diff(recording[:, 0])))
+    samples = recording[:, 1:] - get_channel(channel).offsets
+    return samples, labels, names, period
+
+
+def train(path, kind="centroid", channel="left", k=KNN_K):
+    """
+    訓練並以每個鼓最後 30% 的數據評估
+
+    返回：
+    (classifier, report)；classifier 以全部數據重新訓練
+    """
+    samples, labels, names, period = load_training_data(path, channel)
+    window = window_length(period)
+    features, window_labels, positions = extract_features(samples, labels, window)
+
+    # 依時間切分，並丟掉緊鄰切分點的視窗（與訓練視窗重疊）
+    gap = window / (len(samples) / len(names))
+    train_mask = positions < TRAIN_RATIO
+    test_mask = positions >= TRAIN_RATIO + gap
+    model = DrumClassifier.fit(features[train_mask], window_labels[train_mask], names, window, period, kind, k)
+    predicted = model.predict_features(features[test_mask])
+    actual = window_labels[test_mask]
+
+    report = {
+        "windows": int(len(features)),
+        "window": window,
+        "accuracy": float(np.mean(predicted == actual)) if len(actual) else 0.0,
+        "per_drum": {name: float(np.mean(predicted[actual == i] == i)) if np.any(actual == i) else 0.0
+                     for i, name in enumerate(names)},
+    }
+    return DrumClassifier.fit(features, window_labels, names, window, period, kind, k), report
+
+
+def benchmark(classifier, samples=None, repeats=2000):
+    """
+    單次敲擊推論延遲（特徵 + 預測）
+
+    參數說明：
+    - samples: shape (n, 6) 的錄製數據，從中取視窗；None 時使用隨機數據
+
+    返回：
+    {"mean_us", "p99_us"}
+    """
+    rng = np.random.default_rng(0)
+    if samples is not None and len(samples) > classifier.window:
+        starts = rng.integers(0, len(samples) - classifier.window, repeats)
+        windows = np.stack([samples[s:s + classifier.window] for s in starts])
+    else:
+        windows = rng.normal(0, 5, (repeats, classifier.window, 6))
+    timings = np.empty(repeats)
+    for i, window in enumerate(windows):
+        start = time.perf_counter()
+        classifier.classify_window(window)
+        timings[i] = time.perf_counter() - start
+    return {"mean_us": float(timings.mean() * 1e6), "p99_us": float(np.percentile(timings, 99) * 1e6)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="鼓分類器訓練與效能測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train")
+    train_parser.add_argument("recording")
+    train_parser.add_argument("--model", choices=("centroid", "knn"), default="centroid")
+    train_parser.add_argument("--channel", default="left", help="錄製時使用的感測器通道（扣除其偏移）")
+    train_parser.add_argument("--out", default=DEFAULT_MODEL_PATH)
+    bench_parser = sub.add_parser("bench")
+    bench_parser.add_argument("model", nargs="?", default=DEFAULT_MODEL_PATH)
+    bench_parser.add_argument("--recording", help="以錄製數據的視窗測試（預設為隨機數據）")
+    args = parser.parse_args()
+
+    samples = None
+    if args.command == "train":
+        classifier, report = train(args.recording, args.model, args.channel)
+        print(f"=== {args.model}：{report['windows']} 個視窗（每個 {report['window']} 筆）===")
+        for name, accuracy in report["per_drum"].items():
+            print(f"  {name:<10} {accuracy:.0%}")
+        print(f"測試準確率（每個鼓最後 {1 - TRAIN_RATIO:.0%}）: {report['accuracy']:.1%}")
+        classifier.save(args.out)
+        print(f"已儲存: {args.out}")
+        samples = load_training_data(args.recording, args.channel)[0]
+    else:
+        classifier = DrumClassifier.load(args.model)
+        if args.recording:
+            samples = load_training_data(args.recording)[0]
+
+    stats = benchmark(classifier, samples)
+    print(f"推論延遲: 平均 {stats['mean_us']:.0f} µs，p99 {stats['p99_us']:.0f} µs"
+          f"（採樣週期 200 Hz = 5000 µs）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,267 +1,426 @@
 import math
-import json
 import os
+import threading
+from collections import namedtuple
 
-class DrumCollisionDetector:
-    def __init__(self, config_path="static/js/3d_settings.js"):
-        """從 3d_settings.js 載入所有配置"""
-        self.config = self._load_config_from_js(config_path)
-        self.drums = self.config["drums"]
-        self.collision_buffer = self.config.get("COLLISION_BUFFER", 0.05)
-        
-    def _load_config_from_js(self, config_path):
-        """解析 3d_settings.js 中的所有配置參數"""
-        config = {
-            "drums": [],
-            # 預設值（萬一讀取失敗）
-            "GRIP_RIGHT_X": -0.6,
-            "GRIP_LEFT_X": 0.4,
-            "GRIP_BASE_Y": 1.0,
-            "GRIP_BASE_Z": -3.0,
-            "YAW_SENSITIVITY": 45,
-            "YAW_POSITION_FACTOR": 0.8,
-            "PITCH_THRESHOLD": 15,
-            "PITCH_Y_FACTOR": 0.003,
-            "PITCH_Z_TILTED_MAX": 2.0,
-            "PITCH_Z_TILTED_FACTOR": 1.5,
-            "PITCH_Z_FLAT_FACTOR": 0.005,
-            "ACCEL_Z_FACTOR": 0.02,
-            "ACCEL_Z_MAX": 0.3,
-            "GRIP_Z_MIN": -2.0,
-            "GRIP_Z_MAX": -0.3,
-            "GRIP_RIGHT_X_MIN": -1.4,
-            "GRIP_RIGHT_X_MAX": -0.2,
-            "GRIP_LEFT_X_MIN": 0.3,
-            "GRIP_LEFT_X_MAX": 1.5,
-            "COLLISION_BUFFER": 0.05,
-            "STICK_LENGTH": 1.2,
-        }
+import numpy as np
+
+from drum_config import ConfigWatcher, load_config
+
+# XZ 分桶索引的格子邊長（米）
+ZONE_GRID_CELL_SIZE = 0.1
+
+# 3d_settings.js 的路徑（以本檔所在目錄為準，不受啟動時的工作目錄影響）
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "js", "3d_settings.js")
+
+# 求鼓面接觸角度的 pitch 範圍（度）：此範圍內鼓棒尖端高度隨 pitch 單調下降
+CONTACT_PITCH_RANGE = 60.0
+
+
+class DrumZoneGrid:
+    """
+    鼓區域的 XZ 平面分桶索引（俯視圖）
+    
+    載入配置時把每個鼓的圓形投影登記到所有相交的格子，
+    查詢時只需檢查所在格子的候選鼓，成本與鼓的總數無關。
+    重疊區域（如 Hihat/Snare）選擇圓心最近的鼓，距離相同時取 zones 中較前面的鼓。
+    """
+    
+    def __init__(self, drums, cell_size=ZONE_GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.centers_x = np.array([d["x"] for d in drums], dtype=np.float64)
+        self.centers_z = np.array([d["z"] for d in drums], dtype=np.float64)
+        self.radii = np.array([d["radius"] for d in drums], dtype=np.float64)
+        self._circles = [(d["x"], d["z"], d["radius"]) for d in drums]
         
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 解析常數定義
-            import re
-            const_pattern = r'const\s+(\w+)\s*=\s*([^;]+);'
-            matches = re.findall(const_pattern, content)
-            
-            for name, value in matches:
-                value = value.strip()
-                
-                # 移除註解
-                if '//' in value:
-                    value = value[:value.index('//')].strip()
-                
-                # 解析數值
-                try:
-                    # 替換 Math.PI
-                    value = value.replace('Math.PI', str(math.pi))
-                    
-                    # 嘗試計算表達式
-                    if any(op in value for op in ['+', '-', '*', '/']):
-                        parsed_value = eval(value)
-                    else:
-                        # 嘗試轉換為浮點數
-                        parsed_value = float(value)
-                    
-                    if name in config:
-                        config[name] = parsed_value
-                        
-                except (ValueError, SyntaxError):
-                    pass  # 無法解析的值跳過
-            
-            # 解析 zones 陣列
-            config["drums"] = self._parse_zones_array(content)
-            
-            print(f"[DrumCollision] Loaded config from {config_path}")
-            print(f"  - {len(config['drums'])} drums")
-            print(f"  - PITCH_THRESHOLD = {config['PITCH_THRESHOLD']}")
-            print(f"  - YAW_POSITION_FACTOR = {config['YAW_POSITION_FACTOR']}")
-            print(f"  - GRIP_BASE_Z = {config['GRIP_BASE_Z']}")
-            
-            return config
-            
-        except Exception as e:
-            print(f"[DrumCollision] Failed to load config: {e}")
-            config["drums"] = self._get_default_drums()
-            return config
+        if not drums:
+            self.min_x = self.min_z = 0.0
+            self.nx = self.nz = 0
+            self._cells = []
+            self._cell_table = np.full((1, 1), -1, dtype=np.int64)
+            return
+        
+        self.min_x = float(np.min(self.centers_x - self.radii))
+        self.min_z = float(np.min(self.centers_z - self.radii))
+        self.nx = int(math.ceil((np.max(self.centers_x + self.radii) - self.min_x) / cell_size)) + 1
+        self.nz = int(math.ceil((np.max(self.centers_z + self.radii) - self.min_z) / cell_size)) + 1
+        
+        # 每個格子的候選鼓（與格子矩形相交的圓）
+        self._cells = [() for _ in range(self.nx * self.nz)]
+        for index, drum in enumerate(drums):
+            x, z, r = drum["x"], drum["z"], drum["radius"]
+            ix0, iz0 = self._cell_coords(x - r, z - r)
+            ix1, iz1 = self._cell_coords(x + r, z + r)
+            for iz in range(max(iz0, 0), min(iz1, self.nz - 1) + 1):
+                cell_z0 = self.min_z + iz * cell_size
+                nearest_z = min(max(z, cell_z0), cell_z0 + cell_size)
+                for ix in range(max(ix0, 0), min(ix1, self.nx - 1) + 1):
+                    cell_x0 = self.min_x + ix * cell_size
+                    nearest_x = min(max(x, cell_x0), cell_x0 + cell_size)
+                    if math.hypot(nearest_x - x, nearest_z - z) <= r + 1e-9:
+                        cell = iz * self.nx + ix
+                        self._cells[cell] = self._cells[cell] + (index,)
+        
+        # 批次查詢用的候選表：shape (格子數 + 1, 最大候選數)，-1 為空位，最後一列代表格外
+        width = max(1, max(len(c) for c in self._cells))
+        self._cell_table = np.full((len(self._cells) + 1, width), -1, dtype=np.int64)
+        for cell, candidates in enumerate(self._cells):
+            self._cell_table[cell, :len(candidates)] = candidates
     
-    def _parse_zones_array(self, content):
-        """解析 3d_settings.js 中的 zones 陣列"""
-        try:
-            # 找到 zones 陣列定義
-            start = content.find('const zones = [')
-            if start == -1:
-                raise ValueError("Cannot find zones definition")
-            
-            end = content.find('];', start)
-            if end == -1:
-                raise ValueError("Cannot find zones end marker")
-            
-            # 提取 zones 陣列內容（不包含 'const zones = ' 和最後的 '];'）
-            zones_start = start + len('const zones = ')
-            zones_content = content[zones_start:end+1]  # 包含 ']'
-            
-            # 逐行處理，提取每個鼓的配置
-            drums = []
-            current_obj = {}
-            in_obj = False
-            
-            for line in zones_content.split('\n'):
-                line = line.strip()
-                
-                # 移除註解
-                if '//' in line:
-                    line = line[:line.index('//')].strip()
-                
-                if not line:
-                    continue
-                
-                # 開始一個物件
-                if '{' in line:
-                    in_obj = True
-                    current_obj = {}
-                    continue
-                
-                # 結束一個物件
-                if '}' in line:
-                    if current_obj and 'name' in current_obj and 'pos3d' in current_obj:
-                        drums.append({
-                            "name": current_obj["name"],
-                            "x": current_obj["pos3d"][0],
-                            "y": current_obj["pos3d"][1],
-                            "z": current_obj["pos3d"][2],
-                            "radius": current_obj["radius"]
-                        })
-                    in_obj = False
-                    continue
-                
-                if not in_obj:
-                    continue
-                
-                # 解析屬性
-                if 'name:' in line:
-                    # name: "Hihat",
-                    name = line.split('"')[1]
-                    current_obj["name"] = name
-                    
-                elif 'pos3d:' in line:
-                    # pos3d: [1.8, 0.8, -1],
-                    pos_str = line[line.index('[')+1:line.index(']')]
-                    pos = [float(x.strip()) for x in pos_str.split(',')]
-                    current_obj["pos3d"] = pos
-                    
-                elif 'radius:' in line:
-                    # radius: 0.65,
-                    radius_str = line.split(':')[1].strip().rstrip(',')
-                    current_obj["radius"] = float(radius_str)
-            
-            if drums:
-                return drums
-            else:
-                raise ValueError("No drums found in zones array")
-            
-        except Exception as e:
-            print(f"[DrumCollision] Failed to parse zones: {e}")
-            return self._get_default_drums()
+    def _cell_coords(self, x, z):
+        return (int(math.floor((x - self.min_x) / self.cell_size)),
+                int(math.floor((z - self.min_z) / self.cell_size)))
     
-    def _get_default_drums(self):
-        """備用硬編碼配置（以防載入失敗）"""
-        return [
-            {"name": "Hihat", "x": 1.8, "y": 0.8, "z": -1, "radius": 0.65},
-            {"name": "Snare", "x": 0.5, "y": 0.4, "z": -1, "radius": 0.65},
-            {"name": "Tom_high", "x": 0.6, "y": 0.8, "z": 0.3, "radius": 0.5},
-            {"name": "Tom_mid", "x": -0.6, "y": 0.8, "z": 0.3, "radius": 0.5},
-            {"name": "Symbal", "x": 1.7, "y": 1.4, "z": 0.5, "radius": 0.80},
-            {"name": "Ride", "x": -1.8, "y": 1.4, "z": -0.1, "radius": 0.90},
-            {"name": "Tom_floor", "x": -1.2, "y": 0.2, "z": -1, "radius": 0.80},
-        ]
+    def lookup(self, x, z):
+        """返回 (x, z) 所在的鼓索引，沒有則為 -1"""
+        ix, iz = self._cell_coords(x, z)
+        if not (0 <= ix < self.nx and 0 <= iz < self.nz):
+            return -1
+        
+        best_index = -1
+        best_distance = 0.0
+        for index in self._cells[iz * self.nx + ix]:
+            drum_x, drum_z, radius = self._circles[index]
+            dx = x - drum_x
+            dz = z - drum_z
+            distance_2d = math.sqrt(dx * dx + dz * dz)
+            if distance_2d <= radius and (best_index == -1 or distance_2d < best_distance):
+                best_index = index
+                best_distance = distance_2d
+        return best_index
     
-    def calculate_stick_tip_position(self, ax, pitch, yaw, hand="right"):
-        """
-        計算鼓棒前端（敲擊端）的 3D 位置
-        完全對應 drum_3d.js 的計算邏輯
+    def lookup_batch(self, x, z):
+        """lookup 的向量化版本，返回 int 陣列"""
+        x = np.asarray(x, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        if self.nx == 0:
+            return np.full(x.shape, -1, dtype=np.int64)
         
-        參數說明：
-        - ax: X軸加速度，控制鼓棒前後深淺
-        - pitch: Y軸旋轉角度，控制鼓棒上下揮動
-        - yaw: Z軸旋轉角度，控制鼓棒左右位置
-        - hand: "right" 或 "left"
+        ix = np.floor((x - self.min_x) / self.cell_size)
+        iz = np.floor((z - self.min_z) / self.cell_size)
+        inside = (ix >= 0) & (ix < self.nx) & (iz >= 0) & (iz < self.nz)
+        cell = np.where(inside, iz * self.nx + ix, len(self._cells)).astype(np.int64)
+        
+        candidates = self._cell_table[cell]                      # (N, K)
+        valid = candidates >= 0
+        safe = np.where(valid, candidates, 0)
+        dx = x[..., None] - self.centers_x[safe]
+        dz = z[..., None] - self.centers_z[safe]
+        distance_2d = np.sqrt(dx * dx + dz * dz)
+        hit = valid & (distance_2d <= self.radii[safe])
+        distance_2d = np.where(hit, distance_2d, np.inf)
         
+        # 候選依 zones 順序排列，argmin 在距離相同時取較前面的鼓
+        best = np.argmin(distance_2d, axis=-1)
+        indices = np.take_along_axis(candidates, best[..., None], axis=-1)[..., 0]
+        return np.where(hit.any(axis=-1), indices, -1)
+
+
+    def sweep(self, x0, z0, x1, z1):
+        """
+        線段 (x0, z0) → (x1, z1) 第一個進入的鼓（連續碰撞偵測）
+
+        對每個鼓的圓解 |P0 + s (P1 - P0) - C| = r 的最小 s；起點已在圓內時 s = 0，
+        多個鼓的 s 相同（例如同在 s = 0）時與 lookup 相同取圓心最近的鼓，因此 P0 == P1 時結果與 lookup(x0, z0) 一致。
+
         返回：
-        (x, y, z): 鼓棒前端的 3D 座標
+        (鼓索引, s)：s 為線段上的比例 0 ~ 1；沒有碰到為 (-1, None)
         """
+        dx = x1 - x0
+        dz = z1 - z0
+        a = dx * dx + dz * dz
+        min_x, max_x = (x0, x1) if x0 <= x1 else (x1, x0)
+        min_z, max_z = (z0, z1) if z0 <= z1 else (z1, z0)
+        best_index = -1
+        best_s = 2.0
+        best_distance = 0.0
+        for index, (drum_x, drum_z, radius) in enumerate(self._circles):
+            # 線段的外接矩形擴大 radius 後仍不含圓心：不可能相交
+            if (drum_x < min_x - radius or drum_x > max_x + radius
+                    or drum_z < min_z - radius or drum_z > max_z + radius):
+                continue
+            fx = x0 - drum_x
+            fz = z0 - drum_z
+            distance_sq = fx * fx + fz * fz
+            c = distance_sq - radius * radius
+            if c <= 0:
+                s = 0.0   # 起點已在圓內
+            else:
+                b = fx * dx + fz * dz
+                if a == 0.0 or b >= 0:
+                    continue   # 沒有移動，或正在遠離圓心
+                disc = b * b - a * c
+                if disc < 0:
+                    continue
+                s = (-b - math.sqrt(disc)) / a
+                if s > 1.0:
+                    continue
+            if s < best_s or (s == best_s and distance_sq < best_distance):
+                best_index = index
+                best_s = s
+                best_distance = distance_sq
+        if best_index == -1:
+            return -1, None
+        return best_index, best_s
+
+    def sweep_batch(self, x0, z0, x1, z1):
+        """
+        sweep 的向量化版本：N 條線段 × 所有鼓一次計算
+
+        返回：
+        (indices, s)：int 陣列（沒碰到為 -1）與 float 陣列（沒碰到為 nan）
+        """
+        x0 = np.asarray(x0, dtype=np.float64)[..., None]
+        z0 = np.asarray(z0, dtype=np.float64)[..., None]
+        dx = np.asarray(x1, dtype=np.float64)[..., None] - x0
+        dz = np.asarray(z1, dtype=np.float64)[..., None] - z0
+        if len(self._circles) == 0:
+            shape = np.broadcast(x0, z0).shape[:-1]
+            return np.full(shape, -1, dtype=np.int64), np.full(shape, np.nan)
+
+        fx = x0 - self.centers_x                                   # (N, D)
+        fz = z0 - self.centers_z
+        distance_sq = fx * fx + fz * fz
+        c = distance_sq - self.radii * self.radii
+        a = dx * dx + dz * dz
+        b = fx * dx + fz * dz
+        disc = b * b - a * c
+        with np.errstate(divide="ignore", invalid="ignore"):
+            entry = (-b - np.sqrt(np.maximum(disc, 0.0))) / a
+        entering = (c > 0) & (a > 0) & (b < 0) & (disc >= 0) & (entry <= 1.0)
+        s = np.where(c <= 0, 0.0, np.where(entering, entry, np.inf))
+
+        # 最早的接觸；s 相同時取圓心最近的鼓（與 sweep、lookup 相同）
+        first = s.min(axis=-1, keepdims=True)
+        tie_break = np.where(s == first, distance_sq, np.inf)
+        best = np.argmin(tie_break, axis=-1)
+        hit = np.isfinite(first[..., 0])
+        indices = np.where(hit, best, -1)
+        return indices, np.where(hit, first[..., 0], np.nan)
+
+
+# 單一樣本位置計算用的常數，欄位名稱與 DrumConfig 的屬性相同（以名稱取出，不依賴順序）
+StickConstants = namedtuple("StickConstants", (
+    "GRIP_RIGHT_X", "GRIP_LEFT_X", "GRIP_BASE_Y", "GRIP_BASE_Z",
+    "YAW_SENSITIVITY", "YAW_POSITION_FACTOR", "PITCH_THRESHOLD", "PITCH_Y_FACTOR",
+    "PITCH_Z_TILTED_MAX", "PITCH_Z_TILTED_FACTOR", "PITCH_Z_FLAT_FACTOR",
+    "ACCEL_Z_FACTOR", "ACCEL_Z_MAX", "GRIP_Z_MIN", "GRIP_Z_MAX", "STICK_LENGTH",
+))
+
+# reload() 一次替換的整組狀態
+DetectorState = namedtuple("DetectorState", ("config", "zone_grid", "contact_pitches", "stick"))
+
+
+class DrumCollisionDetector:
+    def __init__(self, config_path=CONFIG_PATH):
+        """從 3d_settings.js 載入所有配置（已編譯並快取，見 drum_config.py）"""
+        self.config_path = config_path
+        self._watcher = None
+        self.reload(load_config(config_path))
+    
+    def reload(self, config=None):
+        """
+        替換為新的設定與 XZ 索引
         
-        # 從配置讀取所有參數（自動與 3d_settings.js 同步）
-        cfg = self.config
-        GRIP_RIGHT_X = cfg["GRIP_RIGHT_X"]
-        GRIP_LEFT_X = cfg["GRIP_LEFT_X"]
-        GRIP_BASE_Y = cfg["GRIP_BASE_Y"]
-        GRIP_BASE_Z = cfg["GRIP_BASE_Z"]
-        YAW_SENSITIVITY = cfg["YAW_SENSITIVITY"]
-        YAW_POSITION_FACTOR = cfg["YAW_POSITION_FACTOR"]
-        PITCH_THRESHOLD = cfg["PITCH_THRESHOLD"]
-        PITCH_Y_FACTOR = cfg["PITCH_Y_FACTOR"]
-        PITCH_Z_TILTED_MAX = cfg["PITCH_Z_TILTED_MAX"]
-        PITCH_Z_TILTED_FACTOR = cfg["PITCH_Z_TILTED_FACTOR"]
-        PITCH_Z_FLAT_FACTOR = cfg["PITCH_Z_FLAT_FACTOR"]
-        ACCEL_Z_FACTOR = cfg["ACCEL_Z_FACTOR"]
-        ACCEL_Z_MAX = cfg["ACCEL_Z_MAX"]
-        GRIP_Z_MIN = cfg["GRIP_Z_MIN"]
-        GRIP_Z_MAX = cfg["GRIP_Z_MAX"]
-        
+        DetectorState(config, zone_grid, contact_pitches, stick) 一次替換，進行中的偵測仍使用舊的一組，不需要加鎖
+        """
+        if config is None:
+            config = load_config(self.config_path)
+        # 載入時就建立 XZ 分桶索引、各鼓面的接觸角度與位置計算用的常數，查詢成本固定
+        self._state = DetectorState(config, DrumZoneGrid(config.drums), self._contact_pitches(config),
+                                    self._stick_constants(config))
+    
+    def start_watching(self, interval=None):
+        """啟動背景監看，3d_settings.js 修改後自動重新載入（不需重啟 Flask）"""
+        if self._watcher is None:
+            kwargs = {} if interval is None else {"interval": interval}
+            self._watcher = ConfigWatcher(self.config_path, self.reload, **kwargs)
+        self._watcher.start()
+    
+    @property
+    def config(self):
+        return self._state.config
+    
+    @property
+    def drums(self):
+        return self._state.config.drums
+    
+    @property
+    def zone_grid(self):
+        return self._state.zone_grid
+    
+    @property
+    def collision_buffer(self):
+        return self._state.config.COLLISION_BUFFER
+    
+    @staticmethod
+    def _stick_constants(cfg):
+        """
+        單一樣本位置計算用的常數，每組設定載入（或熱重載）時取出一次
+
+        偵測時從 StickConstants 讀取，不再每次呼叫都經過 DrumConfig 的屬性查找
+        """
+        return StickConstants(*(getattr(cfg, field) for field in StickConstants._fields))
+
+    @staticmethod
+    def _calculate_grip_position(stick, ax, pitch, yaw, hand="right"):
+        """計算握把位置（與 drum_3d.js 完全一致），返回 (x, y, z)；stick 為 StickConstants"""
         # 1. 計算握把 X 位置
         if hand == "right":
-            hand_x = GRIP_RIGHT_X + (yaw / YAW_SENSITIVITY) * YAW_POSITION_FACTOR
+            hand_x = stick.GRIP_RIGHT_X + (yaw / stick.YAW_SENSITIVITY) * stick.YAW_POSITION_FACTOR
         else:
-            hand_x = GRIP_LEFT_X + (yaw / YAW_SENSITIVITY) * YAW_POSITION_FACTOR
+            hand_x = stick.GRIP_LEFT_X + (yaw / stick.YAW_SENSITIVITY) * stick.YAW_POSITION_FACTOR
         
         # 2. 計算握把 Y 位置
-        hand_y = GRIP_BASE_Y + pitch * PITCH_Y_FACTOR
+        hand_y = stick.GRIP_BASE_Y + pitch * stick.PITCH_Y_FACTOR
         
         # 3. 計算握把 Z 位置（與前端完全一致）
-        hand_z = GRIP_BASE_Z
+        hand_z = stick.GRIP_BASE_Z
         
-        if pitch < PITCH_THRESHOLD:
+        if pitch < stick.PITCH_THRESHOLD:
             # 打擊前方的鼓（舉起）
-            depth_factor = (PITCH_THRESHOLD - pitch) / 20
-            hand_z += min(PITCH_Z_TILTED_MAX, depth_factor * PITCH_Z_TILTED_FACTOR)
+            depth_factor = (stick.PITCH_THRESHOLD - pitch) / 20
+            hand_z += min(stick.PITCH_Z_TILTED_MAX, depth_factor * stick.PITCH_Z_TILTED_FACTOR)
         else:
             # 打擊平面鼓（向下）
-            hand_z += pitch * PITCH_Z_FLAT_FACTOR
+            hand_z += pitch * stick.PITCH_Z_FLAT_FACTOR
         
         # 加入加速度影響
-        az_contribution = max(-ACCEL_Z_MAX, min(ACCEL_Z_MAX, abs(ax) * ACCEL_Z_FACTOR))
+        az_contribution = max(-stick.ACCEL_Z_MAX, min(stick.ACCEL_Z_MAX, abs(ax) * stick.ACCEL_Z_FACTOR))
         hand_z += az_contribution
         
         # 限制範圍
-        hand_z = max(GRIP_Z_MIN, min(GRIP_Z_MAX, hand_z))
+        hand_z = max(stick.GRIP_Z_MIN, min(stick.GRIP_Z_MAX, hand_z))
         
-        # 2. 計算鼓棒的旋轉角度（弧度）
+        return hand_x, hand_y, hand_z
+    
+    @classmethod
+    def _calculate_stick_positions(cls, stick, ax, pitch, yaw, hand="right"):
+        """同時計算握把與鼓棒前端位置，返回 (hand_x, hand_y, hand_z, tip_x, tip_y, tip_z)"""
+        hand_x, hand_y, hand_z = cls._calculate_grip_position(stick, ax, pitch, yaw, hand)
+        
+        # 計算鼓棒的旋轉角度（弧度）
         # 完全對應 drum_3d.js 的旋轉計算
         # rightStick.rotation.x = (finalRightPitch / 45) * (Math.PI / 3);
         # rightStick.rotation.y = (rightYaw / 45) * (Math.PI / 6);
         rotation_x = (pitch / 45) * (math.pi / 3)  # pitch 控制上下揮擊（繞 X 軸）
         rotation_y = (yaw / 45) * (math.pi / 6)    # yaw 控制左右擺動（繞 Y 軸）
         
-        # 3. 鼓棒長度（從配置檔讀取）
-        stick_length = cfg["STICK_LENGTH"]
+        # 鼓棒長度（從配置檔讀取）
+        stick_length = stick.STICK_LENGTH
         
-        # 4. 計算鼓棒前端相對於握把的偏移量
+        # 計算鼓棒前端相對於握把的偏移量
         # 鼓棒初始方向是沿著 Z 軸正向（向前）
         # 經過 X 軸和 Y 軸旋轉後的位置
         dx = stick_length * math.sin(rotation_y) * math.cos(rotation_x)
         dy = -stick_length * math.sin(rotation_x)  # 負號：pitch 增加時鼓棒往下
         dz = stick_length * math.cos(rotation_y) * math.cos(rotation_x)
         
-        # 5. 計算鼓棒前端的絕對位置
-        tip_x = hand_x + dx
-        tip_y = hand_y + dy
-        tip_z = hand_z + dz
+        # 計算鼓棒前端的絕對位置
+        return hand_x, hand_y, hand_z, hand_x + dx, hand_y + dy, hand_z + dz
+    
+    def calculate_stick_tip_position(self, ax, pitch, yaw, hand="right"):
+        """
+        計算鼓棒前端（敲擊端）的 3D 位置
+        完全對應 drum_3d.js 的計算邏輯
         
-        return tip_x, tip_y, tip_z
+        參數說明：
+        - ax: X軸加速度，控制鼓棒前後深淺
+        - pitch: Y軸旋轉角度，控制鼓棒上下揮動
+        - yaw: Z軸旋轉角度，控制鼓棒左右位置
+        - hand: "right" 或 "left"
+        
+        返回：
+        (x, y, z): 鼓棒前端的 3D 座標
+        """
+        return self._calculate_stick_positions(self._state.stick, ax, pitch, yaw, hand)[3:]
+    
+    @staticmethod
+    def _drum_height(name):
+        """鼓面厚度（與 3d_settings.js 的 CYMBAL_HEIGHT 等設定一致）"""
+        is_cymbal = "Symbal" in name or "Ride" in name or "Hihat" in name
+        if is_cymbal:
+            return 0.05  # 鈸很薄
+        elif name == "Tom_floor":
+            return 1.0   # 落地鼓較長
+        return 0.5       # 其他鼓的標準高度
     
+    @classmethod
+    def _adjust_pitch(cls, cfg, drum, hand_y, pitch):
+        """計算讓鼓棒尖端停在鼓面上的 pitch 角度"""
+        # 計算鼓面高度
+        drum_top_y = drum["y"] + cls._drum_height(drum["name"]) / 2
+        target_tip_y = drum_top_y + 0.03  # 鼓棒尖端停在鼓面上方 3cm
+        
+        # 計算需要的高度差
+        delta_y = target_tip_y - hand_y  # 從握把到目標高度的 Y 差
+        
+        # 使用反三角函數計算調整後的 pitch 角度
+        stick_length = cfg.STICK_LENGTH
+        if abs(delta_y) <= stick_length:
+            rotation_x = math.asin(-delta_y / stick_length)
+            return rotation_x / (math.pi / 3) * 45
+        return pitch  # 如果算不出來，保持原角度
+    
+    @staticmethod
+    def _contact_pitches(cfg):
+        """
+        每個鼓的鼓面接觸角度：鼓棒尖端高度剛好等於鼓面高度時的 pitch
+
+        尖端高度只和 pitch 有關（握把 Y 與鼓棒傾角都只由 pitch 決定），因此每組設定只需計算一次。
+
+        返回：
+        [(pitch, 鼓索引), ...]，依 pitch 由小到大排序（pitch 增加時鼓棒往下，先碰到的鼓在前）；
+        在 ±CONTACT_PITCH_RANGE 內碰不到的鼓不列入
+        """
+        def tip_height(pitch):
+            return (cfg.GRIP_BASE_Y + pitch * cfg.PITCH_Y_FACTOR
+                    - cfg.STICK_LENGTH * math.sin((pitch / 45) * (math.pi / 3)))
+
+        contacts = []
+        for index, drum in enumerate(cfg.drums):
+            drum_top_y = drum["y"] + DrumCollisionDetector._drum_height(drum["name"]) / 2
+            low, high = -CONTACT_PITCH_RANGE, CONTACT_PITCH_RANGE
+            if not tip_height(high) <= drum_top_y <= tip_height(low):
+                continue
+            # 二分法：tip_height(low) >= 鼓面 >= tip_height(high)
+            for _ in range(40):
+                middle = (low + high) / 2
+                if tip_height(middle) >= drum_top_y:
+                    low = middle
+                else:
+                    high = middle
+            contacts.append(((low + high) / 2, index))
+        contacts.sort()
+        return contacts
+
+    def predict_contact(self, ax, pitch, yaw, hand="right"):
+        """
+        假設鼓棒繼續向下揮（pitch 增加）、ax 與 yaw 不變，找出尖端第一個碰到的鼓面
+
+        尖端目前所在的鼓（detect_hit_drum 的判斷）優先；它的鼓面已經在身後時，
+        再沿著揮擊路徑找第一個「尖端到達鼓面高度時，XZ 投影落在該鼓內」的鼓。
+
+        返回：
+        {
+            "drum_name": 會碰到的鼓名稱，沒有則為 None,
+            "contact_pitch": 碰到鼓面時的 pitch 角度（沒有則為 None）
+        }
+        """
+        cfg, zone_grid, contacts, stick = self._state
+        _, _, _, tip_x, _, tip_z = self._calculate_stick_positions(stick, ax, pitch, yaw, hand)
+        current = zone_grid.lookup(tip_x, tip_z)
+        for contact_pitch, index in contacts:
+            if index == current and contact_pitch > pitch:
+                return {"drum_name": cfg.drums[index]["name"], "contact_pitch": contact_pitch}
+        for contact_pitch, index in contacts:
+            if contact_pitch <= pitch or index == current:
+                continue
+            _, _, _, tip_x, _, tip_z = self._calculate_stick_positions(stick, ax, contact_pitch, yaw, hand)
+            if zone_grid.lookup(tip_x, tip_z) == index:
+                return {"drum_name": cfg.drums[index]["name"], "contact_pitch": contact_pitch}
+        return {"drum_name": None, "contact_pitch": None}
+
     def detect_hit_drum(self, ax, pitch, yaw, hand="right"):
         """
         偵測鼓棒尖端是否打擊到某個鼓（基於 XZ 平面投影）
@@ -279,92 +438,171 @@ class DrumCollisionDetector:
             "adjusted_pitch": 調整後的 pitch 角度（讓鼓棒停在鼓面上）
         }
         """
-        # 計算鼓棒尖端 3D 位置
-        tip_x, tip_y, tip_z = self.calculate_stick_tip_position(ax, pitch, yaw, hand)
-        
-        # 計算握把位置（與 drum_3d.js 完全一致）
-        # 使用與 calculate_stick_tip_position 相同的邏輯（從配置讀取）
-        cfg = self.config
-        GRIP_RIGHT_X = cfg["GRIP_RIGHT_X"]
-        GRIP_LEFT_X = cfg["GRIP_LEFT_X"]
-        GRIP_BASE_Y = cfg["GRIP_BASE_Y"]
-        GRIP_BASE_Z = cfg["GRIP_BASE_Z"]
-        YAW_SENSITIVITY = cfg["YAW_SENSITIVITY"]
-        YAW_POSITION_FACTOR = cfg["YAW_POSITION_FACTOR"]
-        PITCH_THRESHOLD = cfg["PITCH_THRESHOLD"]
-        PITCH_Y_FACTOR = cfg["PITCH_Y_FACTOR"]
-        PITCH_Z_TILTED_MAX = cfg["PITCH_Z_TILTED_MAX"]
-        PITCH_Z_TILTED_FACTOR = cfg["PITCH_Z_TILTED_FACTOR"]
-        PITCH_Z_FLAT_FACTOR = cfg["PITCH_Z_FLAT_FACTOR"]
-        ACCEL_Z_FACTOR = cfg["ACCEL_Z_FACTOR"]
-        ACCEL_Z_MAX = cfg["ACCEL_Z_MAX"]
-        GRIP_Z_MIN = cfg["GRIP_Z_MIN"]
-        GRIP_Z_MAX = cfg["GRIP_Z_MAX"]
-        
-        if hand == "right":
-            hand_x = GRIP_RIGHT_X + (yaw / YAW_SENSITIVITY) * YAW_POSITION_FACTOR
-        else:
-            hand_x = GRIP_LEFT_X + (yaw / YAW_SENSITIVITY) * YAW_POSITION_FACTOR
+        # 取得目前的設定與索引（熱重載時整組替換，這次偵測全程使用同一組）
+        cfg, zone_grid, _, stick = self._state
         
-        hand_y = GRIP_BASE_Y + pitch * PITCH_Y_FACTOR
-        
-        # 計算 Z 位置
-        hand_z = GRIP_BASE_Z
-        if pitch < PITCH_THRESHOLD:
-            depth_factor = (PITCH_THRESHOLD - pitch) / 20
-            hand_z += min(PITCH_Z_TILTED_MAX, depth_factor * PITCH_Z_TILTED_FACTOR)
-        else:
-            hand_z += pitch * PITCH_Z_FLAT_FACTOR
-        
-        az_contribution = max(-ACCEL_Z_MAX, min(ACCEL_Z_MAX, abs(ax) * ACCEL_Z_FACTOR))
-        hand_z += az_contribution
-        hand_z = max(GRIP_Z_MIN, min(GRIP_Z_MAX, hand_z))
+        # 計算握把與鼓棒尖端 3D 位置（一次計算，不重複）
+        hand_x, hand_y, hand_z, tip_x, tip_y, tip_z = self._calculate_stick_positions(stick, ax, pitch, yaw, hand)
         
         # 檢查是否碰撞到任何鼓（XZ 平面 2D 投影檢測）
-        for drum in self.drums:
-            drum_x, drum_y, drum_z = drum["x"], drum["y"], drum["z"]
-            radius = drum["radius"]
-            
-            # 計算鼓棒尖端與鼓中心在 XZ 平面上的 2D 距離（俯視圖）
-            dx = tip_x - drum_x
-            dz = tip_z - drum_z
-            distance_2d = math.sqrt(dx * dx + dz * dz)
-            
-            # 只要鼓棒尖端在鼓的 XZ 投影範圍內，就算打擊到
-            # 不考慮 Y 軸高度，讓擊中更容易
-            if distance_2d <= radius:
-                # 碰撞發生！計算調整後的 pitch 讓鼓棒尖端停在鼓面上
-                
-                # 計算鼓面高度
-                is_cymbal = "Symbal" in drum["name"] or "Ride" in drum["name"] or "Hihat" in drum["name"]
-                if is_cymbal:
-                    drum_height = 0.05  # 鈸很薄
-                elif drum["name"] == "Tom_floor":
-                    drum_height = 1.0   # 落地鼓較長
-                else:
-                    drum_height = 0.5   # 其他鼓的標準高度
-                
-                drum_top_y = drum_y + drum_height / 2
-                target_tip_y = drum_top_y + 0.03  # 鼓棒尖端停在鼓面上方 3cm
-                
-                # 計算需要的高度差
-                delta_y = target_tip_y - hand_y  # 從握把到目標高度的 Y 差
-                
-                # 使用反三角函數計算調整後的 pitch 角度
-                stick_length = cfg["STICK_LENGTH"]
-                if abs(delta_y) <= stick_length:
-                    rotation_x = math.asin(-delta_y / stick_length)
-                    adjusted_pitch = rotation_x / (math.pi / 3) * 45
-                else:
-                    adjusted_pitch = pitch  # 如果算不出來，保持原角度
-                
-                return {
-                    "drum_name": drum["name"],
-                    "adjusted_pitch": adjusted_pitch
-                }
+        # 只要鼓棒尖端在鼓的 XZ 投影範圍內，就算打擊到（不考慮 Y 軸高度，讓擊中更容易）
+        index = zone_grid.lookup(tip_x, tip_z)
+        if index >= 0:
+            # 碰撞發生！計算調整後的 pitch 讓鼓棒尖端停在鼓面上
+            drum = cfg.drums[index]
+            return {
+                "drum_name": drum["name"],
+                "adjusted_pitch": self._adjust_pitch(cfg, drum, hand_y, pitch)
+            }
         
         # 如果沒有碰撞到任何鼓，返回原始 pitch
         return {"drum_name": None, "adjusted_pitch": pitch}
 
-# 創建全局實例
-drum_collision = DrumCollisionDetector()
+    def detect_hit_drum_swept(self, previous, current, hand="right"):
+        """
+        連續碰撞偵測：檢查鼓棒尖端從上一個樣本移動到目前樣本的整段路徑
+
+        detect_hit_drum 只看瞬間位置，快速揮擊在兩個樣本之間可能直接越過某個鼓；
+        這裡把兩個尖端位置連成 XZ 線段，找出第一個進入的鼓，並以線段比例內插接觸時間。
+
+        參數說明：
+        - previous, current: 相鄰兩個樣本的 (timestamp_ns, ax, pitch, yaw)
+        - hand: "right" 或 "left"
+
+        返回：
+        {
+            "drum_name": 第一個碰到的鼓名稱，沒碰到為 None,
+            "contact_time": 內插的接觸時間（ns），沒碰到為 None,
+            "adjusted_pitch": 接觸當下（內插的 pitch）讓鼓棒停在鼓面上的 pitch 角度
+        }
+        """
+        cfg, zone_grid, _, stick = self._state
+        t0, ax0, pitch0, yaw0 = previous
+        t1, ax1, pitch1, yaw1 = current
+        x0, _, z0 = self._calculate_stick_positions(stick, ax0, pitch0, yaw0, hand)[3:]
+        x1, _, z1 = self._calculate_stick_positions(stick, ax1, pitch1, yaw1, hand)[3:]
+        index, s = zone_grid.sweep(x0, z0, x1, z1)
+        if index < 0:
+            return {"drum_name": None, "contact_time": None, "adjusted_pitch": pitch1}
+
+        pitch = pitch0 + (pitch1 - pitch0) * s
+        hand_y = cfg.GRIP_BASE_Y + pitch * cfg.PITCH_Y_FACTOR
+        drum = cfg.drums[index]
+        return {
+            "drum_name": drum["name"],
+            "contact_time": t0 + int((t1 - t0) * s),
+            "adjusted_pitch": self._adjust_pitch(cfg, drum, hand_y, pitch),
+        }
+
+    @staticmethod
+    def _calculate_stick_positions_batch(cfg, ax, pitch, yaw, hand="right"):
+        """_calculate_stick_positions 的 NumPy 向量化版本，所有輸入為相同長度的陣列"""
+        grip_x = cfg.GRIP_RIGHT_X if hand == "right" else cfg.GRIP_LEFT_X
+        threshold = cfg.PITCH_THRESHOLD
+        
+        hand_x = grip_x + (yaw / cfg.YAW_SENSITIVITY) * cfg.YAW_POSITION_FACTOR
+        hand_y = cfg.GRIP_BASE_Y + pitch * cfg.PITCH_Y_FACTOR
+        
+        depth_factor = (threshold - pitch) / 20
+        tilted = np.minimum(cfg.PITCH_Z_TILTED_MAX, depth_factor * cfg.PITCH_Z_TILTED_FACTOR)
+        flat = pitch * cfg.PITCH_Z_FLAT_FACTOR
+        hand_z = cfg.GRIP_BASE_Z + np.where(pitch < threshold, tilted, flat)
+        hand_z = hand_z + np.clip(np.abs(ax) * cfg.ACCEL_Z_FACTOR, -cfg.ACCEL_Z_MAX, cfg.ACCEL_Z_MAX)
+        hand_z = np.clip(hand_z, cfg.GRIP_Z_MIN, cfg.GRIP_Z_MAX)
+        
+        rotation_x = (pitch / 45) * (math.pi / 3)
+        rotation_y = (yaw / 45) * (math.pi / 6)
+        stick_length = cfg.STICK_LENGTH
+        cos_x = np.cos(rotation_x)
+        tip_x = hand_x + stick_length * np.sin(rotation_y) * cos_x
+        tip_y = hand_y + -stick_length * np.sin(rotation_x)
+        tip_z = hand_z + stick_length * np.cos(rotation_y) * cos_x
+        
+        return hand_x, hand_y, hand_z, tip_x, tip_y, tip_z
+    
+    def detect_hit_drum_batch(self, ax, pitch, yaw, hand="right"):
+        """
+        detect_hit_drum 的批次版本，一次處理整段錄製數據（離線重播、調整 3d_settings.js 用）
+        
+        參數說明：
+        - ax, pitch, yaw: 相同長度的 NumPy 陣列（或可轉為陣列的序列）
+        - hand: "right" 或 "left"
+        
+        返回：
+        (drum_indices, adjusted_pitch)
+        - drum_indices: int 陣列，self.drums 的索引，沒打到為 -1
+        - adjusted_pitch: float 陣列，與 detect_hit_drum 的 adjusted_pitch 相同（浮點誤差 < 1e-12）
+        """
+        ax = np.asarray(ax, dtype=np.float64)
+        pitch = np.asarray(pitch, dtype=np.float64)
+        yaw = np.asarray(yaw, dtype=np.float64)
+        
+        cfg, zone_grid, _, _ = self._state
+        _, hand_y, _, tip_x, _, tip_z = self._calculate_stick_positions_batch(cfg, ax, pitch, yaw, hand)
+        
+        drum_indices = zone_grid.lookup_batch(tip_x, tip_z)
+        adjusted_pitch = pitch.copy()
+        stick_length = cfg.STICK_LENGTH
+        
+        for index in np.unique(drum_indices[drum_indices >= 0]):
+            drum = cfg.drums[index]
+            hit = drum_indices == index
+            target_tip_y = drum["y"] + self._drum_height(drum["name"]) / 2 + 0.03
+            delta_y = target_tip_y - hand_y[hit]
+            reachable = np.abs(delta_y) <= stick_length
+            rotation_x = np.arcsin(np.where(reachable, -delta_y / stick_length, 0.0))
+            adjusted_pitch[hit] = np.where(reachable, rotation_x / (math.pi / 3) * 45, pitch[hit])
+        
+        return drum_indices, adjusted_pitch
+
+    def detect_hit_drum_swept_batch(self, timestamps, ax, pitch, yaw, hand="right"):
+        """
+        detect_hit_drum_swept 的批次版本：一次處理一整段連續樣本
+
+        參數說明：
+        - timestamps: 奈秒時間戳（int 陣列）
+        - ax, pitch, yaw: 相同長度的陣列
+        - hand: "right" 或 "left"
+
+        返回：
+        (drum_indices, contact_times)
+        - drum_indices: 第 i 筆為樣本 i-1 → i 路徑上第一個碰到的鼓（self.drums 的索引，沒碰到為 -1）；
+          第 0 筆沒有上一個樣本，只檢查瞬間位置
+        - contact_times: 內插的接觸時間（int64 奈秒，沒碰到為 -1）
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        ax = np.asarray(ax, dtype=np.float64)
+        pitch = np.asarray(pitch, dtype=np.float64)
+        yaw = np.asarray(yaw, dtype=np.float64)
+
+        cfg, zone_grid, _, _ = self._state
+        _, _, _, tip_x, _, tip_z = self._calculate_stick_positions_batch(cfg, ax, pitch, yaw, hand)
+        start_x = np.concatenate((tip_x[:1], tip_x[:-1]))
+        start_z = np.concatenate((tip_z[:1], tip_z[:-1]))
+        start_t = np.concatenate((timestamps[:1], timestamps[:-1]))
+        drum_indices, s = zone_grid.sweep_batch(start_x, start_z, tip_x, tip_z)
+        hit = drum_indices >= 0
+        offsets = (timestamps - start_t) * np.where(hit, s, 0.0)
+        contact_times = np.where(hit, start_t + offsets.astype(np.int64), -1)
+        return drum_indices, contact_times
+
+# 全局實例：import 時不解析 3d_settings.js，第一次使用時才建立
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    """取得（必要時建立）全局的 DrumCollisionDetector"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = DrumCollisionDetector()
+    return _detector
+
+
+def __getattr__(name):
+    # 相容舊的 from drum_collision import drum_collision
+    if name == "drum_collision":
+        return get_detector()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
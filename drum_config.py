@@ -0,0 +1,379 @@
+"""
+3d_settings.js 的編譯設定：安全運算式求值、磁碟快取與熱重載
+
+DrumConfig 只在 3d_settings.js 改變時重新解析，平常從 .drum_config_cache/ 的快取載入；
+ConfigWatcher 偵測到檔案修改後編譯新的設定，由呼叫端一次替換，不影響進行中的請求。
+"""
+import ast
+import glob
+import hashlib
+import json
+import math
+import operator
+import os
+import re
+import threading
+
+# 預設值（萬一讀取失敗）
+DEFAULTS = {
+    "GRIP_RIGHT_X": -0.6,
+    "GRIP_LEFT_X": 0.4,
+    "GRIP_BASE_Y": 1.0,
+    "GRIP_BASE_Z": -3.0,
+    "YAW_SENSITIVITY": 45,
+    "YAW_POSITION_FACTOR": 0.8,
+    "PITCH_THRESHOLD": 15,
+    "PITCH_Y_FACTOR": 0.003,
+    "PITCH_Z_TILTED_MAX": 2.0,
+    "PITCH_Z_TILTED_FACTOR": 1.5,
+    "PITCH_Z_FLAT_FACTOR": 0.005,
+    "ACCEL_Z_FACTOR": 0.02,
+    "ACCEL_Z_MAX": 0.3,
+    # 握把範圍：3d_settings.js 在 calculateGripRanges() 中由鼓的位置推算（函數內的常數不解析），
+    # 碰撞偵測一直使用以下固定值
+    "GRIP_Z_MIN": -2.0,
+    "GRIP_Z_MAX": -0.3,
+    "GRIP_RIGHT_X_MIN": -1.4,
+    "GRIP_RIGHT_X_MAX": -0.2,
+    "GRIP_LEFT_X_MIN": 0.3,
+    "GRIP_LEFT_X_MAX": 1.5,
+    "COLLISION_BUFFER": 0.05,
+    "STICK_LENGTH": 1.2,
+}
+
+# 備用硬編碼配置（以防載入失敗）
+DEFAULT_DRUMS = (
+    {"name": "Hihat", "x": 1.8, "y": 0.8, "z": -1, "radius": 0.65},
+    {"name": "Snare", "x": 0.5, "y": 0.4, "z": -1, "radius": 0.65},
+    {"name": "Tom_high", "x": 0.6, "y": 0.8, "z": 0.3, "radius": 0.5},
+    {"name": "Tom_mid", "x": -0.6, "y": 0.8, "z": 0.3, "radius": 0.5},
+    {"name": "Symbal", "x": 1.7, "y": 1.4, "z": 0.5, "radius": 0.80},
+    {"name": "Ride", "x": -1.8, "y": 1.4, "z": -0.1, "radius": 0.90},
+    {"name": "Tom_floor", "x": -1.2, "y": 0.2, "z": -1, "radius": 0.80},
+)
+
+CACHE_VERSION = 2
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".drum_config_cache")
+LEGACY_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")  # 舊版的快取位置
+WATCH_INTERVAL = 1.0  # 檢查檔案修改的間隔（秒）
+
+
+class DrumConfig:
+    """編譯後的鼓組設定（屬性存取，保留 cfg["NAME"] 的字典式寫法）"""
+
+    __slots__ = tuple(DEFAULTS) + ("drums", "source_hash")
+
+    def __init__(self, values=None, drums=DEFAULT_DRUMS, source_hash=None):
+        merged = dict(DEFAULTS)
+        if values:
+            merged.update({k: v for k, v in values.items() if k in DEFAULTS})
+        for name, value in merged.items():
+            setattr(self, name, float(value))
+        self.drums = tuple(dict(d) for d in drums)
+        self.source_hash = source_hash
+
+    def __getitem__(self, name):
+        if name == "drums":
+            return list(self.drums)
+        return getattr(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except AttributeError:
+            return default
+
+    def values(self):
+        return {name: getattr(self, name) for name in DEFAULTS}
+
+
+# ==================== 安全運算式求值 ====================
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+}
+_UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+_MATH_CONSTANTS = {"PI": math.pi, "E": math.e}
+_MATH_FUNCTIONS = {"min": min, "max": max, "abs": abs, "sqrt": math.sqrt,
+                   "sin": math.sin, "cos": math.cos, "floor": math.floor, "ceil": math.ceil}
+
+
+def safe_eval(expression, names=None):
+    """
+    計算 JS 常數運算式（只允許數字、字串、陣列、四則運算、Math.* 與已定義的常數）
+
+    無法求值時拋出 ValueError
+    """
+    names = names or {}
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"無法解析: {expression!r}") from e
+
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            return _BINARY_OPS[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            return _UNARY_OPS[type(node.op)](visit(node.operand))
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [visit(item) for item in node.elts]
+        if isinstance(node, ast.Name) and node.id in names:
+            return names[node.id]
+        if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+                and node.value.id == "Math" and node.attr in _MATH_CONSTANTS):
+            return _MATH_CONSTANTS[node.attr]
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == "Math"
+                and node.func.attr in _MATH_FUNCTIONS and not node.keywords):
+            return _MATH_FUNCTIONS[node.func.attr](*[visit(arg) for arg in node.args])
+        raise ValueError(f"不支援的運算式: {ast.dump(node)}")
+
+    try:
+        return visit(tree)
+    except (ArithmeticError, TypeError) as e:
+        raise ValueError(f"無法計算: {expression!r}") from e
+
+
+def _strip_comments(content):
+    """移除 // 註解（忽略字串內的 //）"""
+    lines = []
+    for line in content.split("\n"):
+        quote = None
+        for i, ch in enumerate(line):
+            if quote:
+                if ch == quote and line[i - 1] != "\\":
+                    quote = None
+            elif ch in "\"'":
+                quote = ch
+            elif line.startswith("//", i):
+                line = line[:i]
+                break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def parse_constants(content):
+    """依序解析所有 const 定義，後面的常數可以引用前面的常數"""
+    values = {}
+    for name, expression in re.findall(r'const\s+(\w+)\s*=\s*([^;]+);', _strip_comments(content)):
+        try:
+            values[name] = safe_eval(expression, values)
+        except ValueError:
+            pass  # 無法解析的值跳過（函數呼叫、物件等）
+    return values
+
+
+def parse_zones(content):
+    """解析 3d_settings.js 中的 zones 陣列，返回鼓的列表"""
+    # 找到 zones 陣列定義
+    start = content.find('const zones = [')
+    if start == -1:
+        raise ValueError("Cannot find zones definition")
+
+    end = content.find('];', start)
+    if end == -1:
+        raise ValueError("Cannot find zones end marker")
+
+    # 提取 zones 陣列內容（不包含 'const zones = ' 和最後的 '];'）
+    zones_content = _strip_comments(content[start + len('const zones = '):end + 1])
+
+    # 逐個物件處理，提取每個鼓的配置
+    drums = []
+    for body in re.findall(r'\{([^{}]*)\}', zones_content):
+        name = re.search(r'name\s*:\s*"([^"]*)"', body)
+        pos3d = re.search(r'pos3d\s*:\s*(\[[^\]]*\])', body)
+        radius = re.search(r'radius\s*:\s*([^,\n]+)', body)
+        if not (name and pos3d and radius):
+            continue
+        x, y, z = safe_eval(pos3d.group(1))
+        drums.append({
+            "name": name.group(1),
+            "x": x,
+            "y": y,
+            "z": z,
+            "radius": safe_eval(radius.group(1)),
+        })
+
+    if not drums:
+        raise ValueError("No drums found in zones array")
+    return drums
+
+
+def parse_sound_files(content):
+    """解析 SOUND_FILES 物件，返回 {鼓名稱: URL 路徑}"""
+    match = re.search(r'const\s+SOUND_FILES\s*=\s*\{([^}]*)\}', _strip_comments(content))
+    if match is None:
+        return {}
+    return dict(re.findall(r'"(\w+)"\s*:\s*"([^"]+)"', match.group(1)))
+
+
+def compile_config(content, source_hash=None):
+    """把 3d_settings.js 的內容編譯為 DrumConfig"""
+    values = parse_constants(content)
+    try:
+        drums = parse_zones(content)
+    except ValueError as e:
+        print(f"[DrumCollision] Failed to parse zones: {e}")
+        drums = list(DEFAULT_DRUMS)
+
+    numeric = {k: v for k, v in values.items()
+               if k in DEFAULTS and isinstance(v, (int, float))}
+    return DrumConfig(numeric, drums, source_hash)
+
+
+# ==================== 磁碟快取 ====================
+
+def _cache_path(config_path):
+    key = hashlib.sha1(os.path.abspath(config_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"drum_config_{key}.json")
+
+
+def _read_cache(config_path):
+    try:
+        with open(_cache_path(config_path), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _prune_cache(keep):
+    """
+    刪除過期的快取：設定檔已不存在、版本不符或寫入中斷留下的 .tmp，以及舊版放在 __pycache__ 的快取
+
+    參數說明：
+    - keep: 剛寫入的快取路徑（不刪除）
+    """
+    stale = glob.glob(os.path.join(CACHE_DIR, "drum_config_*.tmp"))
+    stale += glob.glob(os.path.join(LEGACY_CACHE_DIR, "drum_config_*.json"))
+    for path in glob.glob(os.path.join(CACHE_DIR, "drum_config_*.json")):
+        if path == keep:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            stale.append(path)
+            continue
+        if cache.get("version") != CACHE_VERSION or not os.path.exists(cache.get("source", "")):
+            stale.append(path)
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_cache(config_path, stat, config):
+    cache = {
+        "version": CACHE_VERSION,
+        "source": os.path.abspath(config_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": config.source_hash,
+        "values": config.values(),
+        "drums": list(config.drums),
+    }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = _cache_path(config_path) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, _cache_path(config_path))
+    except OSError:
+        return  # 快取寫入失敗不影響使用
+    _prune_cache(_cache_path(config_path))
+
+
+def load_config(config_path):
+    """
+    載入 3d_settings.js 的編譯設定
+
+    快取以檔案的 mtime/大小為第一層比對，內容 SHA-1 為第二層比對；
+    兩者都不符合時才重新解析並更新快取。
+    """
+    try:
+        stat = os.stat(config_path)
+    except OSError as e:
+        print(f"[DrumCollision] Failed to load config: {e}")
+        return DrumConfig()
+
+    cache = _read_cache(config_path)
+    if cache and cache["mtime_ns"] == stat.st_mtime_ns and cache["size"] == stat.st_size:
+        return DrumConfig(cache["values"], cache["drums"], cache["hash"])
+
+    with open(config_path, "rb") as f:
+        raw = f.read()
+    source_hash = hashlib.sha1(raw).hexdigest()
+    if cache and cache["hash"] == source_hash:
+        config = DrumConfig(cache["values"], cache["drums"], source_hash)
+    else:
+        config = compile_config(raw.decode("utf-8"), source_hash)
+        print(f"[DrumCollision] Loaded config from {config_path}")
+        print(f"  - {len(config.drums)} drums")
+        print(f"  - PITCH_THRESHOLD = {config.PITCH_THRESHOLD}")
+        print(f"  - YAW_POSITION_FACTOR = {config.YAW_POSITION_FACTOR}")
+        print(f"  - GRIP_BASE_Z = {config.GRIP_BASE_Z}")
+    _write_cache(config_path, stat, config)
+    return config
+
+
+class ConfigWatcher:
+    """
+    定期檢查 3d_settings.js 是否被修改，修改時呼叫 on_change(new_config)
+
+    編譯在監看執行緒中完成，呼叫端只需要做一次參考替換。
+    """
+
+    def __init__(self, config_path, on_change, interval=WATCH_INTERVAL):
+        self.config_path = config_path
+        self.on_change = on_change
+        self.interval = interval
+        self._last_stat = self._stat()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.config_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def check(self):
+        """檢查一次；檔案有變化時重新載入並返回 True"""
+        stat = self._stat()
+        if stat is None or stat == self._last_stat:
+            return False
+        self._last_stat = stat
+        try:
+            config = load_config(self.config_path)
+        except Exception as e:
+            print(f"[DrumCollision] Reload failed, keeping previous config: {e}")
+            return False
+        self.on_change(config)
+        return True
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
@@ -1,7 +1,11 @@
+import argparse
 import time
-import json
 from datetime import datetime
-import mpu6050
+
+import numpy as np
+
+from mpu6050_fifo import MPU6050FIFO
+from sensor_recording import RecordingWriter, EXTENSION
 
 # 鼓的位置列表
 drum_positions = [
@@ -14,75 +18,98 @@ drum_positions = [
     "Tom_floor"
 ]
 
-# 初始化 MPU6050 感測器
-sensor = mpu6050.mpu6050(0x69)
+# 預設目標採樣率（Hz）與每個位置的收集時間（秒）
+DEFAULT_RATE = 200
+DEFAULT_DURATION = 10
+
+# 初始化 MPU6050 感測器（單次區塊讀取 accel / temp / gyro）
+sensor = MPU6050FIFO(0x69)
+
+def collect_sensor_data(writer, position, duration=DEFAULT_DURATION, rate=DEFAULT_RATE):
+    """
+    以單調時鐘的截止時間排程收集數據，每筆直接寫入錄製檔
+
+    每個週期的截止時間固定為 start + k * period，讀取花費的時間不會累積成漂移；
+    錯過的截止時間直接跳過並計入 dropped。
 
-def collect_sensor_data(duration=10):
-    """收集指定時間的感測器數據"""
-    data = []
+    返回：
+    {"count", "rate", "jitter_ms", "max_jitter_ms", "dropped"}
+    """
+    period = 1.0 / rate
+    sample_times = []
+    dropped = 0
     
-    start_time = time.time()
-    while time.time() - start_time < duration:
+    # 寫入檔案的時間戳以單調時鐘推算，避免 NTP 調整造成跳動
+    wall_start = time.time()
+    start_time = time.monotonic()
+    next_deadline = start_time
+    while True:
+        now = time.monotonic()
+        if now - start_time >= duration:
+            break
         try:
-            # 讀取加速度計數據
-            accelerometer_data = sensor.get_accel_data()
-            
-            # 讀取陀螺儀數據
-            gyroscope_data = sensor.get_gyro_data()
-            
-            # 讀取溫度
-            temperature = sensor.get_temp()
-            
-            # 組合數據
-            sensor_reading = {
-                'timestamp': time.time(),
-                'accelerometer': accelerometer_data,
-                'gyroscope': gyroscope_data,
-                'temperature': temperature
-            }
-            
-            data.append(sensor_reading)
-            
-            # 等待 0.05 秒（與 mpu6050_test.py 相同的採樣率）
-            time.sleep(0.05)
-            
+            ax, ay, az, gx, gy, gz, temperature = sensor.read_all()
+            writer.append(position, wall_start + (now - start_time),
+                          ax, ay, az, gx, gy, gz, temperature)
+            sample_times.append(now)
         except Exception as e:
             print(f"讀取感測器錯誤: {e}")
-            continue
+        
+        next_deadline += period
+        now = time.monotonic()
+        if now > next_deadline:
+            # 已錯過截止時間：跳到下一個未來的截止時間
+            missed = int((now - next_deadline) // period) + 1
+            dropped += missed
+            next_deadline += missed * period
+        time.sleep(max(0.0, next_deadline - time.monotonic()))
     
-    return data
+    elapsed = time.monotonic() - start_time
+    intervals = np.diff(sample_times) if len(sample_times) > 1 else np.zeros(1)
+    return {
+        "count": len(sample_times),
+        "rate": len(sample_times) / elapsed if elapsed > 0 else 0.0,
+        "jitter_ms": float(np.std(intervals)) * 1000,
+        "max_jitter_ms": float(np.max(np.abs(intervals - period))) * 1000,
+        "dropped": dropped,
+    }
 
 def main():
-    print("=== 鼓棒感測器數據收集程式 ===")
-    print("準備開始收集數據...\n")
+    parser = argparse.ArgumentParser(description="鼓棒感測器數據收集程式")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="目標採樣率（Hz）")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="每個位置的收集時間（秒）")
+    args = parser.parse_args()
     
-    all_data = {}
-    
-    for position in drum_positions:
-        print(f"請用左右手敲擊 {position} 10秒")
-        print("按 Enter 開始收集...")
-        input()
-        
-        print(f"正在收集 {position} 數據... (10秒)")
-        sensor_data = collect_sensor_data(duration=10)
-        all_data[position] = sensor_data
-        
-        print(f"✓ {position} 數據收集完成 (共 {len(sensor_data)} 筆)\n")
+    print("=== 鼓棒感測器數據收集程式 ===")
+    print(f"目標採樣率 {args.rate:.0f} Hz，準備開始收集數據...\n")
     
-    # 儲存數據
+    # 錄製檔在開始時建立，採集期間逐筆附加寫入
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"drum_sensor_data_{timestamp}.json"
+    filename = f"drum_sensor_data_{timestamp}{EXTENSION}"
+    all_stats = {}
     
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, indent=2, ensure_ascii=False)
+    with RecordingWriter(filename, drum_positions, time.time()) as writer:
+        for position in drum_positions:
+            print(f"請用左右手敲擊 {position} {args.duration:.0f}秒")
+            print("按 Enter 開始收集...")
+            input()
+            
+            print(f"正在收集 {position} 數據... ({args.duration:.0f}秒)")
+            stats = collect_sensor_data(writer, position, duration=args.duration, rate=args.rate)
+            all_stats[position] = stats
+            writer.flush()
+            
+            print(f"✓ {position} 數據收集完成 (共 {stats['count']} 筆)")
+            print(f"  實際採樣率 {stats['rate']:.1f} Hz，抖動 {stats['jitter_ms']:.2f} ms "
+                  f"(最大 {stats['max_jitter_ms']:.2f} ms)，錯過截止時間 {stats['dropped']} 次\n")
     
     print(f"\n=== 數據收集完成 ===")
     print(f"檔案已儲存: {filename}")
     print(f"總共收集 {len(drum_positions)} 個位置的數據")
     
     # 顯示統計資訊
-    for pos, data in all_data.items():
-        print(f"  {pos}: {len(data)} 筆數據")
+    for pos, stats in all_stats.items():
+        print(f"  {pos}: {stats['count']} 筆數據, {stats['rate']:.1f} Hz, 錯過 {stats['dropped']} 次")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
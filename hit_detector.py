@@ -0,0 +1,231 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+from metrics import counter, histogram
+
+# 敲擊門檻預設值（與原本 app.py 的判斷相同）；hit_thresholds.json 中有調整過的門檻時以該檔為準
+GYRO_THRESHOLD = 50      # |gy| 超過此值視為向下揮動（°/s）
+ACCEL_THRESHOLD = 0.5    # |az| 或 |ax| 超過此值視為有加速度
+
+# 峰值偵測設定
+PEAK_RELEASE_RATIO = 0.7  # |gy| 降到峰值的 70% 以下時確認峰值
+REFRACTORY_PERIOD = 0.08  # 每次敲擊後的不應期（秒），避免同一擊重複觸發
+REFRACTORY_NS = int(REFRACTORY_PERIOD * 1e9)
+VELOCITY_FULL_SCALE = 250.0  # 力度 1.0 對應的 |gy|（陀螺儀量程 ±250°/s）
+
+EVENT_QUEUE_SIZE = 256
+
+# 狀態機狀態
+IDLE = "idle"
+SWINGING = "swinging"
+REFRACTORY = "refractory"
+
+
+def is_hit_sample(ax, az, gy, gyro_threshold=GYRO_THRESHOLD, accel_threshold=ACCEL_THRESHOLD):
+    """單一樣本的敲擊條件（電平判斷；門檻可用 threshold_tuner.py 依每隻手調整）"""
+    is_downward_swing = abs(gy) > gyro_threshold  # Y軸角速度絕對值，向下揮動
+    has_acceleration = abs(az) > accel_threshold or abs(ax) > accel_threshold  # 任意方向加速度
+    return is_downward_swing and has_acceleration
+
+
+class _HandState:
+    """單手的狀態機資料"""
+
+    def __init__(self, gyro_threshold=GYRO_THRESHOLD, accel_threshold=ACCEL_THRESHOLD):
+        self.gyro_threshold = gyro_threshold
+        self.accel_threshold = accel_threshold
+        self.state = IDLE
+        self.peak_gy = 0.0
+        self.peak_sample = None
+        self.peak_previous = None    # 峰值前一個樣本（連續碰撞偵測的線段起點）
+        self.refractory_until = 0.0
+        self.history = deque()   # 分類器用的最近樣本（只在有分類器時保留）
+        self.last_sample = None      # 上一個樣本（預測器估計下一個樣本何時到達、峰值線段的起點）
+        self.predicted = False       # 這次揮擊已由預測器發出事件
+
+
+class HitDetector:
+    """
+    伺服器端敲擊事件引擎：每個感測器樣本都經過各手的狀態機
+
+    IDLE → (超過門檻) → SWINGING（追蹤 |gy| 峰值）
+         → (|gy| 回落) → 發出一個敲擊事件 → REFRACTORY → IDLE
+
+    每次揮擊只產生一個帶時間戳的事件，並放入有上限的事件佇列。
+    事件的 timestamp 為峰值樣本讀取當下的 time.monotonic_ns()（預測的事件為預測的撞擊時間），
+    latency_ns 為峰值讀取到事件產生的延遲（含等待 |gy| 回落的偵測延遲與分類/碰撞計算）；
+    樣本時間戳不是 time.monotonic_ns()（clock=None，例如重播錄製檔）時為 None，也不計入指標。
+
+    參數說明：
+    - collision: DrumCollisionDetector，用峰值前一個樣本到峰值的尖端路徑判斷打到哪個鼓
+    - hands: 只處理這些通道的樣本（None 為全部）
+    - classifier: DrumClassifier（可為 None）；設定時以峰值前的感測器視窗判斷鼓，
+      分類器失敗時退回幾何判斷
+    - predictor: HitPredictor（可為 None）；設定時在撞擊前就發出事件（predicted 為 True，
+      timestamp 為預測的撞擊時間），同一次揮擊回落時不再重複發出
+    - thresholds: {手: (gyro_threshold, accel_threshold)}（threshold_tuner.load_thresholds() 的結果），
+      沒有列出的手使用 GYRO_THRESHOLD / ACCEL_THRESHOLD
+    - clock: 與樣本時間戳同一時鐘的現在時間（奈秒）；錄製檔的相對時間戳請傳 None（不計算 latency_ns）
+    """
+
+    def __init__(self, collision, queue_size=EVENT_QUEUE_SIZE, hands=None, classifier=None, predictor=None,
+                 thresholds=None, clock=time.monotonic_ns):
+        self.collision = collision
+        self.clock = clock
+        self.classifier = classifier
+        self.predictor = predictor
+        self.thresholds = dict(thresholds or {})
+        self.hands = frozenset(hands) if hands is not None else None
+        self._states = {}
+        self._events = deque(maxlen=queue_size)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        # 每個事件都會呼叫的 listener(event)，例如伺服器端音效引擎
+        self._listeners = []
+        self._collision_histogram = histogram("drum_stage_seconds", stage="collision", channel="hit_events")
+        self._latency_histogram = histogram("drum_hit_latency_seconds")
+
+    def thresholds_for(self, hand):
+        """該手的 (gyro_threshold, accel_threshold)"""
+        return self.thresholds.get(hand, (GYRO_THRESHOLD, ACCEL_THRESHOLD))
+
+    def add_listener(self, callback):
+        """註冊事件產生時立即呼叫的 callback(event)（在採樣執行緒中執行，應盡快返回）"""
+        self._listeners.append(callback)
+
+    def process(self, hand, sample):
+        """
+        處理一個樣本（可直接註冊為 SensorSampler 的 listener）
+
+        參數說明：
+        - sample: (timestamp_ns, roll, pitch, yaw, ax, ay, az, gx, gy, gz)
+
+        返回：
+        產生的事件 dict，沒有則為 None
+        """
+        state = self._states.get(hand)
+        if state is None:
+            if self.hands is not None and hand not in self.hands:
+                return None
+            state = self._states[hand] = _HandState(*self.thresholds_for(hand))
+
+        timestamp = sample[0]
+        ax, az, gy = sample[4], sample[6], sample[8]
+        previous, state.last_sample = state.last_sample, sample
+
+        if self.classifier is not None:
+            # 保留峰值前一個視窗的樣本（多留一個週期供內插）
+            history = state.history
+            if history and timestamp < history[-1][0]:
+                history.clear()   # 時間倒退（例如重播檔換段）：舊樣本不再相關
+            history.append(sample)
+            horizon = timestamp - int((self.classifier.span + self.classifier.period) * 1e9)
+            while history[0][0] < horizon:
+                history.popleft()
+
+        if state.state == REFRACTORY:
+            if timestamp < state.refractory_until:
+                return None
+            state.state = IDLE
+
+        if self.predictor is not None:
+            if not state.predicted and previous is not None and timestamp > previous[0]:
+                prediction = self.predictor.predict(hand, sample, timestamp - previous[0])
+                if prediction is not None:
+                    # 撞擊前發出事件；狀態機照常追蹤這次揮擊的峰值，回落時只進入不應期
+                    state.predicted = True
+                    if state.state == IDLE:
+                        state.state = SWINGING
+                        state.peak_gy = 0.0
+                    if abs(gy) > state.peak_gy:
+                        state.peak_gy = abs(gy)
+                        state.peak_sample = sample
+                        state.peak_previous = previous
+                    return self._emit(hand, sample, abs(gy), state.history, prediction)
+
+        if state.state == IDLE:
+            if is_hit_sample(ax, az, gy, state.gyro_threshold, state.accel_threshold):
+                state.state = SWINGING
+                state.peak_gy = abs(gy)
+                state.peak_sample = sample
+                state.peak_previous = previous
+            return None
+
+        # SWINGING：持續追蹤峰值，回落後才發出事件
+        if abs(gy) > state.peak_gy:
+            state.peak_gy = abs(gy)
+            state.peak_sample = sample
+            state.peak_previous = previous
+            return None
+        if abs(gy) >= state.peak_gy * PEAK_RELEASE_RATIO and abs(gy) > state.gyro_threshold:
+            return None
+
+        event = None
+        if state.predicted:
+            state.predicted = False
+        else:
+            event = self._emit(hand, state.peak_sample, state.peak_gy, state.history,
+                               previous=state.peak_previous)
+        state.state = REFRACTORY
+        state.refractory_until = state.peak_sample[0] + REFRACTORY_NS
+        state.peak_sample = state.peak_previous = None
+        return event
+
+    def _emit(self, hand, sample, peak_gy, history=(), prediction=None, previous=None):
+        """
+        參數說明：
+        - prediction: 預測器的 (撞擊時間 ns, 鼓名稱)，None 為反應式事件
+        - previous: 峰值前一個樣本；有的話以這段路徑做連續碰撞偵測（快速揮擊不會越過鼓）
+        """
+        _, _, pitch, yaw, ax = sample[:5]
+        drum = None
+        with self._collision_histogram.time():
+            recent = [s for s in history if s[0] <= sample[0]]
+            if self.classifier is not None and recent:
+                try:
+                    drum = self.classifier.classify_samples(recent)
+                except Exception as e:
+                    print(f"[HitDetector] 分類器錯誤: {e}")
+            if drum is None and prediction is not None:
+                drum = prediction[1]
+            if drum is None and previous is not None and previous[0] < sample[0]:
+                drum = self.collision.detect_hit_drum_swept(
+                    (previous[0], previous[4], previous[2], previous[3]), (sample[0], ax, pitch, yaw),
+                    hand=hand)["drum_name"]
+            elif drum is None:
+                drum = self.collision.detect_hit_drum(ax, pitch, yaw, hand=hand)["drum_name"]
+        counter("drum_hit_events_total", hand=hand).inc()
+        if prediction is not None:
+            counter("drum_hit_predicted_total", hand=hand).inc()
+        latency_ns = None
+        if self.clock is not None:
+            latency_ns = self.clock() - sample[0]
+            self._latency_histogram.observe(latency_ns * 1e-9)
+        with self._lock:
+            seq = next(self._seq)
+            event = {
+                "seq": seq,
+                "hand": hand,
+                "drum": drum,
+                "velocity": min(1.0, peak_gy / VELOCITY_FULL_SCALE),
+                "timestamp": sample[0] if prediction is None else prediction[0],
+                "latency_ns": latency_ns,
+                "predicted": prediction is not None,
+            }
+            self._events.append(event)
+            self.last_seq = seq
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"[HitDetector] listener 錯誤: {e}")
+        return event
+
+    def events_since(self, seq):
+        """取得序號大於 seq 的事件（由舊到新），佇列已丟棄的舊事件不會返回"""
+        if seq >= self.last_seq:
+            return []
+        return [event for event in list(self._events) if event["seq"] > seq]
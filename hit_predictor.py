@@ -0,0 +1,186 @@
+"""
+預測式敲擊偵測：由 pitch 角速度估計鼓棒尖端到達鼓面的時間，在撞擊之前發出敲擊事件
+
+反應式偵測（hit_detector.py）要等 |gy| 越過峰值、回落後才發出事件，之後還有輸出端
+（音效卡緩衝、瀏覽器收到事件到解碼發聲）的延遲，聲音總是比鼓棒落下晚。
+預測器在每個向下揮擊（gy > MIN_PITCH_RATE，pitch 增加時鼓棒尖端往下）的樣本：
+
+1. DrumCollisionDetector.predict_contact 找出尖端會碰到的鼓面與接觸角度
+   （鼓面高度與 detect_hit_drum 相同：鈸 0.05、落地鼓 1.0、其他 0.5）
+2. gy 就是 pitch 角速度（°/s），以目前的角速度外推到達接觸角度的時間
+3. 等下一個樣本再發出就來不及在撞擊當下發聲時（撞擊前剩餘時間 - 輸出延遲 < 樣本間隔），
+   立即發出事件，timestamp 為預測的撞擊時間；AudioEngine 會等到「撞擊時間 - 輸出延遲」才開始發聲
+
+每次揮擊最多預測一次；預測過的揮擊在 |gy| 回落時不再發出反應式事件，
+沒有預測到的揮擊（例如揮擊路徑上沒有鼓面）仍由反應式偵測補上。
+
+用法：
+    DRUM_PREDICT=1 python app.py                         # 啟用預測（輸出延遲取 AudioEngine，或 DRUM_OUTPUT_LATENCY_MS）
+    python hit_predictor.py drum_sensor_data.json         # 重播錄製檔，比較預測與反應式偵測
+    python hit_predictor.py drum_sensor_data.json --latency-ms 0 30 60
+"""
+import argparse
+import os
+
+from hit_detector import GYRO_THRESHOLD
+
+PREDICT_ENV = "DRUM_PREDICT"
+OUTPUT_LATENCY_ENV = "DRUM_OUTPUT_LATENCY_MS"
+
+DEFAULT_OUTPUT_LATENCY = 0.03   # 沒有伺服器端音效時的輸出延遲（秒）：瀏覽器收到事件到發聲
+MIN_PITCH_RATE = GYRO_THRESHOLD  # pitch 角速度（°/s）超過此值才視為向下揮擊
+MATCH_WINDOW = 0.2              # 評估用：預測之後多久內的反應式事件視為同一次敲擊（秒）
+
+
+class HitPredictor:
+    """
+    參數說明：
+    - collision: DrumCollisionDetector
+    - output_latency: 事件發出到實際發聲的延遲（秒），或返回秒數的函數（例如讀取 AudioEngine.output_latency）
+    - min_rate: 向下揮擊的最小 pitch 角速度（°/s）
+    """
+
+    def __init__(self, collision, output_latency=DEFAULT_OUTPUT_LATENCY, min_rate=MIN_PITCH_RATE):
+        self.collision = collision
+        self.output_latency = output_latency
+        self.min_rate = min_rate
+
+    def latency_ns(self):
+        latency = self.output_latency() if callable(self.output_latency) else self.output_latency
+        return int(latency * 1e9)
+
+    def predict(self, hand, sample, period_ns):
+        """
+        參數說明：
+        - sample: (timestamp_ns, roll, pitch, yaw, ax, ay, az, gx, gy, gz)
+        - period_ns: 與上一個樣本的間隔（下一個樣本大約多久後到達）
+
+        返回：
+        應該現在發出事件時為 (預測的撞擊時間 ns, 鼓名稱)，否則為 None
+        """
+        # 以目前角速度外推、不加角加速度：錄製數據的 gy 在 ±250°/s 飽和，
+        # 由相鄰樣本估計的角加速度雜訊大，加入後提早觸發但鼓的判斷變差
+        rate = sample[8]
+        if rate <= self.min_rate:
+            return None
+        pitch, yaw, ax = sample[2], sample[3], sample[4]
+        contact = self.collision.predict_contact(ax, pitch, yaw, hand=hand)
+        if contact["drum_name"] is None:
+            return None
+        time_to_impact_ns = int((contact["contact_pitch"] - pitch) / rate * 1e9)
+        if time_to_impact_ns - self.latency_ns() >= period_ns:
+            return None   # 下一個樣本再判斷仍來得及
+        return sample[0] + time_to_impact_ns, contact["drum_name"]
+
+
+def create_predictor(collision, output_latency=None):
+    """
+    依環境變數 DRUM_PREDICT 建立預測器（未設定或為 0 則返回 None）
+
+    參數說明：
+    - output_latency: 輸出延遲（秒或函數）；None 時讀取 DRUM_OUTPUT_LATENCY_MS（預設 30 ms）
+    """
+    if os.environ.get(PREDICT_ENV, "0") in ("", "0"):
+        return None
+    if output_latency is None:
+        output_latency = float(os.environ.get(OUTPUT_LATENCY_ENV, DEFAULT_OUTPUT_LATENCY * 1000)) / 1000
+        print(f"[HitPredictor] 預測式敲擊偵測，輸出延遲 {output_latency * 1000:.0f} ms")
+    else:
+        print("[HitPredictor] 預測式敲擊偵測，輸出延遲取自伺服器端音效")
+    return HitPredictor(collision, output_latency)
+
+
+# ==================== 重播評估 ====================
+def evaluate(path, output_latency=DEFAULT_OUTPUT_LATENCY, classifier=None):
+    """
+    重播錄製檔一次，同一串樣本同時送進反應式與預測式 HitDetector 比較
+
+    - 命中：預測事件之後 MATCH_WINDOW 內，反應式偵測也發出了事件（同一次敲擊）
+    - 節省的延遲：反應式事件發出的時間 - 預測事件發出的時間（錄製時間軸）
+    - 撞擊時間誤差：預測的撞擊時間 - 反應式事件的峰值時間
+
+    返回：
+    {"predicted", "matched", "precision", "recall", "drum_agreement", "saved_ms", "impact_error_ms",
+     "predicted_accuracy", "reactive_accuracy", "combined_accuracy", "reactive"}
+    """
+    import numpy as np
+
+    from drum_collision import get_detector
+    from hit_detector import HitDetector
+    from replay_sensor import run_benchmark
+
+    collision = get_detector()
+    reference = HitDetector(collision, classifier=classifier, clock=None)
+    reactive = []        # (發出時間 ns, 事件, 標籤)
+    predicted = []
+    current = {}
+
+    def on_sample(sample, label):
+        current["time"], current["label"] = sample[0], label
+        event = reference.process("left", sample)
+        if event is not None:
+            reactive.append((sample[0], event, label))
+
+    def on_hit(event):
+        if event["predicted"]:
+            predicted.append((current["time"], event, current["label"]))
+
+    result = run_benchmark(path, classifier, listeners=[on_hit],
+                           predictor=HitPredictor(collision, output_latency), on_sample=on_sample)
+
+    reactive_times = np.array([emitted for emitted, _, _ in reactive], dtype=np.int64)
+    window = int(MATCH_WINDOW * 1e9)
+    used = set()
+    saved, impact_error, agree = [], [], 0
+    for emitted, event, _ in predicted:
+        index = int(np.searchsorted(reactive_times, emitted))
+        if index < len(reactive) and index not in used and reactive_times[index] - emitted <= window:
+            used.add(index)
+            _, reference_event, _ = reactive[index]
+            saved.append((reactive_times[index] - emitted) / 1e6)
+            impact_error.append((event["timestamp"] - reference_event["timestamp"]) / 1e6)
+            agree += event["drum"] == reference_event["drum"]
+
+    def accuracy(events):
+        return sum(event["drum"] == label for _, event, label in events) / len(events) if events else 0.0
+
+    return {
+        "predicted": len(predicted),
+        "matched": len(used),
+        "reactive": len(reactive),
+        "precision": len(used) / len(predicted) if predicted else 0.0,
+        "recall": len(used) / len(reactive) if reactive else 0.0,
+        "drum_agreement": agree / len(used) if used else 0.0,
+        "saved_ms": float(np.mean(saved)) if saved else 0.0,
+        "impact_error_ms": float(np.mean(impact_error)) if impact_error else 0.0,
+        "predicted_accuracy": accuracy(predicted),
+        "reactive_accuracy": accuracy(reactive),
+        "combined_accuracy": result["accuracy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="預測式敲擊偵測的重播評估")
+    parser.add_argument("recording", nargs="?", default="drum_sensor_data.json")
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[DEFAULT_OUTPUT_LATENCY * 1000],
+                        help="假設的輸出延遲（可列出多個值比較）")
+    parser.add_argument("--classifier", help="DrumClassifier 模型（.npz），兩種偵測都用它判斷鼓")
+    args = parser.parse_args()
+
+    classifier = None
+    if args.classifier:
+        from drum_classifier import load_classifier
+        classifier = load_classifier(args.classifier)
+
+    print(f"{'輸出延遲':>8}{'預測':>6}{'命中':>6}{'精確率':>8}{'召回率':>8}{'鼓一致':>8}"
+          f"{'節省 ms':>9}{'撞擊誤差 ms':>12}{'預測準確率':>10}{'反應式':>8}{'合併':>8}")
+    for latency_ms in args.latency_ms:
+        r = evaluate(args.recording, latency_ms / 1000, classifier)
+        print(f"{latency_ms:>6.0f}ms{r['predicted']:>6}{r['matched']:>6}{r['precision']:>8.1%}{r['recall']:>8.1%}"
+              f"{r['drum_agreement']:>8.1%}{r['saved_ms']:>9.1f}{r['impact_error_ms']:>12.1f}"
+              f"{r['predicted_accuracy']:>12.1%}{r['reactive_accuracy']:>9.1%}{r['combined_accuracy']:>8.1%}")
+    print(f"（反應式偵測共 {r['reactive']} 次敲擊；準確率以錄製檔的鼓標籤為準）")
+
+
+if __name__ == "__main__":
+    main()
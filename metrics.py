@@ -0,0 +1,203 @@
+"""
+低成本的效能指標：計時器直方圖、計數器與量表，/metrics 以 Prometheus 文字格式輸出
+
+    from metrics import timer, counter
+
+    with timer("drum_stage_seconds", stage="filter", channel="left"):
+        ...
+    counter("drum_bus_lock_contention_total", bus="0").inc()
+
+熱路徑上先取得 Histogram 物件，之後每次用 histogram.time()，省去查表：
+記錄一次計時只需要兩次 perf_counter_ns、一次 bisect 與一個鎖，
+不需要的指標不會被建立，量表以 callback 在輸出時才讀取現有的統計值。
+"""
+import bisect
+import threading
+import time
+
+# 直方圖的上界（秒）：50 µs 到 1 s，適合 I2C、濾波與 HTTP 的延遲
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+HELP = {
+    "drum_stage_seconds": "各階段耗時（i2c_read、filter、collision、encode）",
+    "drum_bus_lock_wait_seconds": "等待 I2C 總線鎖的時間",
+    "drum_bus_lock_contention_total": "取得總線鎖時需要等待的次數",
+    "drum_http_request_seconds": "HTTP 請求處理時間",
+    "drum_sample_rate_hz": "各感測器實際採樣率",
+    "drum_bus_utilization_ratio": "I2C 總線佔用比例",
+    "drum_fifo_overflow_total": "感測器 FIFO 溢位（遺失樣本）次數",
+    "drum_sampler_overrun_total": "排程週期超時（跳過週期）次數",
+    "drum_sampler_late_slots_total": "時槽延遲超過一個時槽的次數",
+    "drum_read_errors_total": "感測器讀取失敗次數",
+    "drum_hit_events_total": "產生的敲擊事件數",
+    "drum_hit_latency_seconds": "峰值樣本讀取到敲擊事件產生的延遲（含偵測延遲）",
+    "drum_audio_latency_seconds": "敲擊到伺服器端音效發聲的延遲（含輸出緩衝）",
+    "drum_audio_voices": "目前發聲中的聲部數",
+    "drum_audio_stolen_voices_total": "超過聲部上限而被搶佔的次數",
+    "drum_stream_subscribers": "目前的 /stream 連線數",
+    "drum_stream_dropped_frames_total": "慢速連線被跳過的幀數（只送最新一幀）",
+    "drum_stream_dropped_events_total": "慢速連線落後過多而遺失的事件數",
+}
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class Gauge:
+    """量表：輸出時呼叫 callback 取值"""
+
+    __slots__ = ("callback",)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def samples(self, name, labels):
+        return [(name, labels, self.callback())]
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """計時用的 context manager"""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """由直方圖估計分位數（返回所在區間的上界）"""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        target = q * total
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, value_sum = list(self.counts), self.count, self.sum
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            result.append((name + "_bucket", labels + (("le", repr(bound)),), cumulative))
+        result.append((name + "_bucket", labels + (("le", "+Inf"),), total))
+        result.append((name + "_sum", labels, value_sum))
+        result.append((name + "_count", labels, total))
+        return result
+
+
+class _Timer:
+    __slots__ = ("histogram", "_start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter_ns() - self._start) * 1e-9)
+
+
+class Registry:
+    """指標登記表：同名稱 + 同標籤返回同一個物件"""
+
+    TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self._metrics = {}   # (name, labels) -> metric
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, labels, factory):
+        key = (name, tuple(sorted((key, str(value)) for key, value in labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = factory()
+        if not isinstance(metric, kind):
+            raise TypeError(f"指標 {name} 已登記為 {type(metric).__name__}")
+        return metric
+
+    def counter(self, name, **labels):
+        return self._get(Counter, name, labels, Counter)
+
+    def histogram(self, name, **labels):
+        return self._get(Histogram, name, labels, Histogram)
+
+    def gauge(self, name, callback, **labels):
+        """登記（或替換）量表的 callback"""
+        gauge = self._get(Gauge, name, labels, lambda: Gauge(callback))
+        gauge.callback = callback
+        return gauge
+
+    def timer(self, name, **labels):
+        return _Timer(self.histogram(name, **labels))
+
+    def render(self):
+        """Prometheus 文字格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            items = sorted(self._metrics.items(), key=lambda item: item[0])
+        lines = []
+        declared = set()
+        for (name, labels), metric in items:
+            if name not in declared:
+                declared.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {self.TYPES[type(metric)]}")
+            try:
+                samples = metric.samples(name, labels)
+            except Exception as e:
+                print(f"[Metrics] {name} 讀取失敗: {e}")
+                continue
+            for sample_name, sample_labels, value in samples:
+                lines.append(f"{sample_name}{_label_text(sample_labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+counter = METRICS.counter
+histogram = METRICS.histogram
+gauge = METRICS.gauge
+timer = METRICS.timer
+render = METRICS.render
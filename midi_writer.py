@@ -0,0 +1,271 @@
+"""
+敲擊事件 → 標準 MIDI 檔（SMF type 0），邊敲邊寫入，記憶體用量固定
+
+    writer = MidiHitWriter("session.mid")
+    hit_detector.add_listener(writer.on_hit)
+    ...
+    writer.close()
+
+- 音符位置取事件的 timestamp（峰值樣本讀取當下的 monotonic 奈秒），不是事件產生的時間，
+  因此可以離線與錄音比對敲擊的時間準確度
+- 解析度：TEMPO_US = 500000（120 BPM）、TICKS_PER_BEAT = 5000 → 每 tick 100 µs
+- 鼓對應 General MIDI 打擊樂音色（channel 10），力度 0~1 對應 1~127
+- 左右手的事件可能不照時間順序到達（偵測延遲不同），因此保留 REORDER_WINDOW 內的事件
+  排序後才寫入；堆積的事件有上限 MAX_PENDING，長時間錄製也不會累積在記憶體中
+- 每 FLUSH_INTERVAL 秒寫回一次並更新 track 長度，程式中途結束時檔案仍可讀取
+
+用法：
+    DRUM_MIDI=session.mid python app.py                          # 把所有敲擊事件寫入 MIDI
+    python midi_writer.py replay drum_sensor_data.json out.mid     # 重播錄製檔並輸出 MIDI
+    python midi_writer.py dump session.mid                         # 列出音符與敲擊間隔統計
+"""
+import argparse
+import heapq
+import itertools
+import os
+import struct
+import threading
+import time
+
+MIDI_ENV = "DRUM_MIDI"
+
+TEMPO_US = 500000            # 每拍微秒數（120 BPM）
+TICKS_PER_BEAT = 5000        # 每拍 tick 數 → 每 tick 100 µs
+NS_PER_TICK = TEMPO_US * 1000 // TICKS_PER_BEAT
+DRUM_CHANNEL = 9             # MIDI channel 10（0 起算為 9）：General MIDI 打擊樂
+NOTE_LENGTH = 0.05           # note off 在 note on 之後多久（秒）
+REORDER_WINDOW = 0.2         # 等待較晚到達事件的時間（秒）
+MAX_PENDING = 1024           # 尚未寫入的 MIDI 事件上限
+FLUSH_INTERVAL = 1.0         # 寫回檔案的間隔（秒）
+
+# 3d_settings.js 的鼓名稱 → General MIDI 打擊樂音符
+GM_DRUM_NOTES = {
+    "Kick": 36,
+    "Snare": 38,
+    "Tom_floor": 41,
+    "Hihat": 42,
+    "Tom_mid": 47,
+    "Symbal": 49,
+    "Tom_high": 50,
+    "Ride": 51,
+}
+DEFAULT_NOTE = 37            # 未知的鼓名稱（Side Stick）
+
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+
+
+def _vlq(value):
+    """MIDI 可變長度數值"""
+    buffer = [value & 0x7F]
+    value >>= 7
+    while value:
+        buffer.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(buffer))
+
+
+class MidiHitWriter:
+    """
+    參數說明：
+    - path: 輸出的 .mid 路徑
+    - start_ns: 時間零點（monotonic 奈秒）；None 時以第一個事件為零點
+    - notes: {鼓名稱: MIDI 音符}
+    """
+
+    def __init__(self, path, start_ns=None, notes=None):
+        self.path = path
+        self.start_ns = start_ns
+        self.notes = dict(GM_DRUM_NOTES if notes is None else notes)
+        self.event_count = 0
+        self.late_count = 0         # 超過 REORDER_WINDOW 才到達、被挪到目前位置的事件
+
+        self._file = open(path, "wb")
+        self._file.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, TICKS_PER_BEAT))
+        self._file.write(b"MTrk")
+        self._length_offset = self._file.tell()
+        self._file.write(struct.pack(">I", 0))
+        self._track_length = 0
+        self._last_tick = 0
+        self._pending = []                       # (時間 ns, 序號, MIDI 訊息) 的最小堆
+        self._order = itertools.count()
+        self._newest_ns = None
+        self._next_flush = time.monotonic() + FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self.closed = False
+
+        self._write_event(0, b"\xff\x51\x03" + TEMPO_US.to_bytes(3, "big"))
+        self._write_event(0, b"\xff\x03" + _vlq(len(b"IOT Drum Stick")) + b"IOT Drum Stick")
+
+    def _write_event(self, tick, message):
+        data = _vlq(max(0, tick - self._last_tick)) + message
+        self._last_tick = max(self._last_tick, tick)
+        self._file.write(data)
+        self._track_length += len(data)
+
+    def _tick(self, timestamp_ns):
+        return max(0, (timestamp_ns - self.start_ns) // NS_PER_TICK)
+
+    def _drain(self, until_ns):
+        """寫入時間早於 until_ns 的事件（None 為全部）"""
+        pending = self._pending
+        while pending and (until_ns is None or pending[0][0] <= until_ns or len(pending) > MAX_PENDING):
+            timestamp_ns, _, message = heapq.heappop(pending)
+            tick = self._tick(timestamp_ns)
+            if tick < self._last_tick:
+                self.late_count += 1
+            self._write_event(tick, message)
+
+    def add_hit(self, drum, velocity, timestamp_ns):
+        """加入一次敲擊（drum 為 None 時略過）"""
+        if drum is None:
+            return
+        note = self.notes.get(drum, DEFAULT_NOTE)
+        midi_velocity = max(1, min(127, round(velocity * 127)))
+        with self._lock:
+            if self.closed:
+                return
+            if self.start_ns is None:
+                self.start_ns = timestamp_ns
+            heapq.heappush(self._pending, (timestamp_ns, next(self._order),
+                                           bytes((NOTE_ON | DRUM_CHANNEL, note, midi_velocity))))
+            heapq.heappush(self._pending, (timestamp_ns + int(NOTE_LENGTH * 1e9), next(self._order),
+                                           bytes((NOTE_OFF | DRUM_CHANNEL, note, 0))))
+            self.event_count += 1
+            if self._newest_ns is None or timestamp_ns > self._newest_ns:
+                self._newest_ns = timestamp_ns
+            self._drain(self._newest_ns - int(REORDER_WINDOW * 1e9))
+            if time.monotonic() >= self._next_flush:
+                self._flush()
+
+    def on_hit(self, event):
+        """HitDetector 的 listener"""
+        self.add_hit(event["drum"], event["velocity"], event["timestamp"])
+
+    def _flush(self):
+        # 更新 track 長度後寫回，檔案在任何時刻都能被讀取（缺少結尾的 end-of-track）
+        end = self._file.tell()
+        self._file.seek(self._length_offset)
+        self._file.write(struct.pack(">I", self._track_length))
+        self._file.seek(end)
+        self._file.flush()
+        self._next_flush = time.monotonic() + FLUSH_INTERVAL
+
+    def close(self):
+        """寫入剩餘事件與 end-of-track 並關閉檔案（重複呼叫無作用）"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._drain(None)
+            self._write_event(self._last_tick, b"\xff\x2f\x00")
+            self._flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def create_midi_writer(path=None):
+    """依環境變數 DRUM_MIDI 建立寫入器（未設定則返回 None），程式結束時自動關閉"""
+    path = path or os.environ.get(MIDI_ENV)
+    if not path:
+        return None
+    import atexit
+
+    writer = MidiHitWriter(path, start_ns=time.monotonic_ns())
+    atexit.register(writer.close)
+    print(f"[MidiWriter] 敲擊事件寫入 {path}")
+    return writer
+
+
+def read_hits(path):
+    """
+    讀取 MIDI 檔中的 note on（支援本模組寫出的 type 0 檔，以及缺少 end-of-track 的未完成檔）
+
+    返回：
+    [(秒, 音符, 力度), ...]
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"MThd":
+        raise ValueError(f"{path} 不是 MIDI 檔")
+    _, _, _, division = struct.unpack_from(">IHHH", data, 4)
+    position = 14
+    tempo = TEMPO_US
+    hits = []
+    while position + 8 <= len(data):
+        chunk, length = data[position:position + 4], struct.unpack_from(">I", data, position + 4)[0]
+        position += 8
+        end = min(len(data), position + length)
+        if chunk != b"MTrk":
+            position = end
+            continue
+        ticks, status = 0, 0
+        seconds = 0.0
+        while position < end:
+            delta = 0
+            while True:
+                byte = data[position]
+                position += 1
+                delta = (delta << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            ticks += delta
+            seconds += delta * tempo / 1e6 / division
+            if data[position] >= 0x80:
+                status = data[position]
+                position += 1
+            if status == 0xFF:
+                meta, length = data[position], data[position + 1]
+                if meta == 0x51:
+                    tempo = int.from_bytes(data[position + 2:position + 5], "big")
+                position += 2 + length
+            elif status & 0xF0 in (0x80, 0x90, 0xA0, 0xB0, 0xE0):
+                note, velocity = data[position], data[position + 1]
+                position += 2
+                if status & 0xF0 == NOTE_ON and velocity > 0:
+                    hits.append((seconds, note, velocity))
+            else:
+                position += 1
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="敲擊事件 MIDI 輸出")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay_parser = sub.add_parser("replay", help="重播錄製檔並把敲擊事件寫成 MIDI")
+    replay_parser.add_argument("recording")
+    replay_parser.add_argument("out")
+    dump_parser = sub.add_parser("dump", help="列出 MIDI 檔的音符與敲擊間隔")
+    dump_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        from replay_sensor import run_benchmark
+
+        with MidiHitWriter(args.out) as writer:
+            result = run_benchmark(args.recording, listeners=[writer.on_hit])
+        print(f"{writer.event_count} 次敲擊寫入 {args.out}（{os.path.getsize(args.out)} bytes，"
+              f"重播 {result['samples']} 筆樣本）")
+        return
+
+    import numpy as np
+
+    hits = read_hits(args.path)
+    names = {note: name for name, note in GM_DRUM_NOTES.items()}
+    for seconds, note, velocity in hits[:20]:
+        print(f"  {seconds:10.4f} s  {names.get(note, note):<10} 力度 {velocity}")
+    if len(hits) > 20:
+        print(f"  ...（共 {len(hits)} 個音符）")
+    if len(hits) > 1:
+        intervals = np.diff([seconds for seconds, _, _ in hits]) * 1000
+        print(f"敲擊間隔: 中位數 {np.median(intervals):.1f} ms，最短 {intervals.min():.1f} ms，"
+              f"最長 {intervals.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import threading
+import time
+
+import numpy as np
+
+try:
+    import smbus2
+except ImportError:  # 非樹莓派環境（可改用 FakeSMBus 測試）
+    smbus2 = None
+
+# ==================== MPU6050 暫存器 ====================
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+GYRO_CONFIG = 0x1B
+ACCEL_CONFIG = 0x1C
+FIFO_EN = 0x23
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B
+USER_CTRL = 0x6A
+PWR_MGMT_1 = 0x6B
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
+WHO_AM_I = 0x75
+
+# FIFO_EN：加速度 + 三軸陀螺儀
+FIFO_EN_ACCEL_GYRO = 0x78
+# USER_CTRL 位元
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RESET = 0x04
+# INT_STATUS 位元
+INT_FIFO_OFLOW = 0x10
+
+FIFO_SIZE = 1024        # 硬體 FIFO 容量（位元組）
+SAMPLE_BYTES = 12       # 每筆樣本：accel xyz + gyro xyz，各 2 bytes big-endian
+BLOCK_BYTES = 24        # SMBus 區塊讀取上限 32 bytes，取 12 的倍數
+
+# 與 mpu6050-raspberrypi 套件相同的單位換算（2G / 250°/s 量程）
+GRAVITY_MS2 = 9.80665
+ACCEL_SCALE = 16384.0
+GYRO_SCALE = 131.0
+TEMP_SCALE = 340.0
+TEMP_OFFSET = 36.53
+
+# 啟用 DLPF 時陀螺儀輸出頻率為 1 kHz，採樣率 = 1000 / (1 + SMPLRT_DIV)
+GYRO_OUTPUT_RATE = 1000.0
+DLPF_CFG = 1
+
+# drain() 回傳陣列的欄位
+COLUMNS = ("t", "ax", "ay", "az", "gx", "gy", "gz")
+
+# 已開啟的 SMBus（同一條總線上的感測器共用一個檔案描述子）
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def open_bus(number=1):
+    """開啟（或取得已開啟的）/dev/i2c-<number>"""
+    if smbus2 is None:
+        raise RuntimeError("smbus2 未安裝，請傳入 bus（例如 FakeSMBus）")
+    with _buses_lock:
+        bus = _buses.get(number)
+        if bus is None:
+            bus = _buses[number] = smbus2.SMBus(number)
+        return bus
+
+
+class MPU6050FIFO:
+    """
+    MPU6050 FIFO 驅動：設定採樣率與硬體 FIFO，以區塊讀取一次取回多筆樣本
+
+    相較於 get_accel_data() + get_gyro_data() 的多次暫存器讀取，
+    輪詢之間的樣本都會留在 FIFO 中，不會遺失。
+
+    參數說明：
+    - address: I2C 位址（0x68 右手、0x69 左手）
+    - bus: smbus2.SMBus 物件、FakeSMBus 或總線編號；None 時使用 /dev/i2c-1
+    - sample_rate: 目標採樣率（Hz）
+    - capacity: 預先配置的緩衝區樣本數
+    """
+
+    def __init__(self, address, bus=None, sample_rate=500, capacity=FIFO_SIZE // SAMPLE_BYTES):
+        if bus is None:
+            bus = 1
+        if isinstance(bus, int):
+            bus = open_bus(bus)
+        self.address = address
+        self.bus = bus
+
+        divider = max(0, min(255, int(round(GYRO_OUTPUT_RATE / sample_rate)) - 1))
+        self.sample_rate = GYRO_OUTPUT_RATE / (1 + divider)
+        self.period = 1.0 / self.sample_rate
+        self._divider = divider
+
+        # 預先配置的輸出緩衝區，drain() 回傳其切片（下一次 drain 會覆寫）
+        self._buffer = np.empty((capacity, len(COLUMNS)), dtype=np.float64)
+        self._scale = np.array([GRAVITY_MS2 / ACCEL_SCALE] * 3 + [1.0 / GYRO_SCALE] * 3)
+
+        self.overflow_count = 0
+        self.sample_count = 0
+        self.configure()
+
+    def configure(self):
+        """喚醒感測器並設定量程、濾波、採樣率與 FIFO"""
+        write = self.bus.write_byte_data
+        write(self.address, PWR_MGMT_1, 0x00)
+        write(self.address, CONFIG, DLPF_CFG)
+        write(self.address, SMPLRT_DIV, self._divider)
+        write(self.address, GYRO_CONFIG, 0x00)   # ±250°/s
+        write(self.address, ACCEL_CONFIG, 0x00)  # ±2g
+        write(self.address, FIFO_EN, FIFO_EN_ACCEL_GYRO)
+        self.reset_fifo()
+
+    def reset_fifo(self):
+        """清空 FIFO 並重新啟用"""
+        write = self.bus.write_byte_data
+        write(self.address, USER_CTRL, 0x00)
+        write(self.address, USER_CTRL, USER_CTRL_FIFO_RESET)
+        write(self.address, USER_CTRL, USER_CTRL_FIFO_EN)
+
+    def fifo_count(self):
+        """FIFO 中目前的位元組數"""
+        high, low = self.bus.read_i2c_block_data(self.address, FIFO_COUNTH, 2)
+        return (high << 8) | low
+
+    def read_all(self):
+        """
+        單次區塊讀取 accel / temp / gyro 共 14 bytes（不經過 FIFO）
+
+        返回：
+        (ax, ay, az, gx, gy, gz, temp)，單位 m/s²、°/s 與 °C
+        """
+        raw = bytes(self.bus.read_i2c_block_data(self.address, ACCEL_XOUT_H, 14))
+        values = np.frombuffer(raw, dtype=">i2")
+        accel = (values[0:3] * (GRAVITY_MS2 / ACCEL_SCALE)).tolist()
+        gyro = (values[4:7] / GYRO_SCALE).tolist()
+        temp = int(values[3]) / TEMP_SCALE + TEMP_OFFSET
+        return tuple(accel + gyro) + (temp,)
+
+    def read_burst(self):
+        """
+        單次區塊讀取目前的 accel + gyro
+
+        返回：
+        (ax, ay, az, gx, gy, gz)，單位 m/s² 與 °/s
+        """
+        return self.read_all()[:6]
+
+    def drain(self):
+        """
+        讀出 FIFO 中所有完整樣本
+
+        返回：
+        shape (n, 7) 的陣列，欄位為 COLUMNS；時間戳為 time.monotonic()，
+        以讀取時刻為最後一筆，依採樣週期往回推算
+        """
+        status = self.bus.read_byte_data(self.address, INT_STATUS)
+        if status & INT_FIFO_OFLOW:
+            # FIFO 溢位後資料對齊已不可信，直接重設
+            self.overflow_count += 1
+            self.reset_fifo()
+            return self._buffer[:0]
+
+        count = self.fifo_count()
+        n = min(count // SAMPLE_BYTES, len(self._buffer))
+        if n == 0:
+            return self._buffer[:0]
+
+        raw = bytearray()
+        remaining = n * SAMPLE_BYTES
+        while remaining > 0:
+            chunk = min(BLOCK_BYTES, remaining)
+            raw += bytes(self.bus.read_i2c_block_data(self.address, FIFO_R_W, chunk))
+            remaining -= chunk
+        read_time = time.monotonic()
+
+        out = self._buffer[:n]
+        samples = np.frombuffer(bytes(raw), dtype=">i2").reshape(n, 6)
+        np.multiply(samples, self._scale, out=out[:, 1:])
+        out[:, 0] = read_time - np.arange(n - 1, -1, -1) * self.period
+
+        self.sample_count += n
+        return out
+
+
+class FakeSMBus:
+    """
+    模擬 SMBus 的 MPU6050（無樹莓派時測試用）
+
+    push_sample() 放入的數據會進入模擬 FIFO，
+    同時更新 ACCEL_XOUT_H 開始的即時暫存器。
+    """
+
+    def __init__(self):
+        self.registers = {}
+        self.fifo = bytearray()
+        self.overflow = False
+        self.data_registers = bytes(14)
+
+    def push_sample(self, ax, ay, az, gx, gy, gz):
+        """放入一筆樣本（單位 m/s² 與 °/s）"""
+        raw = [round(v * ACCEL_SCALE / GRAVITY_MS2) for v in (ax, ay, az)]
+        raw += [round(v * GYRO_SCALE) for v in (gx, gy, gz)]
+        raw = [max(-32768, min(32767, v)) for v in raw]
+        packed = np.array(raw, dtype=">i2").tobytes()
+
+        self.data_registers = packed[:6] + bytes(2) + packed[6:]
+        if self.registers.get(USER_CTRL, 0) & USER_CTRL_FIFO_EN:
+            if len(self.fifo) + SAMPLE_BYTES > FIFO_SIZE:
+                self.overflow = True
+            else:
+                self.fifo += packed
+
+    def write_byte_data(self, address, register, value):
+        if register == USER_CTRL and value & USER_CTRL_FIFO_RESET:
+            self.fifo.clear()
+            self.overflow = False
+        self.registers[register] = value
+
+    def read_byte_data(self, address, register):
+        if register == INT_STATUS:
+            status = INT_FIFO_OFLOW if self.overflow else 0
+            self.overflow = False
+            return status
+        if register == WHO_AM_I:
+            return address
+        return self.registers.get(register, 0)
+
+    def read_i2c_block_data(self, address, register, length):
+        if register == FIFO_COUNTH:
+            count = len(self.fifo)
+            return [(count >> 8) & 0xFF, count & 0xFF][:length]
+        if register == FIFO_R_W:
+            chunk = bytes(self.fifo[:length])
+            del self.fifo[:length]
+            return list(chunk)
+        if register == ACCEL_XOUT_H:
+            return list(self.data_registers[:length])
+        return [self.registers.get(register + i, 0) for i in range(length)]
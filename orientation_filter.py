@@ -0,0 +1,304 @@
+"""
+姿態濾波器：SensorChannel 以區塊（FIFO 一次讀出的多筆樣本）更新角度
+
+可選的濾波器（register_channel(..., filter=...) 或環境變數 DRUM_FILTER）：
+- "complementary": 原本的 Euler 角互補濾波（alpha = 0.96）
+- "mahony": 四元數 Mahony 濾波，靜止時線上估計陀螺儀偏移，降低 yaw 漂移
+
+用法：
+    python orientation_filter.py                          # 以合成數據比較每筆樣本的成本
+    python orientation_filter.py drum_sensor_data.json    # 以錄製數據比較
+"""
+import math
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+ALPHA = 0.96  # 互補濾波中陀螺儀的權重
+FILTER_ENV = "DRUM_FILTER"
+DEFAULT_FILTER = "complementary"
+
+GRAVITY_MS2 = 9.80665
+
+# Mahony 濾波設定
+MAHONY_KP = 1.0               # 加速度修正的比例增益（越大越相信加速度計）
+ACCEL_TRUST_RANGE = 0.2       # |a| 偏離 1g 超過 20% 時（揮擊中）不使用加速度修正
+
+# 靜止偵測與陀螺儀偏移估計
+REST_ACCEL_TOLERANCE = 0.05   # ||a| - 1g| / 1g
+REST_GYRO_TOLERANCE = 3.0     # 扣除偏移後各軸角速度 < 3°/s
+REST_MIN_DURATION = 0.25      # 連續靜止超過此秒數才更新偏移
+BIAS_TIME_CONSTANT = 2.0      # 偏移估計的時間常數（秒）
+MAX_BIAS = 10.0               # 偏移估計上限（°/s），避免慢速轉動被當成偏移
+
+# 區塊小於此筆數時以純 Python 前處理（NumPy 每次呼叫的固定成本高於計算本身）
+VECTOR_MIN_BLOCK = 16
+
+
+def complementary_filter(pitch, roll, yaw, ax, ay, az, gx, gy, gz, dt, alpha=ALPHA):
+    # 正確的角度計算：
+    # pitch (俯仰) = 繞 Y 軸 = 前後傾斜 = 使用 ay
+    accel_pitch = math.degrees(math.atan2(ay, math.sqrt(ax*ax + az*az)))
+    # roll (翻滾) = 繞 X 軸 = 左右傾斜 = 使用 ax
+    accel_roll  = math.degrees(math.atan2(ax, math.sqrt(ay*ay + az*az)))
+
+    # 陀螺儀積分（對應正確的軸）
+    gyro_pitch = pitch + gy * dt  # pitch 使用 gy
+    gyro_roll  = roll  + gx * dt  # roll 使用 gx
+    gyro_yaw   = yaw   + gz * dt  # yaw 使用 gz
+
+    # 互補濾波
+    pitch = alpha * gyro_pitch + (1 - alpha) * accel_pitch
+    roll  = alpha * gyro_roll  + (1 - alpha) * accel_roll
+    # yaw 無法從加速度計算，只能使用陀螺儀積分
+    yaw   = gyro_yaw
+
+    # 將 yaw 歸一化到 -180° 到 +180° 範圍內
+    yaw = (yaw + 180.0) % 360.0 - 180.0
+
+    return pitch, roll, yaw
+
+
+class OrientationFilter(ABC):
+    """
+    濾波器介面
+
+    update(batch, dt) 接收 shape (n, 6) 的 (ax, ay, az, gx, gy, gz) 區塊（已扣除偏移，
+    單位 m/s² 與 °/s），依序處理後返回最後一筆的 (roll, pitch, yaw)，單位為度。
+    """
+
+    name = None
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.yaw = 0.0
+
+    @property
+    def angles(self):
+        return self.roll, self.pitch, self.yaw
+
+    @abstractmethod
+    def update(self, batch, dt):
+        """處理一個區塊，返回最後一筆的 (roll, pitch, yaw)"""
+
+
+class ComplementaryFilter(OrientationFilter):
+    """原本的 Euler 角互補濾波"""
+
+    name = "complementary"
+
+    def __init__(self, alpha=ALPHA):
+        self.alpha = alpha
+        super().__init__()
+
+    def update(self, batch, dt):
+        pitch, roll, yaw = self.pitch, self.roll, self.yaw
+        alpha = self.alpha
+        for ax, ay, az, gx, gy, gz in batch.tolist():
+            pitch, roll, yaw = complementary_filter(pitch, roll, yaw, ax, ay, az, gx, gy, gz, dt, alpha)
+        self.pitch, self.roll, self.yaw = pitch, roll, yaw
+        return self.angles
+
+
+class MahonyFilter(OrientationFilter):
+    """
+    四元數 Mahony 濾波 + 靜止時的陀螺儀偏移估計
+
+    - 以四元數積分陀螺儀，不會有 Euler 角的萬向鎖，yaw 由 atan2 自然落在 ±180°
+    - 加速度計只在 |a| 接近 1g 時修正 roll / pitch（揮擊中的加速度不是重力）
+    - 連續靜止 REST_MIN_DURATION 秒後，以陀螺儀讀數的指數平均更新偏移；
+      三軸偏移（包含加速度計無法觀測的 z 軸）都會被扣除，yaw 漂移大幅降低
+
+    區塊內的單位換算、正規化、靜止偵測與偏移扣除以 NumPy 一次完成
+    （小區塊改用等價的純 Python 版本），只有四元數遞迴（每筆依賴上一筆）以 float 迴圈執行。
+    輸出換回互補濾波的角度慣例（鼓區依此調校）：四元數的 roll（ay 傾斜）輸出為 pitch，
+    四元數的 pitch 取負號（ax 傾斜）輸出為 roll，因此靜止時兩種濾波的角度一致；yaw 的方向相同。
+    """
+
+    name = "mahony"
+
+    def __init__(self, kp=MAHONY_KP):
+        self.kp = kp
+        super().__init__()
+
+    def reset(self):
+        super().reset()
+        self.q = (1.0, 0.0, 0.0, 0.0)
+        self.bias = np.zeros(3)
+        self.rest_samples = 0   # 目前連續靜止的樣本數（跨區塊累計）
+
+    def _prepare(self, batch, dt):
+        """
+        向量化前處理：靜止偵測、偏移估計與單位換算
+
+        整個區塊都以區塊起始時的偏移扣除，區塊結束後才更新偏移
+
+        返回：
+        (unit, rates)：加速度單位向量（不可信時為 0）與扣除偏移的角速度（rad/s）
+        """
+        accel = batch[:, :3]
+        gyro = batch[:, 3:]
+        corrected = gyro - self.bias
+
+        norm = np.sqrt(np.einsum("ij,ij->i", accel, accel))
+        deviation = np.abs(norm / GRAVITY_MS2 - 1)
+        rest = (deviation < REST_ACCEL_TOLERANCE) & np.all(np.abs(corrected) < REST_GYRO_TOLERANCE, axis=1)
+
+        # 連續靜止的長度：距離上一個非靜止樣本的樣本數
+        index = np.arange(len(rest))
+        last_moving = np.maximum.accumulate(np.where(rest, -1, index))
+        run = np.where(last_moving < 0, index + 1 + self.rest_samples, index - last_moving)
+        self.rest_samples = int(run[-1]) if rest[-1] else 0
+
+        usable = rest & (run * dt >= REST_MIN_DURATION)
+        count = int(np.count_nonzero(usable))
+        if count:
+            # 逐筆指數平均的閉式解：舊偏移衰減 (1-β)^k，新讀數依時間先後加權
+            beta = min(1.0, dt / BIAS_TIME_CONSTANT)
+            weights = beta * (1 - beta) ** np.arange(count - 1, -1, -1)
+            bias = self.bias * (1 - beta) ** count + weights @ gyro[usable]
+            self.bias = np.clip(bias, -MAX_BIAS, MAX_BIAS)
+
+        # 揮擊中的樣本不做加速度修正（單位向量設為 0 → 誤差項為 0）
+        trusted = deviation < ACCEL_TRUST_RANGE
+        unit = np.where(trusted[:, None], accel / np.where(norm > 0, norm, 1)[:, None], 0.0)
+        return unit.tolist(), np.radians(corrected).tolist()
+
+    def _prepare_scalar(self, batch, dt):
+        """與 _prepare 相同的計算，小區塊用"""
+        bx, by, bz = self.bias.tolist()
+        beta = min(1.0, dt / BIAS_TIME_CONSTANT)
+        new_bias = [bx, by, bz]
+        rest_samples = self.rest_samples
+        units, rates = [], []
+        for ax, ay, az, gx, gy, gz in batch.tolist():
+            cx, cy, cz = gx - bx, gy - by, gz - bz
+            norm = math.sqrt(ax * ax + ay * ay + az * az)
+            deviation = abs(norm / GRAVITY_MS2 - 1)
+            if (deviation < REST_ACCEL_TOLERANCE and abs(cx) < REST_GYRO_TOLERANCE
+                    and abs(cy) < REST_GYRO_TOLERANCE and abs(cz) < REST_GYRO_TOLERANCE):
+                rest_samples += 1
+                if rest_samples * dt >= REST_MIN_DURATION:
+                    new_bias = [b + beta * (g - b) for b, g in zip(new_bias, (gx, gy, gz))]
+            else:
+                rest_samples = 0
+            if deviation < ACCEL_TRUST_RANGE and norm > 0:
+                units.append((ax / norm, ay / norm, az / norm))
+            else:
+                units.append((0.0, 0.0, 0.0))
+            rates.append((math.radians(cx), math.radians(cy), math.radians(cz)))
+        self.rest_samples = rest_samples
+        self.bias = np.clip(new_bias, -MAX_BIAS, MAX_BIAS)
+        return units, rates
+
+    def update(self, batch, dt):
+        if len(batch) == 0:
+            return self.angles
+        if len(batch) < VECTOR_MIN_BLOCK:
+            unit, rates = self._prepare_scalar(batch, dt)
+        else:
+            unit, rates = self._prepare(batch, dt)
+
+        q0, q1, q2, q3 = self.q
+        kp = self.kp
+        half_dt = 0.5 * dt
+        for (vx, vy, vz), (wx, wy, wz) in zip(unit, rates):
+            # 估計的重力方向（機體座標）
+            ex_g = 2 * (q1 * q3 - q0 * q2)
+            ey_g = 2 * (q0 * q1 + q2 * q3)
+            ez_g = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+            # 量測與估計的重力方向外積 = 姿態誤差
+            wx += kp * (vy * ez_g - vz * ey_g)
+            wy += kp * (vz * ex_g - vx * ez_g)
+            wz += kp * (vx * ey_g - vy * ex_g)
+
+            # q̇ = ½ q ⊗ (0, ω)
+            q0, q1, q2, q3 = (
+                q0 + (-q1 * wx - q2 * wy - q3 * wz) * half_dt,
+                q1 + (q0 * wx + q2 * wz - q3 * wy) * half_dt,
+                q2 + (q0 * wy - q1 * wz + q3 * wx) * half_dt,
+                q3 + (q0 * wz + q1 * wy - q2 * wx) * half_dt,
+            )
+            inv = 1.0 / math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+            q0, q1, q2, q3 = q0 * inv, q1 * inv, q2 * inv, q3 * inv
+
+        self.q = (q0, q1, q2, q3)
+        # 四元數的 Euler 角（繞 x 為 roll、繞 y 為 pitch）換成互補濾波的慣例：
+        # 互補濾波的 pitch 由 ay 決定（= 繞 x 的傾斜），roll 由 ax 決定（= 繞 y 的傾斜取負號）
+        self.pitch = math.degrees(math.atan2(2 * (q0 * q1 + q2 * q3), 1 - 2 * (q1 * q1 + q2 * q2)))
+        self.roll = -math.degrees(math.asin(max(-1.0, min(1.0, 2 * (q0 * q2 - q3 * q1)))))
+        self.yaw = math.degrees(math.atan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3)))
+        return self.angles
+
+
+FILTERS = {
+    ComplementaryFilter.name: ComplementaryFilter,
+    MahonyFilter.name: MahonyFilter,
+}
+
+
+def make_filter(name=None, **kwargs):
+    """依名稱建立濾波器；name 為 None 時使用環境變數 DRUM_FILTER 或預設值"""
+    if name is None:
+        name = os.environ.get(FILTER_ENV, DEFAULT_FILTER)
+    if name not in FILTERS:
+        raise ValueError(f"未知的濾波器: {name}（可用: {', '.join(FILTERS)}）")
+    return FILTERS[name](**kwargs)
+
+
+def _synthetic_batch(n, dt):
+    """靜止 + 揮擊交替的合成數據（已扣除偏移）"""
+    t = np.arange(n) * dt
+    swing = np.sin(2 * np.pi * 2 * t) * (np.sin(2 * np.pi * 0.25 * t) > 0)
+    batch = np.zeros((n, 6))
+    batch[:, 2] = GRAVITY_MS2 + 3 * swing
+    batch[:, 0] = 2 * swing
+    batch[:, 4] = 200 * swing
+    batch += np.random.default_rng(0).normal(0, [0.05, 0.05, 0.05, 0.5, 0.5, 0.5], batch.shape)
+    return batch
+
+
+def benchmark(batch, dt, block=4):
+    """
+    以 FIFO 典型的區塊大小餵給各濾波器
+
+    返回：
+    {濾波器名稱: 每筆樣本微秒數}
+    """
+    results = {}
+    for name, factory in FILTERS.items():
+        orientation = factory()
+        start = time.perf_counter()
+        for i in range(0, len(batch), block):
+            orientation.update(batch[i:i + block], dt)
+        results[name] = (time.perf_counter() - start) / len(batch) * 1e6
+    return results
+
+
+def main():
+    dt = 1 / 500
+    if len(sys.argv) > 1:
+        from replay_sensor import load_recording
+        samples, _, _ = load_recording(sys.argv[1])
+        batch = samples[:, 1:]
+        source = sys.argv[1]
+    else:
+        batch = _synthetic_batch(20000, dt)
+        source = "合成數據"
+
+    print(f"=== 濾波器成本: {source}（{len(batch)} 筆）===")
+    for block in (1, 4, 32):
+        results = benchmark(batch, dt, block)
+        line = "  ".join(f"{name} {us:.1f} µs" for name, us in results.items())
+        print(f"  區塊 {block:>2} 筆: {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+錄製數據重播：不需要樹莓派與感測器，也能跑完整的 Flask app 與偵測流程
+
+用法：
+    DRUM_REPLAY=drum_sensor_data.json python app.py        # 以錄製數據即時重播啟動伺服器
+    python replay_sensor.py drum_sensor_data.json          # 盡可能快地重播並輸出準確率與吞吐量
+    python replay_sensor.py drum_sensor_data.json drum_classifier.npz   # 改用訓練好的分類器判斷鼓
+    （錄製檔可為 .drumrec 或舊版 JSON）
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from sensor_recording import EXTENSION, Recording
+
+# 設定此環境變數時，感測器通道會改用重播感測器
+REPLAY_ENV = "DRUM_REPLAY"
+REPLAY_SPEED_ENV = "DRUM_REPLAY_SPEED"   # 0 = 盡可能快，1 = 即時
+
+
+def _load_rows(path):
+    """讀取錄製檔為 (rows, labels, names)，支援 .drumrec 與舊版 JSON"""
+    if path.endswith(EXTENSION):
+        recording = Recording(path)
+        columns = ["t", "ax", "ay", "az", "gx", "gy", "gz"]
+        rows = np.stack([recording.column(c).astype(np.float64) for c in columns], axis=1)
+        rows[:, 0] = recording.timestamps()
+        return rows, recording.label_indices(), list(recording.labels)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    rows = []
+    labels = []
+    names = list(data.keys())
+    for label, name in enumerate(names):
+        for reading in data[name]:
+            accel = reading["accelerometer"]
+            gyro = reading["gyroscope"]
+            rows.append((reading["timestamp"], accel["x"], accel["y"], accel["z"],
+                         gyro["x"], gyro["y"], gyro["z"]))
+            labels.append(label)
+    return np.array(rows, dtype=np.float64).reshape(-1, 7), np.array(labels, dtype=np.int64), names
+
+
+def load_recording(path):
+    """
+    載入 get_hitting_data.py 產生的錄製檔（.drumrec 或舊版 JSON）
+
+    返回：
+    (samples, labels, names)
+    - samples: shape (n, 7) 陣列，欄位 t, ax, ay, az, gx, gy, gz（t 從 0 開始）
+    - labels: shape (n,) int 陣列，names 的索引
+    - names: 鼓名稱列表（依檔案中的順序）
+    """
+    samples, labels, names = _load_rows(path)
+    if len(samples):
+        # 各鼓之間的錄製空檔壓縮成一個採樣週期
+        dt = np.diff(samples[:, 0])
+        period = float(np.median(dt)) if len(dt) else 0.0
+        dt = np.where((dt > 0) & (dt < period * 5), dt, period)
+        samples[:, 0] = np.concatenate(([0.0], np.cumsum(dt)))
+    return samples, labels, names
+
+
+class ReplaySensor:
+    """
+    以錄製數據模擬 MPU6050FIFO（介面相同：read_burst / drain / period）
+
+    參數說明：
+    - path: 錄製檔路徑
+    - speed: 1.0 為即時重播；0 為盡可能快（每次 drain 回傳一筆樣本）
+    - loop: 播完後是否從頭重播
+    """
+
+    def __init__(self, path, speed=1.0, loop=True):
+        self.samples, self.labels, self.names = load_recording(path)
+        if len(self.samples) == 0:
+            raise ValueError(f"錄製檔沒有數據: {path}")
+        self.speed = float(speed)
+        self.loop = loop
+
+        dt = np.diff(self.samples[:, 0])
+        self.period = float(np.median(dt)) if len(dt) else 0.05
+        self.sample_rate = 1.0 / self.period
+        self.duration = float(self.samples[-1, 0]) + self.period
+
+        self.position = 0        # 已送出的樣本總數（跨圈累計）
+        self.current = 0         # 最近送出的樣本索引（read_burst 使用）
+        self.sample_count = 0
+        self.overflow_count = 0
+        self._start = time.monotonic()
+
+    @property
+    def finished(self):
+        return not self.loop and self.position >= len(self.samples)
+
+    def _available(self):
+        """即時模式下到目前為止應該送出的樣本總數（含已重播的圈數）"""
+        elapsed = (time.monotonic() - self._start) * self.speed
+        laps, position = divmod(elapsed, self.duration)
+        count = int(np.searchsorted(self.samples[:, 0], position, side='right'))
+        return int(laps) * len(self.samples) + count
+
+    def drain(self):
+        """取出新到的樣本，格式與 MPU6050FIFO.drain() 相同（t 為錄製時間軸）"""
+        n = len(self.samples)
+        if self.speed <= 0:
+            target = self.position + 1
+        else:
+            target = self._available()
+        if not self.loop:
+            target = min(target, n)
+        if target <= self.position:
+            return self.samples[:0]
+
+        indices = np.arange(self.position, target) % n
+        self.position = target
+        self.current = int(indices[-1])
+        self.sample_count += len(indices)
+        return self.samples[indices]
+
+    def read_burst(self):
+        """最近送出的樣本 (ax, ay, az, gx, gy, gz)"""
+        return tuple(self.samples[self.current, 1:].tolist())
+
+    def current_label(self):
+        """最近送出樣本所屬的鼓名稱"""
+        return self.names[self.labels[self.current]]
+
+
+def open_sensor(address, bus=1):
+    """
+    建立感測器：設定 DRUM_REPLAY 時使用錄製數據，否則開啟實體 MPU6050
+
+    所有通道重播同一份錄製檔
+    """
+    path = os.environ.get(REPLAY_ENV)
+    if path:
+        speed = float(os.environ.get(REPLAY_SPEED_ENV, 1.0))
+        print(f"[ReplaySensor] bus {bus} 0x{address:02x} 使用錄製數據 {path}（速度 {speed}）")
+        return ReplaySensor(path, speed=speed)
+
+    from mpu6050_fifo import MPU6050FIFO
+    return MPU6050FIFO(address, bus=bus)
+
+
+def run_benchmark(path, classifier=None, listeners=(), predictor=None, on_sample=None):
+    """
+    盡可能快地重播錄製檔，走完左手通道 update → 敲擊事件 → 碰撞偵測
+
+    參數說明：
+    - classifier: DrumClassifier（可為 None）；設定時敲擊事件改用分類器判斷鼓
+    - listeners: 額外的 HitDetector listener（例如 MidiHitWriter.on_hit）
+    - predictor: HitPredictor（可為 None）；設定時在撞擊前預測敲擊
+    - on_sample: on_sample(sample, label)，每個樣本送進 HitDetector 之前呼叫（例如比較用的另一個偵測器）
+
+    返回：
+    {"samples", "seconds", "samples_per_sec", "per_drum": {鼓: {"hits", "correct"}}, "accuracy"}
+    """
+    # 錄製時使用 0x69（左手）感測器，因此以左手的位址與偏移重播；
+    # 使用獨立的通道與感測器，不修改登記的通道與環境變數，同一個程序之後仍可開啟實體感測器
+    from sensor_channel import SensorChannel, get_channel
+    from drum_collision import get_detector
+    from hit_detector import HitDetector
+
+    left = get_channel("left")
+    channel = SensorChannel(left.name, left.address, left.bus, left.accel_offset, left.gyro_offset)
+    channel.sensor = sensor = ReplaySensor(path, speed=0, loop=False)
+    # 樣本時間戳是錄製檔的相對時間，不是 monotonic_ns：不計算事件延遲
+    detector = HitDetector(get_detector(), classifier=classifier, predictor=predictor, clock=None)
+    for listener in listeners:
+        detector.add_listener(listener)
+    per_drum = {name: {"hits": 0, "correct": 0} for name in sensor.names}
+
+    start = time.perf_counter()
+    count = 0
+    while not sensor.finished:
+        values = channel.update()
+        label = sensor.current_label()
+        # 錄製檔的時間（秒）換成與 BusScheduler 相同的奈秒整數
+        sample = (int(sensor.samples[sensor.current, 0] * 1e9),) + tuple(values)
+        if on_sample is not None:
+            on_sample(sample, label)
+        event = detector.process("left", sample)
+        count += 1
+        if event is not None:
+            per_drum[label]["hits"] += 1
+            if event["drum"] == label:
+                per_drum[label]["correct"] += 1
+    seconds = time.perf_counter() - start
+
+    hits = sum(d["hits"] for d in per_drum.values())
+    correct = sum(d["correct"] for d in per_drum.values())
+    return {
+        "samples": count,
+        "seconds": seconds,
+        "samples_per_sec": count / seconds if seconds > 0 else float("inf"),
+        "per_drum": per_drum,
+        "accuracy": correct / hits if hits else 0.0,
+    }
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "drum_sensor_data.json"
+    classifier = None
+    if len(sys.argv) > 2 or os.environ.get("DRUM_CLASSIFIER"):
+        from drum_classifier import load_classifier
+        classifier = load_classifier(sys.argv[2] if len(sys.argv) > 2 else None)
+    result = run_benchmark(path, classifier)
+
+    print(f"\n=== 重播基準測試: {path} ===")
+    for name, stats in result["per_drum"].items():
+        ratio = stats["correct"] / stats["hits"] if stats["hits"] else 0.0
+        print(f"  {name:<10} 敲擊 {stats['hits']:>4}  正確 {stats['correct']:>4}  ({ratio:.0%})")
+    print(f"整體準確率: {result['accuracy']:.1%}")
+    print(f"吞吐量: {result['samples_per_sec']:.0f} samples/sec（{result['samples']} 筆，{result['seconds']:.3f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
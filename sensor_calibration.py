@@ -0,0 +1,188 @@
+"""
+自動偏移校正：偵測靜止區間，計算偏移與雜訊，存成每個感測器的校正檔
+
+校正檔（sensor_profiles.json）以 "bus<編號>/0x<位址>" 為鍵，
+SensorChannel 建立時自動載入；沒有校正檔的感測器使用 sensor_channel.py 中登記的預設偏移。
+
+用法：
+    python sensor_calibration.py                 # 校正所有已登記的通道（感測器平放靜止）
+    python sensor_calibration.py left --seconds 8
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensor_profiles.json")
+PROFILE_VERSION = 1
+
+GRAVITY_MS2 = 9.80665
+AXES = ("x", "y", "z")
+
+DEFAULT_DURATION = 5.0        # 收集秒數（500 Hz 下約 2500 筆）
+STATIONARY_WINDOW = 1.0       # 靜止區間長度（秒）
+MAX_GYRO_STD = 1.0            # 靜止時各軸陀螺儀標準差上限（°/s）
+MAX_ACCEL_STD = 0.15          # 靜止時各軸加速度標準差上限（m/s²）
+
+
+def profile_key(bus, address):
+    return f"bus{bus}/0x{address:02x}"
+
+
+def load_profiles(path=PROFILE_PATH):
+    """讀取所有校正檔；檔案不存在或損毀時返回空 dict"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != PROFILE_VERSION:
+        return {}
+    return data.get("sensors", {})
+
+
+def load_profile(bus, address, path=PROFILE_PATH):
+    """取得單一感測器的校正檔（沒有則為 None）"""
+    return load_profiles(path).get(profile_key(bus, address))
+
+
+def save_profile(bus, address, profile, path=PROFILE_PATH):
+    """寫入（覆蓋）單一感測器的校正檔，其他感測器保持不變"""
+    sensors = load_profiles(path)
+    sensors[profile_key(bus, address)] = profile
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": PROFILE_VERSION, "sensors": sensors}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_stationary_window(samples, window):
+    """
+    找出動作最小的靜止區間
+
+    參數說明：
+    - samples: shape (n, 6) 的 (ax, ay, az, gx, gy, gz)
+    - window: 區間長度（筆數）
+
+    返回：
+    (start, stop) 的切片索引；找不到符合門檻的區間時為 None
+    """
+    n = len(samples)
+    if n < window:
+        return None
+
+    # 以累積和一次算出所有區間的平均與變異數
+    zero = np.zeros((1, samples.shape[1]))
+    cumsum = np.concatenate((zero, np.cumsum(samples, axis=0)))
+    cumsum_sq = np.concatenate((zero, np.cumsum(samples * samples, axis=0)))
+    mean = (cumsum[window:] - cumsum[:-window]) / window
+    var = (cumsum_sq[window:] - cumsum_sq[:-window]) / window - mean * mean
+    std = np.sqrt(np.maximum(var, 0.0))
+
+    accel_std = std[:, :3].max(axis=1)
+    gyro_std = std[:, 3:].max(axis=1)
+    valid = (accel_std < MAX_ACCEL_STD) & (gyro_std < MAX_GYRO_STD)
+    if not valid.any():
+        return None
+
+    score = np.where(valid, gyro_std / MAX_GYRO_STD + accel_std / MAX_ACCEL_STD, np.inf)
+    start = int(np.argmin(score))
+    return start, start + window
+
+
+def compute_profile(samples, sample_rate, window_seconds=STATIONARY_WINDOW):
+    """
+    由原始樣本計算偏移與雜訊
+
+    重力軸取平均加速度絕對值最大的軸（平放時為 z），該軸的偏移扣除 ±1g，
+    與 README 手動校正「靜止平放時的平均誤差」相同。
+
+    參數說明：
+    - samples: shape (n, 6) 的原始 (ax, ay, az, gx, gy, gz)，單位 m/s² 與 °/s
+    - sample_rate: 採樣率（Hz）
+
+    返回：
+    校正檔 dict；找不到靜止區間時拋出 ValueError
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    window = max(2, int(window_seconds * sample_rate))
+    span = find_stationary_window(samples, window)
+    if span is None:
+        raise ValueError("找不到靜止區間，請將感測器平放並保持不動後重試")
+
+    still = samples[span[0]:span[1]]
+    mean = still.mean(axis=0)
+    std = still.std(axis=0)
+
+    gravity = np.zeros(3)
+    gravity_axis = int(np.argmax(np.abs(mean[:3])))
+    gravity[gravity_axis] = np.sign(mean[gravity_axis]) * GRAVITY_MS2
+    accel_offset = mean[:3] - gravity
+    gyro_offset = mean[3:]
+
+    return {
+        "accel_offset": dict(zip(AXES, np.round(accel_offset, 4).tolist())),
+        "gyro_offset": dict(zip(AXES, np.round(gyro_offset, 4).tolist())),
+        "accel_noise": dict(zip(AXES, np.round(std[:3], 4).tolist())),
+        "gyro_noise": dict(zip(AXES, np.round(std[3:], 4).tolist())),
+        "gravity_axis": AXES[gravity_axis],
+        "samples": int(len(still)),
+        "sample_rate": float(sample_rate),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def collect_raw(sensor, duration):
+    """從 FIFO 收集 duration 秒的原始樣本，返回 shape (n, 6) 陣列"""
+    blocks = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        block = sensor.drain()
+        if len(block):
+            blocks.append(block[:, 1:].copy())  # drain() 回傳的緩衝區會被下一次覆寫
+        time.sleep(0.02)
+    return np.concatenate(blocks) if blocks else np.empty((0, 6))
+
+
+def calibrate_channel(channel, duration=DEFAULT_DURATION, path=PROFILE_PATH):
+    """校正一個通道：收集 → 計算 → 存檔 → 立即套用，返回校正檔"""
+    sensor = channel.get_sensor()
+    print(f"[Calibration] {channel.name}（bus {channel.bus} 0x{channel.address:02x}）收集 {duration:.0f} 秒數據...")
+    samples = collect_raw(sensor, duration)
+    profile = compute_profile(samples, sensor.sample_rate)
+    save_profile(channel.bus, channel.address, profile, path)
+    channel.set_offsets(profile["accel_offset"], profile["gyro_offset"])
+    return profile
+
+
+def main():
+    from sensor_channel import channels, get_channel
+
+    parser = argparse.ArgumentParser(description="MPU6050 自動偏移校正")
+    parser.add_argument("channels", nargs="*", help="通道名稱（預設為全部）")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_DURATION, help="收集秒數")
+    args = parser.parse_args()
+
+    targets = [get_channel(name) for name in args.channels] if args.channels else channels()
+    print("請將感測器平放在桌面上並保持靜止")
+    saved = 0
+    for channel in targets:
+        try:
+            profile = calibrate_channel(channel, args.seconds)
+        except ValueError as e:
+            print(f"[Calibration] {channel.name} 校正失敗: {e}")
+            continue
+        saved += 1
+        print(f"  ACCEL_OFFSET = {profile['accel_offset']}")
+        print(f"  GYRO_OFFSET  = {profile['gyro_offset']}")
+        print(f"  陀螺儀雜訊（標準差）= {profile['gyro_noise']}")
+    if not saved:
+        print("[Calibration] 沒有任何通道校正成功，未寫入校正檔")
+        raise SystemExit(1)
+    print(f"已寫入 {PROFILE_PATH}（{saved}/{len(targets)} 個通道）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+感測器通道：每個 MPU6050 一個 SensorChannel（位址、I2C 總線、偏移與濾波狀態）
+
+取代原本幾乎相同的 calibration_right.py / calibration_left.py，
+新增感測器（例如第二條 I2C 總線上的大鼓、Hi-hat 踏板）只需要在下方登記：
+
+    register_channel("kick", 0x68, bus=3)
+    register_channel("hihat_pedal", 0x69, bus=3)
+
+同一條總線上的通道共用一個鎖依序讀取，不同總線的通道由 SensorSampler 平行讀取。
+"""
+import threading
+
+from metrics import histogram
+from orientation_filter import make_filter
+from replay_sensor import open_sensor
+from sensor_calibration import load_profile
+
+DEFAULT_BUS = 1
+
+
+# 每條 I2C 總線一個鎖：同一總線上的感測器不能同時讀取
+_bus_locks = {}
+_bus_locks_guard = threading.Lock()
+
+
+def bus_lock(bus):
+    """取得指定 I2C 總線的鎖（同一總線的所有通道共用）"""
+    with _bus_locks_guard:
+        lock = _bus_locks.get(bus)
+        if lock is None:
+            lock = _bus_locks[bus] = threading.Lock()
+        return lock
+
+
+class SensorChannel:
+    """
+    單一感測器通道：偏移校正 + 姿態濾波
+
+    參數說明：
+    - name: 通道名稱（"right"、"left"...），也是 SensorSampler 與 /stream 使用的鍵
+    - address: I2C 位址
+    - bus: I2C 總線編號（/dev/i2c-<bus>）
+    - accel_offset / gyro_offset: 靜止平放時量到的偏移 {"x", "y", "z"}；
+      sensor_profiles.json 中有此感測器的校正檔時以校正檔為準（見 sensor_calibration.py）
+    - filter: 姿態濾波器名稱（"complementary"、"mahony"）或 OrientationFilter 物件；
+      None 時依環境變數 DRUM_FILTER 選擇（見 orientation_filter.py）
+    """
+
+    __slots__ = ("name", "address", "bus", "accel_offset", "gyro_offset", "offsets",
+                 "filter", "sensor", "lock", "_open_lock", "_read_histogram", "_filter_histogram")
+
+    def __init__(self, name, address, bus=DEFAULT_BUS, accel_offset=None, gyro_offset=None, filter=None):
+        self.name = name
+        self.address = address
+        self.bus = bus
+        profile = load_profile(bus, address)
+        if profile is not None:
+            print(f"[SensorChannel] {name} 使用校正檔（{profile.get('created', '?')}）")
+            accel_offset, gyro_offset = profile["accel_offset"], profile["gyro_offset"]
+        self.set_offsets(accel_offset or {"x": 0.0, "y": 0.0, "z": 0.0},
+                         gyro_offset or {"x": 0.0, "y": 0.0, "z": 0.0})
+        self.filter = filter if filter is not None and not isinstance(filter, str) else make_filter(filter)
+        self.lock = bus_lock(bus)
+
+        # import 時不開啟 I2C，第一次讀取時才由 get_sensor() 建立
+        self.sensor = None
+        self._open_lock = threading.Lock()
+
+        self._read_histogram = histogram("drum_stage_seconds", stage="i2c_read", channel=name)
+        self._filter_histogram = histogram("drum_stage_seconds", stage="filter", channel=name)
+
+    def __repr__(self):
+        return f"SensorChannel({self.name!r}, 0x{self.address:02x}, bus={self.bus})"
+
+    @property
+    def roll(self):
+        return self.filter.roll
+
+    @property
+    def pitch(self):
+        return self.filter.pitch
+
+    @property
+    def yaw(self):
+        return self.filter.yaw
+
+    def set_offsets(self, accel_offset, gyro_offset):
+        """更新偏移（校正完成後立即套用）"""
+        self.accel_offset = dict(accel_offset)
+        self.gyro_offset = dict(gyro_offset)
+        # 向量化扣除偏移用（順序：ax, ay, az, gx, gy, gz）；整個 tuple 一次替換，讀取端不會看到一半的值
+        self.offsets = (self.accel_offset['x'], self.accel_offset['y'], self.accel_offset['z'],
+                        self.gyro_offset['x'], self.gyro_offset['y'], self.gyro_offset['z'])
+
+    def reset(self):
+        """角度歸零（yaw 漂移時使用）"""
+        self.filter.reset()
+
+    def get_sensor(self):
+        """取得（必要時開啟）感測器"""
+        if self.sensor is None:
+            with self._open_lock:
+                if self.sensor is None:
+                    self.sensor = open_sensor(self.address, bus=self.bus)
+        return self.sensor
+
+    def get_calibrated(self):
+        """單次區塊讀取 accel + gyro 並扣除偏移"""
+        values = self.get_sensor().read_burst()
+        return tuple(v - o for v, o in zip(values, self.offsets))
+
+    def get_calibrated_batch(self):
+        """讀出 FIFO 中所有樣本並扣除偏移，返回 shape (n, 6) 的陣列"""
+        samples = self.get_sensor().drain()
+        return samples[:, 1:] - self.offsets
+
+    def update(self):
+        """
+        讀取新樣本並更新角度（SensorSampler 的 reader）
+
+        返回：
+        (roll, pitch, yaw, ax, ay, az, gx, gy, gz)
+        """
+        with self._read_histogram.time():
+            batch = self.get_calibrated_batch()
+        if len(batch) == 0:
+            # FIFO 尚無新樣本（或剛溢位重設）：單次讀取數值，角度維持不變
+            ax, ay, az, gx, gy, gz = self.get_calibrated()
+        else:
+            # 整個區塊交給濾波器，dt 為感測器的實際採樣週期
+            with self._filter_histogram.time():
+                self.filter.update(batch, self.sensor.period)
+            ax, ay, az, gx, gy, gz = batch[-1].tolist()
+
+        roll, pitch, yaw = self.filter.angles
+        return roll, pitch, yaw, ax, ay, az, gx, gy, gz
+
+
+# ==================== 通道登記 ====================
+CHANNELS = {}
+
+
+def register_channel(name, address, bus=DEFAULT_BUS, accel_offset=None, gyro_offset=None, filter=None):
+    """登記一個感測器通道（不會開啟 I2C），返回 SensorChannel"""
+    if name in CHANNELS:
+        raise ValueError(f"通道已存在: {name}")
+    for channel in CHANNELS.values():
+        if (channel.bus, channel.address) == (bus, address):
+            raise ValueError(f"bus {bus} 位址 0x{address:02x} 已被 {channel.name} 使用")
+    channel = CHANNELS[name] = SensorChannel(name, address, bus, accel_offset, gyro_offset, filter)
+    return channel
+
+
+def get_channel(name):
+    return CHANNELS[name]
+
+
+def channels():
+    """所有已登記的通道（依登記順序）"""
+    return list(CHANNELS.values())
+
+
+# 預設偏移值：感測器靜止平放時量測的平均誤差（見 README「Calibrate Sensor Data」）
+# 執行 python sensor_calibration.py 產生校正檔後，以校正檔為準
+register_channel("right", 0x68,
+                 accel_offset={"x": 0.0605, "y": -0.0385, "z": 0.4891},
+                 gyro_offset={"x": -4.2941, "y": -1.2928, "z": 0.2246})
+register_channel("left", 0x69,
+                 accel_offset={"x": 1.71, "y": -1.23, "z": 1.52},
+                 gyro_offset={"x": -1.22, "y": 2.69, "z": 0.31})
@@ -0,0 +1,212 @@
+"""
+感測器錄製檔的固定寬度逐列二進位格式（.drumrec）
+
+檔案結構：
+    MAGIC (8 bytes) | header 長度 (uint32, little-endian) | JSON header | 數據列
+數據列依 header["columns"] 排列、逐列存放（row-major）：時間 t 為 float64，其餘欄位為 float32，
+全部 little-endian。採集時逐列附加寫入，程序中斷也只會遺失最後一次 flush 之後的數據。
+載入時以 np.memmap 對應檔案，不需要把整個檔案讀進記憶體。
+
+version 1（舊檔）的每個欄位都是 float32，仍可載入；float32 的 t 在 600 秒時解析度只有約 61 µs，
+2 小時後約 0.5 ms，長時間錄製會失去採樣時序的精度，因此 version 2 改為 float64。
+
+用法：
+    python sensor_recording.py convert drum_sensor_data.json   # JSON 轉 .drumrec
+    python sensor_recording.py info drum_sensor_data.drumrec   # 顯示摘要
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"DRUMREC1"
+EXTENSION = ".drumrec"
+HEADER_ALIGN = 64
+
+# t 為相對於 header["start_time"] 的秒數（float64，錄製數天仍有次微秒精度）
+# label 為 header["labels"] 的索引
+COLUMNS = ("t", "ax", "ay", "az", "gx", "gy", "gz", "temp", "label")
+
+VERSION = 2
+TIME_COLUMN = "t"
+FLUSH_EVERY = 64
+
+
+def row_dtype(columns, version=VERSION):
+    """數據列的結構化 dtype：version 2 的 t 為 float64，其他欄位（與 version 1 的所有欄位）為 float32"""
+    return np.dtype([(name, "<f8" if name == TIME_COLUMN and version >= 2 else "<f4") for name in columns])
+
+
+def _row_format(columns):
+    return "<" + "".join("d" if name == TIME_COLUMN else "f" for name in columns)
+
+
+class RecordingWriter:
+    """
+    逐筆附加寫入 .drumrec
+
+    參數說明：
+    - path: 輸出檔路徑
+    - labels: 鼓名稱列表（寫入 header，append 時用名稱或索引指定）
+    - start_time: 時間基準（time.time()），t 欄位存相對秒數
+    """
+
+    def __init__(self, path, labels, start_time, columns=COLUMNS):
+        self.path = path
+        self.labels = list(labels)
+        self.columns = tuple(columns)
+        self.start_time = float(start_time)
+        self.count = 0
+        self._label_index = {name: i for i, name in enumerate(self.labels)}
+        self._row = struct.Struct(_row_format(self.columns))
+        self._pending = []
+
+        header = json.dumps({
+            "version": VERSION,
+            "columns": list(self.columns),
+            "labels": self.labels,
+            "start_time": self.start_time,
+        }, ensure_ascii=False).encode("utf-8")
+        # header 補空白對齊，讓數據區的 offset 對齊 64 bytes
+        total = len(MAGIC) + 4 + len(header)
+        header += b" " * (-total % HEADER_ALIGN)
+
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self._file.flush()
+
+    def append(self, label, timestamp, ax, ay, az, gx, gy, gz, temp=0.0):
+        """寫入一筆樣本（label 可為名稱或索引，timestamp 為 time.time()）"""
+        if isinstance(label, str):
+            label = self._label_index[label]
+        self._pending.append(self._row.pack(timestamp - self.start_time,
+                                            ax, ay, az, gx, gy, gz, temp, label))
+        self.count += 1
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._file.write(b"".join(self._pending))
+            self._pending = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Recording:
+    """
+    以 memmap 載入的錄製檔
+
+    屬性：
+    - data: shape (n,) 的唯讀結構化 memmap（欄位名稱同 columns，用 column() 取單一欄位）
+    - labels: 鼓名稱列表
+    - start_time: 時間基準
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"不是 .drumrec 檔案: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        self.version = header.get("version", 1)
+        if self.version > VERSION:
+            raise ValueError(f"不支援的 .drumrec 版本 {self.version}: {path}")
+        self.columns = tuple(header["columns"])
+        self.labels = header["labels"]
+        self.start_time = header["start_time"]
+
+        offset = len(MAGIC) + 4 + header_len
+        dtype = row_dtype(self.columns, self.version)
+        # 忽略中斷時寫了一半的最後一列
+        rows = (os.path.getsize(path) - offset) // dtype.itemsize
+        if rows > 0:
+            self.data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(rows,))
+        else:
+            self.data = np.empty((0,), dtype=dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    def column(self, name):
+        """取得單一欄位（memmap 的視圖，不複製）"""
+        return self.data[name]
+
+    def timestamps(self):
+        """絕對時間戳（float64）"""
+        return self.start_time + self.column("t").astype(np.float64)
+
+    def label_indices(self):
+        return self.column("label").astype(np.int64)
+
+    def select(self, label):
+        """取得某個鼓的所有數據列"""
+        return self.data[self.label_indices() == self.labels.index(label)]
+
+
+def load_recording(path):
+    return Recording(path)
+
+
+def convert_json(json_path, out_path=None):
+    """
+    將 get_hitting_data.py 舊版的 drum_sensor_data*.json 轉為 .drumrec
+
+    返回：
+    輸出檔路徑
+    """
+    if out_path is None:
+        out_path = os.path.splitext(json_path)[0] + EXTENSION
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    labels = list(data.keys())
+    start_time = min((readings[0]["timestamp"] for readings in data.values() if readings), default=0.0)
+    with RecordingWriter(out_path, labels, start_time) as writer:
+        for label, readings in data.items():
+            for reading in readings:
+                accel = reading["accelerometer"]
+                gyro = reading["gyroscope"]
+                writer.append(label, reading["timestamp"],
+                              accel["x"], accel["y"], accel["z"],
+                              gyro["x"], gyro["y"], gyro["z"],
+                              reading.get("temperature", 0.0))
+    return out_path
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("convert", "info"):
+        print("用法: python sensor_recording.py convert <json> [輸出檔]")
+        print("      python sensor_recording.py info <drumrec>")
+        sys.exit(1)
+
+    if sys.argv[1] == "convert":
+        out_path = convert_json(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"已轉換: {sys.argv[2]} → {out_path}")
+        path = out_path
+    else:
+        path = sys.argv[2]
+
+    recording = load_recording(path)
+    print(f"{path}: {len(recording)} 筆, {os.path.getsize(path)} bytes")
+    counts = np.bincount(recording.label_indices(), minlength=len(recording.labels))
+    for name, count in zip(recording.labels, counts):
+        print(f"  {name}: {count} 筆數據")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import deque
+
+from bus_scheduler import BusScheduler
+
+# 預設採樣率（Hz）與環形緩衝區大小
+DEFAULT_SAMPLE_RATE = 200
+DEFAULT_BUFFER_SIZE = 1024
+
+
+class SensorSampler:
+    """
+    背景採樣：以固定頻率讀取所有感測器並執行互補濾波
+
+    HTTP 請求只讀取記憶體中的最新數據，不再觸碰 I2C，
+    因此濾波器的 dt 由採樣頻率決定，而不是瀏覽器輪詢的時機。
+    每條總線由一個 BusScheduler 以固定時槽輪流讀取該總線上的感測器，
+    不同總線各自一個執行緒平行運作。
+
+    參數說明：
+    - readers: {"right": channel.update, ...}
+      每個函數回傳 (roll, pitch, yaw, ax, ay, az, gx, gy, gz)
+    - rate_hz: 每個感測器的採樣頻率
+    - buffer_size: 每個通道環形緩衝區保留的樣本數
+    - lock: 預設的 I2C 總線鎖（與其他直接讀取感測器的程式共用）
+    - locks: {名稱: 鎖}，各通道所在總線的鎖；同一個鎖的通道由同一個排程器輪流讀取，
+      不同鎖（不同總線）的通道平行讀取
+    - buses: {名稱: I2C 總線編號}，排程器的名稱（/bus_stats 的 bus<N> 與指標的 bus 標籤）；
+      沒有提供時以分組順序編號
+    """
+
+    def __init__(self, readers, rate_hz=DEFAULT_SAMPLE_RATE,
+                 buffer_size=DEFAULT_BUFFER_SIZE, lock=None, locks=None, buses=None):
+        self.readers = dict(readers)
+        self.rate_hz = float(rate_hz)
+        self.period = 1.0 / self.rate_hz
+        self.lock = lock if lock is not None else threading.Lock()
+
+        # 依總線鎖分組：{id(lock): (lock, [名稱...])}
+        locks = locks or {}
+        buses = buses or {}
+        groups = {}
+        for hand in self.readers:
+            bus_lock = locks.get(hand, self.lock)
+            groups.setdefault(id(bus_lock), (bus_lock, []))[1].append(hand)
+
+        # 每條總線一個排程器；第一條總線完成一個週期即為一輪（/stream 的 tick）
+        self.schedulers = []
+        for index, (bus_lock, hands) in enumerate(groups.values()):
+            self.schedulers.append(BusScheduler(
+                buses.get(hands[0], index), [(hand, self.readers[hand]) for hand in hands], self.rate_hz,
+                bus_lock, self._publish, on_frame=self._tick if index == 0 else None))
+
+        # 最新值：每次更新整個 tuple 的參考（賦值為原子操作，讀取端不需加鎖）
+        self._latest = {hand: None for hand in self.readers}
+        # 環形緩衝區：deque(maxlen) 的 append 為執行緒安全
+        self._history = {hand: deque(maxlen=buffer_size) for hand in self.readers}
+
+        self.sample_count = 0
+        # 每完成一輪採樣就通知等待中的串流連線
+        self._tick_condition = threading.Condition()
+        self.error_count = 0
+
+        # 每個樣本都會呼叫的 listener(hand, sample)，例如敲擊事件引擎
+        self._listeners = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """啟動所有總線排程器（重複呼叫不會建立第二個執行緒）"""
+        with self._start_lock:
+            for scheduler in self.schedulers:
+                scheduler.start()
+
+    def stop(self, timeout=1.0):
+        """停止所有總線排程器"""
+        for scheduler in self.schedulers:
+            scheduler.stop(timeout)
+
+    def add_listener(self, callback):
+        """註冊每個樣本都會呼叫的 callback(hand, sample)（在採樣執行緒中執行）"""
+        self._listeners.append(callback)
+
+    @property
+    def running(self):
+        return any(scheduler.running for scheduler in self.schedulers)
+
+    @property
+    def overrun_count(self):
+        return sum(scheduler.overrun_count for scheduler in self.schedulers)
+
+    def bus_stats(self):
+        """各總線的佔用率、實際採樣率與超時次數"""
+        return {f"bus{scheduler.bus}": scheduler.stats() for scheduler in self.schedulers}
+
+    def _publish(self, hand, sample):
+        """排程器讀到新樣本：更新最新值與緩衝區並通知 listener"""
+        self._latest[hand] = sample
+        self._history[hand].append(sample)
+        for listener in self._listeners:
+            try:
+                listener(hand, sample)
+            except Exception as e:
+                self.error_count += 1
+                print(f"[SensorSampler] listener 錯誤: {e}")
+
+    def _tick(self):
+        with self._tick_condition:
+            self.sample_count += 1
+            self._tick_condition.notify_all()
+
+    def sample_once(self):
+        """不經排程，立即依序讀取一次所有感測器（測試與重播使用）"""
+        for scheduler in self.schedulers:
+            for index in range(len(scheduler.readers)):
+                scheduler.read_slot(index)
+        self._tick()
+
+    def latest(self, hand):
+        """
+        取得最新樣本
+
+        返回：
+        (timestamp_ns, roll, pitch, yaw, ax, ay, az, gx, gy, gz)，尚未有數據時為 None
+        timestamp_ns 為讀取當下的 time.monotonic_ns()
+        """
+        return self._latest[hand]
+
+    def wait_for_sample(self, hand, timeout=1.0):
+        """等待第一筆樣本（啟動後剛開始的請求使用）"""
+        deadline = time.monotonic() + timeout
+        sample = self._latest[hand]
+        while sample is None and time.monotonic() < deadline:
+            time.sleep(self.period)
+            sample = self._latest[hand]
+        return sample
+
+    def wait_for_tick(self, last_tick, timeout=1.0):
+        """
+        等待下一輪採樣完成
+
+        參數說明：
+        - last_tick: 呼叫端上次看到的 sample_count
+
+        返回：
+        目前的 sample_count（逾時則與 last_tick 相同）
+        """
+        with self._tick_condition:
+            self._tick_condition.wait_for(lambda: self.sample_count != last_tick, timeout)
+            return self.sample_count
+
+    def sample_at(self, hand, timestamp):
+        """
+        以緩衝區線性內插出指定時間的樣本，用於對齊不同時槽讀取的左右手數據
+
+        返回：
+        與 latest() 相同格式（時間戳為 timestamp）；超出緩衝區範圍時返回最接近的樣本
+        """
+        samples = self._history[hand]
+        if not samples:
+            return None
+        newer = None
+        for older in reversed(samples):
+            if older[0] <= timestamp:
+                break
+            newer = older
+        else:
+            return newer
+        if newer is None or newer[0] == older[0]:
+            return older
+        ratio = (timestamp - older[0]) / (newer[0] - older[0])
+        # yaw 在 ±180° 處換邊時不內插，避免跨越整圈
+        return (timestamp,) + tuple(
+            a if i == 2 and abs(b - a) > 180 else a + (b - a) * ratio
+            for i, (a, b) in enumerate(zip(older[1:], newer[1:])))
+
+    def aligned(self, hands=None):
+        """
+        取得時間對齊的一組樣本：對齊到各通道最新樣本中最早的時間
+
+        返回：
+        {名稱: 樣本}（尚未有數據的通道為 None）
+        """
+        hands = list(hands) if hands is not None else list(self.readers)
+        latest = [self._latest[hand] for hand in hands]
+        if any(sample is None for sample in latest):
+            return dict(zip(hands, latest))
+        timestamp = min(sample[0] for sample in latest)
+        return {hand: self.sample_at(hand, timestamp) for hand in hands}
+
+    def history(self, hand, count=None):
+        """取得環形緩衝區中最近的樣本（由舊到新）"""
+        samples = list(self._history[hand])
+        if count is not None:
+            samples = samples[-count:]
+        return samples
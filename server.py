@@ -0,0 +1,258 @@
+"""
+正式環境的伺服器入口：eventlet green thread 處理 HTTP，感測器 I/O 留在專用的作業系統執行緒
+
+    python app.py        → Flask 開發伺服器（reloader、debugger、每個連線一個執行緒），開發用
+    python server.py     → 正式環境（樹莓派）
+
+架構：
+- eventlet 只替換 socket / select：每個連線是一個 green thread（數 KB），閒置的 keep-alive
+  連線只是一個停在 socket 上的 greenlet，不佔作業系統執行緒
+- threading 不替換：BusScheduler（I2C 讀取 + 濾波）與 StreamHub 生產者仍是真正的執行緒，
+  就是感測器專用的執行器，阻塞的 I2C 呼叫不會卡住事件迴圈，事件迴圈裡的請求也不會影響採樣時序
+- /stream、/stream.bin 不能在 green thread 中等待 threading.Condition（會卡住整個事件迴圈），
+  因此由 GreenWaker 把生產者的發布通知經由 self-pipe 轉給事件迴圈，再喚醒等待中的 green thread
+
+用法：
+    python server.py [--host 0.0.0.0] [--port 5000]
+    python server.py bench [--seconds 5]    # 與 python app.py 的模式比較 requests/sec、p99 與閒置連線成本
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5000
+MAX_CONNECTIONS = 1024       # 同時處理的連線上限（green thread 數）
+STARTUP_TIMEOUT = 5.0        # 開始接受連線前等待第一筆感測器數據的時間（秒）
+
+
+class GreenWaker:
+    """
+    把作業系統執行緒的發布通知轉給 green thread
+
+    生產者執行緒呼叫 wake()：只寫一個 byte 到 pipe（重複通知合併成一次）；
+    事件迴圈中的一個 greenlet 讀 pipe 後喚醒所有等待中的連線，各連線再以 receive(timeout=0) 取資料。
+    """
+
+    def __init__(self):
+        import eventlet
+
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+        self._signaled = False
+        self._waiters = set()
+        eventlet.spawn_n(self._run)
+
+    def wake(self):
+        """在任何執行緒呼叫"""
+        if not self._signaled:
+            self._signaled = True
+            try:
+                os.write(self._write_fd, b"\0")
+            except BlockingIOError:
+                pass   # pipe 已滿：事件迴圈一定還有未讀的通知
+
+    def _run(self):
+        from eventlet.hubs import trampoline
+
+        while True:
+            trampoline(self._read_fd, read=True)
+            # 先清空 pipe 再清除旗標：清除後的 wake() 一定會寫入新的 byte，通知不會被這次的 read 吃掉
+            try:
+                while os.read(self._read_fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+            self._signaled = False
+            waiters, self._waiters = self._waiters, set()
+            for event in waiters:
+                event.send()
+
+    def receive(self, subscription, timeout=1.0):
+        """app.set_stream_waiter() 用的等待函數：在 green thread 中等待新資料（逾時為空列表）"""
+        import eventlet
+        from eventlet.event import Event
+
+        chunks = subscription.receive(timeout=0)
+        if chunks:
+            return chunks
+        event = Event()
+        self._waiters.add(event)
+        # 登記後再檢查一次，避免在登記前發布的資料要等到下一次通知
+        chunks = subscription.receive(timeout=0)
+        if not chunks:
+            with eventlet.Timeout(timeout, False):
+                event.wait()
+            chunks = subscription.receive(timeout=0)
+        self._waiters.discard(event)
+        return chunks
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, log_output=False):
+    os.environ.setdefault("EVENTLET_NO_GREENDNS", "yes")
+    import eventlet
+
+    # 只替換網路 I/O；threading 維持作業系統執行緒（感測器專用）
+    eventlet.monkey_patch(socket=True, select=True)
+    from eventlet import wsgi
+
+    import app as drum_app
+    import stream_hub
+
+    waker = GreenWaker()
+    stream_hub.add_waker(waker.wake)
+    drum_app.set_stream_waiter(waker.receive)
+
+    # 在接受連線前啟動採樣並等到第一筆數據，請求處理中不會再有初始化的阻塞
+    components = drum_app.start_background()
+    for hand in drum_app.STICK_CHANNELS:
+        if components.sampler.wait_for_sample(hand, timeout=STARTUP_TIMEOUT) is None:
+            print(f"[Server] {hand} 在 {STARTUP_TIMEOUT:.0f} 秒內沒有數據，仍繼續啟動")
+
+    def fair_app(environ, start_response):
+        # 每個請求開始前讓出一次：keep-alive 連線的下一個請求通常已在 socket 中，
+        # 不讓出的話同一條連線會一直被服務，其他連線的延遲變得很長（p99 變差）
+        eventlet.sleep(0)
+        return drum_app.app(environ, start_response)
+
+    print(f"[Server] eventlet 監聽 http://{host}:{port}（最多 {MAX_CONNECTIONS} 個連線）")
+    listener = eventlet.listen((host, port), backlog=128)
+    wsgi.server(listener, fair_app, max_size=MAX_CONNECTIONS, log_output=log_output,
+                keepalive=True, socket_timeout=None)
+
+
+# ==================== 效能比較 ====================
+def _rss_and_threads(pid):
+    """(RSS KB, 執行緒數)，讀取 /proc（僅 Linux）"""
+    rss = threads = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss, threads
+
+
+def _wait_until_ready(port, timeout=20.0):
+    import http.client
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/right_data")
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _load(port, path, clients, seconds):
+    """clients 個 keep-alive 連線持續請求 path，返回 (requests/sec, p50 ms, p99 ms, 錯誤數)"""
+    import http.client
+    import numpy as np
+
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    stop = time.monotonic() + seconds
+
+    def worker(index):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                connection.getresponse().read()
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                continue
+            latencies[index].append(time.perf_counter() - start)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    flat = np.concatenate([np.asarray(lat) for lat in latencies if lat]) if any(latencies) else np.zeros(1)
+    return len(flat) / seconds, np.percentile(flat, 50) * 1000, np.percentile(flat, 99) * 1000, sum(errors)
+
+
+def _idle_cost(pid, port, count):
+    """開啟 count 個閒置連線（不送請求），返回每個連線增加的 (RSS KB, 執行緒數)"""
+    import socket
+
+    time.sleep(0.5)
+    before = _rss_and_threads(pid)
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sockets.append(sock)
+    time.sleep(1.0)
+    after = _rss_and_threads(pid)
+    for sock in sockets:
+        sock.close()
+    return (after[0] - before[0]) / count, after[1] - before[1]
+
+
+MODES = {
+    # python app.py 的模式（不含 reloader 的父行程）
+    "flask-dev": "import app; app.start_background(); "
+                 "app.app.run(host='127.0.0.1', port={port}, debug=True, use_reloader=False, threaded=True)",
+    "eventlet": "import server; server.serve('127.0.0.1', {port})",
+}
+
+
+def bench(seconds, clients_list, idle, recording):
+    env = dict(os.environ, DRUM_REPLAY=recording)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'模式':<11}{'用戶端':>6}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'錯誤':>6}")
+    idle_results = {}
+    for port, (mode, code) in enumerate(MODES.items(), start=5101):
+        process = subprocess.Popen([sys.executable, "-c", code.format(port=port)], cwd=cwd, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_until_ready(port):
+                print(f"{mode}: 伺服器沒有啟動")
+                continue
+            for clients in clients_list:
+                rps, p50, p99, errors = _load(port, "/right_data", clients, seconds)
+                print(f"{mode:<11}{clients:>6}{rps:>9.0f}{p50:>9.2f}{p99:>9.2f}{errors:>6}")
+            idle_results[mode] = _idle_cost(process.pid, port, idle)
+        finally:
+            process.terminate()
+            process.wait(5)
+    print(f"\n閒置連線（{idle} 個，只連線不送請求）的成本：")
+    for mode, (rss_kb, threads) in idle_results.items():
+        print(f"  {mode:<11} 每個連線 {rss_kb:.1f} KB RSS，執行緒 +{threads}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正式環境伺服器（eventlet）")
+    parser.add_argument("command", nargs="?", choices=("serve", "bench"), default="serve")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--log", action="store_true", help="輸出每個請求的存取紀錄")
+    parser.add_argument("--seconds", type=float, default=5.0, help="bench：每個負載的秒數")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50], help="bench：同時連線數")
+    parser.add_argument("--idle", type=int, default=200, help="bench：閒置連線數")
+    parser.add_argument("--recording", default="drum_sensor_data.json", help="bench：以錄製數據代替感測器")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.seconds, args.clients, args.idle, args.recording)
+    else:
+        serve(args.host, args.port, args.log)
+
+
+if __name__ == "__main__":
+    main()
@@ -237,23 +237,46 @@ function updateSensorDisplay(rightData, leftData) {
 let rightData = { "pitch (y軸轉)": 0, "yaw (z軸轉)": 0, "roll (x軸轉)": 0, ax: 0, ay: 0, az: 0, gx: 0, gy: 0, gz: 0, is_hit: false };
 let leftData = { "pitch (y軸轉)": 0, "yaw (z軸轉)": 0, "roll (x軸轉)": 0, ax: 0, ay: 0, az: 0, gx: 0, gy: 0, gz: 0, is_hit: false };
 
+// 串流模式下音效由伺服器的 hit 事件觸發，不再依幀數冷卻
+let useHitEvents = false;
+
+// 右手數據處理（輪詢與串流共用）
+function handleRightData(data) {
+    rightData = data;
+    if (useHitEvents) return;
+    
+    // 右手敲擊偵測
+    if (rightHitCooldown > 0) {
+        rightHitCooldown--;
+    } else if (data.is_hit) {
+        const zone = detectZone(data["pitch (y軸轉)"], data["yaw (z軸轉)"]);
+        console.log(`🥁 Right Hit: ${zone}`);
+        playSound(zone);
+        rightHitCooldown = 8;
+    }
+}
+
+// 左手數據處理（輪詢與串流共用）
+function handleLeftData(data) {
+    leftData = data;
+    if (useHitEvents) return;
+    
+    // 左手敲擊偵測
+    if (leftHitCooldown > 0) {
+        leftHitCooldown--;
+    } else if (data.is_hit) {
+        const zone = detectZone(data["pitch (y軸轉)"], data["yaw (z軸轉)"]);
+        console.log(`🥁 Left Hit: ${zone}`);
+        playSound(zone);
+        leftHitCooldown = 8;
+    }
+}
+
 // 獨立更新右手數據
 function updateRight() {
     fetch("/right_data")
         .then(res => res.json())
-        .then(data => {
-            rightData = data;
-            
-            // 右手敲擊偵測
-            if (rightHitCooldown > 0) {
-                rightHitCooldown--;
-            } else if (data.is_hit) {
-                const zone = detectZone(data["pitch (y軸轉)"], data["yaw (z軸轉)"]);
-                console.log(`🥁 Right Hit: ${zone}`);
-                playSound(zone);
-                rightHitCooldown = 8;
-            }
-        })
+        .then(handleRightData)
         .catch(err => console.log("Right fetch error:", err))
         .finally(() => {
             // 立即發起下一次請求，不等待動畫幀
@@ -265,19 +288,7 @@ function updateRight() {
 function updateLeft() {
     fetch("/left_data")
         .then(res => res.json())
-        .then(data => {
-            leftData = data;
-            
-            // 左手敲擊偵測
-            if (leftHitCooldown > 0) {
-                leftHitCooldown--;
-            } else if (data.is_hit) {
-                const zone = detectZone(data["pitch (y軸轉)"], data["yaw (z軸轉)"]);
-                console.log(`🥁 Left Hit: ${zone}`);
-                playSound(zone);
-                leftHitCooldown = 8;
-            }
-        })
+        .then(handleLeftData)
         .catch(err => console.log("Left fetch error:", err))
         .finally(() => {
             // 立即發起下一次請求，不等待動畫幀
@@ -285,6 +296,32 @@ function updateLeft() {
         });
 }
 
+// 串流模式：一個 SSE 連線同時取得左右手數據
+function startStream() {
+    if (!window.EventSource) {
+        // 瀏覽器不支援 SSE 時退回輪詢
+        updateRight();
+        updateLeft();
+        return;
+    }
+    const source = new EventSource("/stream");
+    useHitEvents = true;
+    source.onmessage = (event) => {
+        const frame = JSON.parse(event.data);
+        handleRightData(frame.right);
+        handleLeftData(frame.left);
+    };
+    // 伺服器端去抖動後的敲擊事件：使用 2D 畫面的區塊判斷打到哪個鼓
+    source.addEventListener("hit", (event) => {
+        const hit = JSON.parse(event.data);
+        const data = hit.hand === "right" ? rightData : leftData;
+        const zone = detectZone(data["pitch (y軸轉)"], data["yaw (z軸轉)"]);
+        console.log(`🥁 ${hit.hand === "right" ? "Right" : "Left"} Hit: ${zone}`);
+        playSound(zone);
+    });
+    source.onerror = (err) => console.log("Stream error (auto reconnecting):", err);
+}
+
 // 畫面渲染迴圈（60 FPS）
 function render() {
     // 使用最新的數據繪製
@@ -302,6 +339,5 @@ function render() {
 }
 
 // 啟動所有迴圈
-updateRight();
-updateLeft();
+startStream();
 render();
@@ -43,7 +43,7 @@ async function enableAudio() {
     }
 }
 
-function playSound(name) {
+function playSound(name, velocity = 1.0) {
     if (!audioEnabled || !audioCtx || !audioBuffers[name]) return;
     
     try {
@@ -63,7 +63,7 @@ function playSound(name) {
         const source = audioCtx.createBufferSource();
         source.buffer = audioBuffers[name];
         const gainNode = audioCtx.createGain();
-        gainNode.gain.value = 0.8;
+        gainNode.gain.value = 0.8 * velocity;  // 依敲擊力度調整音量
         source.connect(gainNode);
         gainNode.connect(audioCtx.destination);
         
@@ -829,7 +829,8 @@ function draw(rightPitch, rightYaw, leftPitch, leftYaw, rightAdjustedPitch, left
     
     // 檢測右手打擊
     if (rightHitDrum) {
-        if (!rightWasColliding && rightHitCooldown <= 0) {
+        // 串流模式由伺服器的敲擊事件播放音效，這裡只處理輪詢模式
+        if (!useHitEvents && !rightWasColliding && rightHitCooldown <= 0) {
             playSound(rightHitDrum);
             triggerDrumGlow(rightHitDrum); // 觸發發光
             rightHitCooldown = 10; // 冷卻時間 (幀數)
@@ -889,7 +890,8 @@ function draw(rightPitch, rightYaw, leftPitch, leftYaw, rightAdjustedPitch, left
     
     // 檢測左手打擊
     if (leftHitDrum) {
-        if (!leftWasColliding && leftHitCooldown <= 0) {
+        // 串流模式由伺服器的敲擊事件播放音效，這裡只處理輪詢模式
+        if (!useHitEvents && !leftWasColliding && leftHitCooldown <= 0) {
             playSound(leftHitDrum);
             triggerDrumGlow(leftHitDrum); // 觸發發光
             leftHitCooldown = 10;
@@ -1023,6 +1025,53 @@ function updateLeft() {
         .finally(() => setTimeout(updateLeft, 0));
 }
 
+// 串流模式：伺服器每輪採樣推送一次左右手合併數據（一個連線取代兩個輪詢迴圈）
+let useHitEvents = false;  // 串流模式下音效由伺服器的 hit 事件觸發
+
+// 伺服器端去抖動後的敲擊事件（每次揮擊只會收到一次）
+function handleHitEvent(hit) {
+    if (!hit.drum) return;
+    playSound(hit.drum, hit.velocity);
+    triggerDrumGlow(hit.drum);
+    console.log(`🥁 ${hit.hand === "right" ? "Right" : "Left"} Hit (Event): ${hit.drum}`);
+}
+
+// 二進位串流（網址加上 ?wire=binary，可用 &fields=pitch,yaw,apitch 只取需要的欄位）
+function startWireStream(fields) {
+    useHitEvents = true;
+    openWireStream(fields, (frame) => {
+        // 只選部分欄位時，其他欄位保留原值
+        rightData = Object.assign({}, rightData, frame.right);
+        leftData = Object.assign({}, leftData, frame.left);
+    }, handleHitEvent).catch((err) => {
+        console.log("Binary stream error, falling back to SSE:", err);
+        startStream(false);
+    });
+}
+
+function startStream(allowBinary = true) {
+    const params = new URLSearchParams(window.location.search);
+    if (allowBinary && params.get("wire") === "binary" && window.ReadableStream && window.openWireStream) {
+        startWireStream(params.get("fields") || "");
+        return;
+    }
+    if (!window.EventSource) {
+        // 瀏覽器不支援 SSE 時退回輪詢
+        updateRight();
+        updateLeft();
+        return;
+    }
+    const source = new EventSource("/stream");
+    useHitEvents = true;
+    source.onmessage = (event) => {
+        const frame = JSON.parse(event.data);
+        rightData = frame.right;
+        leftData = frame.left;
+    };
+    source.addEventListener("hit", (event) => handleHitEvent(JSON.parse(event.data)));
+    source.onerror = (err) => console.log("Stream error (auto reconnecting):", err);
+}
+
 function render() {
     draw(
         rightData["pitch (y軸轉)"], 
@@ -1040,8 +1089,7 @@ function render() {
 // 初始化並啟動
 init3D();
 get_drum_surface();  // 計算所有鼓面的幾何數據
-updateRight();
-updateLeft();
+startStream();
 render();
 
 // 點擊畫面任意處啟動音效
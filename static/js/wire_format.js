@@ -0,0 +1,114 @@
+// 感測器幀的二進位格式解碼器（格式定義見 wire_format.py）
+// 以 DataView 直接讀取 ArrayBuffer，不需要 JSON.parse，也不產生中間字串
+
+const WIRE_MAGIC = 0x44;
+const WIRE_VERSION = 2;
+const WIRE_KIND_FRAME = 1;
+const WIRE_KIND_HIT = 2;
+const WIRE_HEADER_SIZE = 8;
+const WIRE_NO_DRUM = 255;
+const WIRE_TYPE_SIZE = { f: 4, d: 8, B: 1, Q: 8 };
+
+// 取得欄位排列與鼓名稱表（/wire_format）
+async function fetchWireLayout() {
+    const response = await fetch("/wire_format");
+    return response.json();
+}
+
+function readWireValue(view, offset, type) {
+    if (type === "f") return view.getFloat32(offset, true);
+    if (type === "d") return view.getFloat64(offset, true);
+    // 奈秒時間戳：轉成 Number（2^53 ns 約 104 天的開機時間內不失精度）
+    if (type === "Q") return Number(view.getBigUint64(offset, true));
+    return view.getUint8(offset);
+}
+
+// 解碼一則訊息
+// 返回：幀為 { kind: "frame", right: {...}, left: {...} }（鍵名與 /right_data 相同）
+//       敲擊為 { kind: "hit", seq, hand, drum, velocity, timestamp（monotonic 奈秒）, latencyMs }
+//       名稱表過期時為 { kind: "stale" }（應重新呼叫 fetchWireLayout）
+function decodeWireMessage(view, offset, layout) {
+    if (view.getUint8(offset) !== WIRE_MAGIC || view.getUint8(offset + 1) !== WIRE_VERSION) {
+        throw new Error("不是 drum wire 格式的訊息");
+    }
+    const kind = view.getUint8(offset + 2);
+    if (view.getUint8(offset + 3) !== layout.layout) {
+        return { kind: "stale" };
+    }
+    const mask = view.getUint32(offset + 4, true);
+    let position = offset + WIRE_HEADER_SIZE;
+
+    if (kind === WIRE_KIND_HIT) {
+        const drum = view.getUint8(position + 5);
+        return {
+            kind: "hit",
+            seq: view.getUint32(position, true),
+            hand: layout.hands[view.getUint8(position + 4)],
+            drum: drum === WIRE_NO_DRUM ? null : layout.drums[drum],
+            velocity: view.getFloat32(position + 6, true),
+            timestamp: Number(view.getBigUint64(position + 10, true)),
+            latencyMs: view.getUint32(position + 18, true) / 1000,
+        };
+    }
+
+    const fields = layout.fields.filter((field, index) => (mask >>> index) & 1);
+    const frame = { kind: "frame" };
+    for (const hand of layout.hands) {
+        const data = {};
+        for (const field of fields) {
+            let value = readWireValue(view, position, field.type);
+            position += WIRE_TYPE_SIZE[field.type];
+            if (field.name === "drum") {
+                value = value === WIRE_NO_DRUM ? null : layout.drums[value];
+            } else if (field.name === "hit") {
+                value = value !== 0;
+            }
+            data[field.key] = value;
+        }
+        frame[hand] = data;
+    }
+    return frame;
+}
+
+// 開啟二進位串流（/stream.bin）：fetch 的 ReadableStream 逐塊讀取，
+// 每則訊息前有 uint16 長度（0 為保持連線），跨塊的訊息先暫存
+// fields: 例如 "pitch,yaw,apitch,hit"（空字串為全部欄位）
+async function openWireStream(fields, onFrame, onHit) {
+    let layout = await fetchWireLayout();
+    const response = await fetch("/stream.bin?fields=" + encodeURIComponent(fields));
+    const reader = response.body.getReader();
+    let pending = new Uint8Array(0);
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        // 接上上一塊剩下的不完整訊息
+        let buffer = value;
+        if (pending.length) {
+            buffer = new Uint8Array(pending.length + value.length);
+            buffer.set(pending);
+            buffer.set(value, pending.length);
+        }
+        const view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+
+        let offset = 0;
+        while (offset + 2 <= buffer.length) {
+            const length = view.getUint16(offset, true);
+            if (offset + 2 + length > buffer.length) break;
+            if (length > 0) {
+                const message = decodeWireMessage(view, offset + 2, layout);
+                if (message.kind === "frame") {
+                    onFrame(message);
+                } else if (message.kind === "hit") {
+                    onHit(message);
+                } else {
+                    // 3d_settings.js 已重新載入，鼓名稱表改變
+                    layout = await fetchWireLayout();
+                }
+            }
+            offset += 2 + length;
+        }
+        pending = buffer.slice(offset);
+    }
+}
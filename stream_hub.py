@@ -0,0 +1,294 @@
+"""
+串流發布/訂閱中心：一個生產者每輪只計算與編碼一次，所有訂閱者共用同一份 bytes
+
+    hub = StreamHub(produce)          # produce(last_tick) -> (tick, payload 或 None)
+    subscription = hub.subscribe()
+    chunks = subscription.receive(timeout=1.0)   # [事件..., 最新幀]，逾時為 []
+    subscription.close()
+
+背壓：每個訂閱者只記住自己看過的序號，不持有佇列。
+- 幀：慢的訂閱者醒來時只拿到最新一幀，中間的幀直接跳過（計入 drum_stream_dropped_frames_total）
+- 事件（敲擊）：保存在共用的環形緩衝區，落後超過 EVENT_BACKLOG 個事件時才會遺失
+
+生產者執行緒在第一個訂閱者出現時啟動，沒有訂閱者時停在條件變數上，不會空轉。
+
+用法：
+    python stream_hub.py              # 1 / 10 / 50 個用戶端的吞吐量與延遲（含每個用戶端各自編碼的對照）
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+
+from metrics import counter
+
+EVENT_BACKLOG = 256        # 共用事件緩衝區大小（每個訂閱者最多可落後的事件數）
+
+# 任何 hub 發布後呼叫的 callback（例如 server.py 用來喚醒 green thread）
+_wakers = []
+
+
+def add_waker(callback):
+    """註冊發布通知 callback()：在生產者執行緒中呼叫，必須立即返回"""
+    _wakers.append(callback)
+
+
+def _wake():
+    for waker in _wakers:
+        waker()
+
+
+class StreamHub:
+    """
+    參數說明：
+    - produce: produce(last_tick) -> (tick, payload)；阻塞直到有新的一輪（或逾時），
+      payload 為已編碼的 bytes，逾時或沒有新數據時為 None。在生產者執行緒中呼叫。
+    - name: 指標標籤
+    """
+
+    def __init__(self, produce, name="stream"):
+        self.produce = produce
+        self.name = name
+        self._condition = threading.Condition()
+        self._frame_seq = 0
+        self._frame = b""
+        self._event_seq = 0
+        self._events = deque(maxlen=EVENT_BACKLOG)   # (序號, bytes)
+        self.subscriber_count = 0
+        self.produced_count = 0
+        self._thread = None
+        self._dropped_frames = counter("drum_stream_dropped_frames_total", stream=name)
+        self._dropped_events = counter("drum_stream_dropped_events_total", stream=name)
+
+    # ==================== 生產者 ====================
+    def publish_frame(self, payload):
+        """發布一幀（取代前一幀）"""
+        with self._condition:
+            self._frame_seq += 1
+            self._frame = payload
+            self.produced_count += 1
+            self._condition.notify_all()
+        _wake()
+
+    def publish_event(self, payload):
+        """發布一個事件（每個訂閱者都會收到，除非落後超過 EVENT_BACKLOG）"""
+        with self._condition:
+            self._event_seq += 1
+            self._events.append((self._event_seq, payload))
+            self._condition.notify_all()
+        _wake()
+
+    def _run(self):
+        tick = -1
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.subscriber_count > 0)
+            try:
+                tick, payload = self.produce(tick)
+            except Exception as e:
+                print(f"[StreamHub] {self.name} 產生幀失敗: {e}")
+                time.sleep(0.1)
+                continue
+            if payload is not None:
+                self.publish_frame(payload)
+
+    def _ensure_producer(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"StreamHub-{self.name}", daemon=True)
+            self._thread.start()
+
+    # ==================== 訂閱者 ====================
+    def subscribe(self):
+        """新增訂閱者；第一次 receive() 會立即拿到目前的最新幀"""
+        with self._condition:
+            self.subscriber_count += 1
+            subscription = Subscription(self, self._frame_seq - 1 if self._frame_seq else 0, self._event_seq)
+        self._ensure_producer()
+        return subscription
+
+    def _unsubscribe(self):
+        with self._condition:
+            self.subscriber_count -= 1
+
+
+class Subscription:
+    """單一訂閱者的讀取位置（由 StreamHub.subscribe() 建立）"""
+
+    __slots__ = ("hub", "frame_seq", "event_seq", "closed")
+
+    def __init__(self, hub, frame_seq, event_seq):
+        self.hub = hub
+        self.frame_seq = frame_seq
+        self.event_seq = event_seq
+        self.closed = False
+
+    def receive(self, timeout=1.0):
+        """
+        等待新的事件或幀（timeout=0 為不等待）
+
+        返回：
+        [事件 bytes..., 最新幀 bytes]（依序送出即可）；逾時為空列表
+        """
+        hub = self.hub
+        with hub._condition:
+            hub._condition.wait_for(
+                lambda: hub._frame_seq != self.frame_seq or hub._event_seq != self.event_seq, timeout)
+            frame_seq, frame = hub._frame_seq, hub._frame
+            event_seq = hub._event_seq
+            if event_seq != self.event_seq:
+                events = [payload for seq, payload in hub._events if seq > self.event_seq]
+            else:
+                events = []
+
+        chunks = events
+        missed_events = event_seq - self.event_seq - len(events)
+        if missed_events > 0:
+            hub._dropped_events.inc(missed_events)
+        self.event_seq = event_seq
+        if frame_seq != self.frame_seq:
+            if frame_seq - self.frame_seq > 1 and self.frame_seq:
+                hub._dropped_frames.inc(frame_seq - self.frame_seq - 1)
+            self.frame_seq = frame_seq
+            chunks.append(frame)
+        return chunks
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub._unsubscribe()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ==================== 效能測試 ====================
+def _benchmark_frame(tick):
+    """模擬 /stream 的左右手合併幀（約 600 bytes）"""
+    hand = {"roll (x軸轉)": 12.3456, "pitch (y軸轉)": -45.678, "yaw (z軸轉)": 90.12,
+            "ax": 0.12, "ay": -0.34, "az": 9.81, "gx": 1.5, "gy": -80.2, "gz": 0.4,
+            "is_hit": False, "hit_drum": "Snare", "adjusted_pitch": -40.1, "timestamp": tick * 0.005}
+    frame = {"right": hand, "left": dict(hand, hit_drum="Tom1")}
+    return ("data: " + json.dumps(frame, ensure_ascii=False) + "\n\n").encode("utf-8")
+
+
+def run_benchmark(clients, seconds=3.0, rate_hz=200, mode="hub", slow_clients=0, slow_delay=0.05):
+    """
+    以合成的 200 Hz 生產者測試扇出
+
+    參數說明：
+    - mode: "hub"（一次編碼，共用 bytes）或 "per-client"（每個用戶端各自編碼，舊做法的對照）
+    - slow_clients: 其中幾個用戶端每次讀取後睡 slow_delay 秒（模擬慢速網路）
+
+    返回：
+    {"clients", "encodes", "frames_per_client", "deliveries_per_sec", "latency_p50_ms", "latency_p99_ms", "slow_frames"}
+    """
+    period = 1.0 / rate_hz
+    tick_condition = threading.Condition()
+    state = {"tick": 0, "time": 0.0, "encodes": 0}
+    stop = threading.Event()
+
+    def ticker():
+        deadline = time.perf_counter()
+        while not stop.is_set():
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with tick_condition:
+                state["tick"] += 1
+                state["time"] = time.perf_counter()
+                tick_condition.notify_all()
+
+    def wait_tick(last_tick):
+        with tick_condition:
+            tick_condition.wait_for(lambda: state["tick"] != last_tick, 1.0)
+            return state["tick"], state["time"]
+
+    def encode(tick, tick_time):
+        state["encodes"] += 1
+        return tick_time, _benchmark_frame(tick)
+
+    hub = None
+    if mode == "hub":
+        def produce(last_tick):
+            tick, tick_time = wait_tick(last_tick)
+            if tick == last_tick:
+                return tick, None
+            return tick, encode(tick, tick_time)
+        hub = StreamHub(produce, name="benchmark")
+
+    latencies = [[] for _ in range(clients)]
+    received = [0] * clients
+
+    def client(index):
+        slow = index < slow_clients
+        if hub is not None:
+            with hub.subscribe() as subscription:
+                while not stop.is_set():
+                    for tick_time, _ in subscription.receive(0.5):
+                        latencies[index].append(time.perf_counter() - tick_time)
+                        received[index] += 1
+                    if slow:
+                        time.sleep(slow_delay)
+        else:
+            tick = -1
+            while not stop.is_set():
+                new_tick, tick_time = wait_tick(tick)
+                if new_tick == tick:
+                    continue
+                tick = new_tick
+                encode(tick, tick_time)
+                latencies[index].append(time.perf_counter() - tick_time)
+                received[index] += 1
+                if slow:
+                    time.sleep(slow_delay)
+
+    threads = [threading.Thread(target=ticker, daemon=True)]
+    threads += [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(2.0)
+
+    import numpy as np
+    fast = [lat for i, lat in enumerate(latencies) if i >= slow_clients]
+    flat = np.concatenate([np.asarray(lat) for lat in fast if lat]) if any(fast) else np.zeros(1)
+    fast_counts = received[slow_clients:] or [0]
+    return {
+        "clients": clients,
+        "encodes": state["encodes"],
+        "ticks": state["tick"],
+        "frames_per_client": sum(fast_counts) / len(fast_counts),
+        "deliveries_per_sec": sum(received) / seconds,
+        "latency_p50_ms": float(np.percentile(flat, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(flat, 99) * 1000),
+        "slow_frames": received[:slow_clients],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StreamHub 扇出效能測試")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--slow", type=int, default=1, help="其中幾個用戶端為慢速（每次讀取後睡 50 ms）")
+    args = parser.parse_args()
+
+    print(f"{'模式':<11}{'用戶端':>6}{'編碼次數':>9}{'輪次':>7}{'每個用戶端幀數':>12}"
+          f"{'送出/秒':>10}{'p50 ms':>9}{'p99 ms':>9}  慢速用戶端幀數")
+    for clients in args.clients:
+        for mode in ("hub", "per-client"):
+            slow = min(args.slow, clients - 1)
+            result = run_benchmark(clients, args.seconds, mode=mode, slow_clients=slow)
+            print(f"{mode:<11}{clients:>6}{result['encodes']:>11}{result['ticks']:>9}"
+                  f"{result['frames_per_client']:>16.0f}{result['deliveries_per_sec']:>12.0f}"
+                  f"{result['latency_p50_ms']:>9.2f}{result['latency_p99_ms']:>9.2f}  {result['slow_frames']}")
+
+
+if __name__ == "__main__":
+    main()
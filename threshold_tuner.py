@@ -0,0 +1,316 @@
+"""
+敲擊門檻自動調整：在錄製數據上以向量化的網格搜尋，為每隻手選出 GYRO / ACCEL 門檻
+
+hit_detector.py 的 GYRO_THRESHOLD / ACCEL_THRESHOLD 是手動調的，而且左右手共用；
+兩個感測器的偏移差很多，同一組門檻不一定適合兩隻手。
+
+參考敲擊（正確答案）：錄製檔只標記「正在打哪個鼓」，沒有每次敲擊的時間，
+因此以撞擊瞬間加速度計飽和（原始 |az| 達到 ±2 g 量程，正負方向都算）的起點作為一次敲擊
+（drum_sensor_data.json 中有 253 次）。
+
+偵測模型就是 HitDetector.process 的反應式狀態機（不含預測器與分類器，它們不影響敲擊的時間點）：
+IDLE 時 |gy| > G 且 max(|ax|, |az|) > A 開始揮擊 → 追蹤 |gy| 峰值 → 回落時在峰值發出事件
+→ 峰值後 REFRACTORY_PERIOD 內不再觸發。狀態機本質上是循序的，因此時間方向逐樣本前進，
+每一步以長度 G×A 的 NumPy 向量同時更新所有門檻組合的狀態，結果與 HitDetector 逐一重播完全一致。
+- 偵測正確：事件的峰值落在某個參考敲擊的 [撞擊 - MATCH_BEFORE, 撞擊 + MATCH_AFTER] 內
+- 召回率：視窗內有事件的參考敲擊比例；精確率：偵測正確的事件比例
+以 F1 最高者為準；F1 與精確率都相同時，取最接近 hit_detector.py 預設值的組合。
+
+寫入前一定以真正的 HitDetector 重播確認：選出的門檻 F1 比預設值低時不寫入。
+結果寫入 hit_thresholds.json（以通道名稱為鍵），app.py 啟動時讀取；沒有調整過的手使用預設值。
+
+用法：
+    python threshold_tuner.py drum_sensor_data.json                  # 調整左手（錄製時使用 0x69）
+    python threshold_tuner.py take1.drumrec take2.drumrec --hand right
+    python threshold_tuner.py drum_sensor_data.json --dry-run        # 只顯示結果，不寫入
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from hit_detector import ACCEL_THRESHOLD, GYRO_THRESHOLD, PEAK_RELEASE_RATIO, REFRACTORY_NS
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hit_thresholds.json")
+THRESHOLDS_VERSION = 1
+
+ACCEL_FULL_SCALE = 2 * 9.80665   # ±2 g 量程（m/s²），見 mpu6050_fifo.py
+IMPACT_FRACTION = 0.98           # 原始加速度達到量程的 98% 視為撞擊飽和
+MATCH_BEFORE = 0.15              # 撞擊前多久內的偵測算命中（秒）：偵測通常在揮擊途中、撞擊之前
+MATCH_AFTER = 0.05               # 撞擊後多久內的偵測算命中（秒）
+
+GYRO_GRID = (0.0, 250.0, 2.5)    # (起點, 終點, 間隔)：°/s
+ACCEL_GRID = (0.0, 20.0, 0.25)   # m/s²
+
+
+def load_thresholds(path=THRESHOLDS_PATH):
+    """
+    讀取調整後的門檻；檔案不存在或損毀時返回空 dict
+
+    返回：
+    {手: (gyro_threshold, accel_threshold)}
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != THRESHOLDS_VERSION:
+        return {}
+    return {hand: (float(entry["gyro"]), float(entry["accel"]))
+            for hand, entry in data.get("hands", {}).items()}
+
+
+def save_thresholds(hand, entry, path=THRESHOLDS_PATH):
+    """寫入（覆蓋）單手的門檻，其他手保持不變"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        hands = data.get("hands", {}) if data.get("version") == THRESHOLDS_VERSION else {}
+    except (OSError, ValueError):
+        hands = {}
+    hands[hand] = entry
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": THRESHOLDS_VERSION, "hands": hands}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path, hand):
+    """
+    錄製檔只轉換一次為 NumPy 陣列（扣除該手感測器的偏移，與執行時的數值一致）
+
+    返回：
+    {"timestamps"（ns，與 replay_sensor.run_benchmark 相同）, "gy", "accel"（max(|ax|, |az|)）,
+     "impacts"（參考敲擊的樣本索引）, "period", "samples"（(n, 6) 校正後數值）}
+    """
+    from replay_sensor import load_recording
+    from sensor_channel import get_channel
+
+    recording, _, _ = load_recording(path)
+    raw = recording[:, 1:]
+    samples = raw - np.asarray(get_channel(hand).offsets)
+    period = float(np.median(np.diff(recording[:, 0]))) if len(recording) > 1 else 0.005
+
+    saturated = np.abs(raw[:, 2]) >= ACCEL_FULL_SCALE * IMPACT_FRACTION
+    impacts = np.flatnonzero(saturated & ~np.concatenate(([False], saturated[:-1])))
+    return {
+        "timestamps": (recording[:, 0] * 1e9).astype(np.int64),
+        "gy": samples[:, 4],
+        "accel": np.maximum(np.abs(samples[:, 0]), np.abs(samples[:, 2])),
+        "impacts": impacts,
+        "period": period,
+        "samples": samples,
+    }
+
+
+def _grid(spec):
+    start, stop, step = spec
+    return np.arange(start, stop + step / 2, step)
+
+
+def _match_windows(arrays):
+    """
+    每個樣本索引 j 作為事件峰值時，命中的參考敲擊範圍 [first[j], last[j])（撞擊依時間排序，視窗等寬，因此連續）
+    """
+    impacts, period = arrays["impacts"], arrays["period"]
+    indices = np.arange(len(arrays["gy"]))
+    first = np.searchsorted(impacts, indices - int(round(MATCH_AFTER / period)), side="left")
+    last = np.searchsorted(impacts, indices + int(round(MATCH_BEFORE / period)), side="right")
+    return first, last
+
+
+def sweep(arrays, gyro_grid, accel_grid):
+    """
+    對所有 (G, A) 組合同時執行 HitDetector.process 的狀態機
+
+    返回：
+    (found, correct, events)：shape (len(gyro_grid), len(accel_grid)) 的 int 陣列
+    - found: 有事件命中的參考敲擊數
+    - correct: 峰值落在參考敲擊視窗內的事件數
+    - events: 事件總數
+    """
+    timestamps = arrays["timestamps"]
+    abs_gy = np.abs(arrays["gy"])
+    accel = arrays["accel"]
+    first, last = _match_windows(arrays)
+    shape = (len(gyro_grid), len(accel_grid))
+    gyro = np.repeat(np.asarray(gyro_grid, dtype=np.float64), shape[1])     # (K,)，K = G×A
+    accel_threshold = np.tile(np.asarray(accel_grid, dtype=np.float64), shape[0])
+
+    swinging = np.zeros(gyro.shape, dtype=bool)
+    peak = np.zeros(gyro.shape)
+    peak_index = np.zeros(gyro.shape, dtype=np.int64)
+    refractory_until = np.full(gyro.shape, np.iinfo(np.int64).min, dtype=np.int64)
+    next_impact = np.zeros(gyro.shape, dtype=np.int64)   # 尚未命中的第一個參考敲擊（事件的峰值依時間遞增）
+    found = np.zeros(gyro.shape, dtype=np.int64)
+    correct = np.zeros(gyro.shape, dtype=np.int64)
+    events = np.zeros(gyro.shape, dtype=np.int64)
+
+    for i in range(len(abs_gy)):
+        g = abs_gy[i]
+        # IDLE（含不應期已過的 REFRACTORY）：電平條件成立時開始揮擊
+        start = ~swinging & (timestamps[i] >= refractory_until) & (g > gyro) & (accel[i] > accel_threshold)
+        # SWINGING：|gy| 增加時更新峰值；降到峰值的 PEAK_RELEASE_RATIO 以下或門檻以下時發出事件
+        rising = swinging & (g > peak)
+        release = swinging & ~rising & ((g < peak * PEAK_RELEASE_RATIO) | (g <= gyro))
+        update = start | rising
+        peak[update] = g
+        peak_index[update] = i
+
+        if release.any():
+            k = np.flatnonzero(release)
+            p = peak_index[k]
+            events[k] += 1
+            correct[k] += last[p] > first[p]
+            low = np.maximum(first[p], next_impact[k])
+            found[k] += np.maximum(0, last[p] - low)
+            next_impact[k] = np.maximum(next_impact[k], last[p])
+            refractory_until[k] = timestamps[p] + REFRACTORY_NS
+            swinging[k] = False
+        swinging |= start
+
+    return found.reshape(shape), correct.reshape(shape), events.reshape(shape)
+
+
+def _scores(found, correct, events, total):
+    """返回 (precision, recall, f1)；輸入可以是純量或陣列"""
+    found, correct, events = (np.asarray(x, dtype=np.float64) for x in (found, correct, events))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(events > 0, correct / events, 0.0)
+        recall = found / total if total else np.zeros_like(precision)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return precision, recall, f1
+
+
+def tune(recordings, hand, gyro_grid=None, accel_grid=None):
+    """
+    參數說明：
+    - recordings: 錄製檔路徑列表（同一隻手）
+    - hand: 通道名稱（決定扣除哪個感測器的偏移）
+
+    返回：
+    {"gyro", "accel", "precision", "recall", "f1", "events", "impacts", "combinations", "seconds",
+     "default": {"precision", "recall", "f1", "events"}}
+    """
+    gyro_grid = _grid(GYRO_GRID) if gyro_grid is None else np.asarray(gyro_grid, dtype=np.float64)
+    accel_grid = _grid(ACCEL_GRID) if accel_grid is None else np.asarray(accel_grid, dtype=np.float64)
+    datasets = [load_arrays(path, hand) for path in recordings]
+    total = sum(len(arrays["impacts"]) for arrays in datasets)
+
+    start = time.perf_counter()
+    counts = [np.zeros((len(gyro_grid), len(accel_grid)), dtype=np.int64) for _ in range(3)]
+    for arrays in datasets:
+        for count, value in zip(counts, sweep(arrays, gyro_grid, accel_grid)):
+            count += value
+    precision, recall, f1 = _scores(*counts, total)
+    seconds = time.perf_counter() - start
+
+    # F1 → 精確率 → 與預設值的距離（以格子大小正規化）
+    distance = (np.abs(gyro_grid - GYRO_THRESHOLD)[:, None] / (np.ptp(gyro_grid) or 1.0)
+                + np.abs(accel_grid - ACCEL_THRESHOLD)[None, :] / (np.ptp(accel_grid) or 1.0))
+    order = np.lexsort((distance.ravel(), -precision.ravel(), -np.round(f1.ravel(), 12)))
+    g, a = np.unravel_index(order[0], f1.shape)
+
+    default_counts = [0, 0, 0]
+    for arrays in datasets:
+        for index, value in enumerate(sweep(arrays, [GYRO_THRESHOLD], [ACCEL_THRESHOLD])):
+            default_counts[index] += int(value[0, 0])
+    default = _scores(*default_counts, total)
+
+    return {
+        "gyro": float(gyro_grid[g]),
+        "accel": float(accel_grid[a]),
+        "precision": float(precision[g, a]),
+        "recall": float(recall[g, a]),
+        "f1": float(f1[g, a]),
+        "events": int(counts[2][g, a]),
+        "impacts": total,
+        "combinations": f1.size,
+        "seconds": seconds,
+        "default": {"precision": float(default[0]), "recall": float(default[1]), "f1": float(default[2]),
+                    "events": default_counts[2]},
+    }
+
+
+def validate(recordings, hand, thresholds):
+    """
+    以真正的 HitDetector 逐一重播，確認向量化模型選出的門檻（寫入前的最後檢查）
+
+    返回：
+    {"precision", "recall", "f1", "events"}
+    """
+    from drum_collision import get_detector
+    from hit_detector import HitDetector
+
+    found = correct = events = total = 0
+    for path in recordings:
+        arrays = load_arrays(path, hand)
+        # 樣本時間戳是錄製檔的相對時間：clock=None，不計算事件延遲
+        detector = HitDetector(get_detector(), hands=(hand,), thresholds={hand: thresholds}, clock=None)
+        peaks = []
+        timestamps = arrays["timestamps"]
+        for timestamp, values in zip(timestamps.tolist(), arrays["samples"].tolist()):
+            event = detector.process(hand, (timestamp, 0.0, 0.0, 0.0, *values))
+            if event is not None:
+                peaks.append(event["timestamp"])
+        first, last = _match_windows(arrays)
+        peaks = np.searchsorted(timestamps, np.asarray(peaks, dtype=np.int64))
+        hit = np.zeros(len(arrays["impacts"]), dtype=bool)
+        for p in peaks:
+            hit[first[p]:last[p]] = True
+        found += int(np.count_nonzero(hit))
+        correct += int(np.count_nonzero(last[peaks] > first[peaks]))
+        events += len(peaks)
+        total += len(arrays["impacts"])
+    precision, recall, f1 = _scores(found, correct, events, total)
+    return {"precision": float(precision), "recall": float(recall), "f1": float(f1), "events": events}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="敲擊門檻自動調整（向量化網格搜尋）")
+    parser.add_argument("recordings", nargs="+", help="同一隻手的錄製檔（.drumrec 或舊版 JSON）")
+    parser.add_argument("--hand", default="left", help="通道名稱（drum_sensor_data.json 為左手 0x69）")
+    parser.add_argument("--gyro-step", type=float, default=GYRO_GRID[2], help="GYRO 門檻的間隔（°/s）")
+    parser.add_argument("--accel-step", type=float, default=ACCEL_GRID[2], help="ACCEL 門檻的間隔（m/s²）")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示結果，不寫入 hit_thresholds.json")
+    args = parser.parse_args()
+
+    gyro_grid = _grid(GYRO_GRID[:2] + (args.gyro_step,))
+    accel_grid = _grid(ACCEL_GRID[:2] + (args.accel_step,))
+    result = tune(args.recordings, args.hand, gyro_grid, accel_grid)
+    default = result["default"]
+    print(f"{args.hand}: {result['impacts']} 次參考敲擊，{result['combinations']} 組門檻，"
+          f"{result['seconds'] * 1000:.0f} ms")
+    print(f"  預設  |gy| > {GYRO_THRESHOLD:g}, max(|ax|, |az|) > {ACCEL_THRESHOLD:g}：{default['events']} 個事件，"
+          f"精確率 {default['precision']:.1%}，召回率 {default['recall']:.1%}，F1 {default['f1']:.3f}")
+    print(f"  最佳  |gy| > {result['gyro']:g}, max(|ax|, |az|) > {result['accel']:g}：{result['events']} 個事件，"
+          f"精確率 {result['precision']:.1%}，召回率 {result['recall']:.1%}，F1 {result['f1']:.3f}")
+
+    checks = {}
+    for name, thresholds in (("預設", (GYRO_THRESHOLD, ACCEL_THRESHOLD)), ("最佳", (result["gyro"], result["accel"]))):
+        checks[name] = check = validate(args.recordings, args.hand, thresholds)
+        print(f"  HitDetector 重播（{name}）：{check['events']} 個事件，"
+              f"精確率 {check['precision']:.1%}，召回率 {check['recall']:.1%}，F1 {check['f1']:.3f}")
+    if checks["最佳"]["f1"] < checks["預設"]["f1"]:
+        print("HitDetector 重播的 F1 比預設門檻低，不寫入")
+        raise SystemExit(1)
+
+    if args.dry_run:
+        return
+    save_thresholds(args.hand, {
+        "gyro": result["gyro"],
+        "accel": result["accel"],
+        "precision": round(checks["最佳"]["precision"], 4),
+        "recall": round(checks["最佳"]["recall"], 4),
+        "f1": round(checks["最佳"]["f1"], 4),
+        "recordings": [os.path.basename(path) for path in args.recordings],
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    print(f"已寫入 {THRESHOLDS_PATH}（重新啟動 app.py / server.py 後生效）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+感測器幀的二進位格式：固定排列的 little-endian 數值，取代 JSON 的長鍵名
+
+    encoder = WireEncoder(["pitch", "yaw", "hit"], hands=("right", "left"))
+    payload = encoder.encode_frame(frame, drum_names)     # frame = {"right": get_hand_data(...), ...}
+
+訊息格式（所有數值皆為 little-endian）：
+
+    標頭（8 bytes）:
+        uint8  magic = 0x44 ("D")
+        uint8  version = 2
+        uint8  kind：1 = 幀，2 = 敲擊事件
+        uint8  layout：鼓名稱表的識別碼（crc32 低 8 位元），與 /wire_format 不同時應重新取得
+        uint32 欄位遮罩（FIELDS 的第 i 個欄位 = 第 i 位元）
+    幀（kind 1）：依 hands 順序，每隻手依 FIELDS 順序寫入遮罩中的欄位
+    敲擊事件（kind 2）：uint32 seq, uint8 hand, uint8 drum, float32 velocity,
+                       uint64 timestamp（monotonic 奈秒）, uint32 latency（微秒）
+
+drum 以 /wire_format 回傳的鼓名稱表索引表示（255 = 沒有打到鼓）；
+t 與敲擊的 timestamp 為讀取當下的 time.monotonic_ns()。
+串流（/stream.bin）中每則訊息前加上 uint16 長度，瀏覽器端解碼器見 static/js/wire_format.js。
+
+用法：
+    python wire_format.py        # JSON 與二進位的大小與編碼時間比較
+"""
+import json
+import struct
+import time
+import zlib
+
+MAGIC = 0x44
+VERSION = 2
+KIND_FRAME = 1
+KIND_HIT = 2
+NO_DRUM = 255
+
+HEADER = struct.Struct("<BBBBI")
+HIT = struct.Struct("<IBBfQI")
+LENGTH = struct.Struct("<H")
+
+# (短鍵名, get_hand_data 的鍵名, struct 格式)；順序即為位元順序與寫入順序，只能在尾端新增
+FIELDS = (
+    ("roll", "roll (x軸轉)", "f"),
+    ("pitch", "pitch (y軸轉)", "f"),
+    ("yaw", "yaw (z軸轉)", "f"),
+    ("ax", "ax", "f"),
+    ("ay", "ay", "f"),
+    ("az", "az", "f"),
+    ("gx", "gx", "f"),
+    ("gy", "gy", "f"),
+    ("gz", "gz", "f"),
+    ("apitch", "adjusted_pitch", "f"),
+    ("hit", "is_hit", "B"),
+    ("drum", "hit_drum", "B"),
+    ("t", "timestamp", "Q"),
+)
+FIELD_NAMES = tuple(name for name, _, _ in FIELDS)
+
+
+def parse_fields(spec):
+    """
+    "pitch,yaw,hit" → 欄位名稱 tuple（依 FIELDS 順序）；None 或空字串為全部欄位
+
+    未知欄位拋出 ValueError
+    """
+    if not spec:
+        return FIELD_NAMES
+    requested = {name.strip() for name in spec.split(",") if name.strip()}
+    unknown = requested - set(FIELD_NAMES)
+    if unknown:
+        raise ValueError(f"未知的欄位: {', '.join(sorted(unknown))}（可用: {', '.join(FIELD_NAMES)}）")
+    return tuple(name for name in FIELD_NAMES if name in requested)
+
+
+def layout_id(drum_names):
+    """鼓名稱表的識別碼（寫在標頭，解碼端用來確認名稱表是否過期）"""
+    return zlib.crc32("\n".join(drum_names).encode("utf-8")) & 0xFF
+
+
+def describe(drum_names, hands):
+    """/wire_format 的內容：解碼端依此解析訊息"""
+    return {
+        "version": VERSION,
+        "hands": list(hands),
+        "fields": [{"name": name, "key": key, "type": code} for name, key, code in FIELDS],
+        "drums": list(drum_names),
+        "layout": layout_id(drum_names),
+    }
+
+
+class WireEncoder:
+    """
+    指定欄位組合的編碼器：struct 只編譯一次，每幀只需一次 pack
+
+    參數說明：
+    - fields: 欄位名稱（parse_fields 的結果）
+    - hands: 幀中的手（順序即寫入順序）
+    """
+
+    def __init__(self, fields=FIELD_NAMES, hands=("right", "left")):
+        self.hands = tuple(hands)
+        selected = [field for field in FIELDS if field[0] in fields]
+        self.mask = sum(1 << FIELD_NAMES.index(name) for name, _, _ in selected)
+        self._keys = tuple(key for _, key, _ in selected)
+        self._drum_slot = next((i for i, (name, _, _) in enumerate(selected) if name == "drum"), None)
+        self._hit_slot = next((i for i, (name, _, _) in enumerate(selected) if name == "hit"), None)
+        self._struct = struct.Struct("<" + "".join(code for _, _, code in selected) * len(self.hands))
+        self.frame_size = HEADER.size + self._struct.size
+        self._drum_names = None
+        self._drum_index = {}
+        self._layout = 0
+
+    def _set_drums(self, drum_names):
+        if drum_names is not self._drum_names:
+            self._drum_names = drum_names
+            self._drum_index = {name: i for i, name in enumerate(drum_names)}
+            self._layout = layout_id(drum_names)
+
+    def encode_frame(self, frame, drum_names):
+        """
+        參數說明：
+        - frame: {手: get_hand_data() 的 dict}
+        - drum_names: 目前的鼓名稱表（tuple/list，同一物件會沿用快取的索引）
+        """
+        self._set_drums(drum_names)
+        values = []
+        for hand in self.hands:
+            data = frame[hand]
+            row = [data[key] for key in self._keys]
+            if self._drum_slot is not None:
+                row[self._drum_slot] = self._drum_index.get(row[self._drum_slot], NO_DRUM)
+            if self._hit_slot is not None:
+                row[self._hit_slot] = 1 if row[self._hit_slot] else 0
+            values.extend(row)
+        return HEADER.pack(MAGIC, VERSION, KIND_FRAME, self._layout, self.mask) + self._struct.pack(*values)
+
+    def encode_hit(self, event, drum_names):
+        """HitDetector 的事件 dict → 敲擊訊息"""
+        self._set_drums(drum_names)
+        hand = self.hands.index(event["hand"]) if event["hand"] in self.hands else NO_DRUM
+        return (HEADER.pack(MAGIC, VERSION, KIND_HIT, self._layout, 0)
+                + HIT.pack(event["seq"], hand, self._drum_index.get(event["drum"], NO_DRUM),
+                           event["velocity"], event["timestamp"],
+                           min(0xFFFFFFFF, max(0, (event.get("latency_ns") or 0) // 1000))))
+
+
+def frame_message(payload):
+    """串流用：加上 uint16 長度前綴"""
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode(payload, drum_names, hands=("right", "left")):
+    """
+    Python 端的解碼器（與 wire_format.js 相同的規則，供測試與工具使用）
+
+    返回：
+    幀為 {"kind": "frame", 手: {get_hand_data 的鍵名: 值}}；敲擊為 {"kind": "hit", ...事件欄位}
+    """
+    magic, version, kind, _, mask = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("不是 drum wire 格式的訊息")
+    if kind == KIND_HIT:
+        seq, hand, drum, velocity, timestamp, latency_us = HIT.unpack_from(payload, HEADER.size)
+        return {"kind": "hit", "seq": seq, "hand": hands[hand] if hand < len(hands) else None,
+                "drum": drum_names[drum] if drum < len(drum_names) else None,
+                "velocity": velocity, "timestamp": timestamp, "latency_ns": latency_us * 1000}
+
+    selected = [field for i, field in enumerate(FIELDS) if mask >> i & 1]
+    body = struct.Struct("<" + "".join(code for _, _, code in selected) * len(hands))
+    values = body.unpack_from(payload, HEADER.size)
+    result = {"kind": "frame"}
+    for index, hand in enumerate(hands):
+        row = values[index * len(selected):(index + 1) * len(selected)]
+        data = {}
+        for (name, key, _), value in zip(selected, row):
+            if name == "drum":
+                value = drum_names[value] if value < len(drum_names) else None
+            elif name == "hit":
+                value = bool(value)
+            data[key] = value
+        result[hand] = data
+    return result
+
+
+def _example_frame():
+    hand = {"roll (x軸轉)": 12.3456, "pitch (y軸轉)": -45.678, "yaw (z軸轉)": 90.12,
+            "ax": 0.12, "ay": -0.34, "az": 9.81, "gx": 1.5, "gy": -80.2, "gz": 0.4,
+            "is_hit": False, "hit_drum": "Snare", "adjusted_pitch": -40.1, "timestamp": time.monotonic_ns()}
+    return {"right": hand, "left": dict(hand, hit_drum=None)}
+
+
+def main():
+    drums = ("Hihat", "Snare", "Tom1", "Tom2", "Ride", "Floor Tom", "Crash")
+    frame = _example_frame()
+    repeats = 20000
+
+    def measure(encode):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            payload = encode()
+        return payload, (time.perf_counter() - start) / repeats * 1e6
+
+    json_payload, json_us = measure(
+        lambda: ("data: " + json.dumps(frame, ensure_ascii=False) + "\n\n").encode("utf-8"))
+    print(f"{'格式':<28}{'bytes':>7}{'編碼 µs':>10}")
+    print(f"{'JSON（SSE）':<28}{len(json_payload):>7}{json_us:>10.2f}")
+    for spec in ("", "pitch,yaw,apitch,hit,drum", "pitch,yaw,hit"):
+        encoder = WireEncoder(parse_fields(spec))
+        payload, us = measure(lambda: frame_message(encoder.encode_frame(frame, drums)))
+        assert decode(payload[LENGTH.size:], drums)["right"].get("hit_drum", "Snare") == "Snare"
+        print(f"{'binary ' + (spec or '全部欄位'):<28}{len(payload):>7}{us:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()